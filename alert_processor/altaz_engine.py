@@ -0,0 +1,95 @@
+'''
+AltAz Engine Module
+
+Lightweight replacement of the astropy SkyCoord.transform_to(AltAz) chain for
+fixed RA/Dec (ICRS/J2000) positions. The precession, nutation and aberration
+terms hardly change during a night, so they are calculated once per site and
+night and combined into one rotation and one velocity vector. Altitudes and
+azimuths of any number of targets and times then only need the sidereal time
+and plain numpy trigonometry.
+
+The accuracy with respect to astropy (without refraction) is better than
+gAccuracy. Neglected are: UT1 - UTC (< 0.9 s, i.e. < 14 arcsec), polar motion,
+diurnal aberration, the frame bias and the nutation terms below 0.5 arcsec, as
+well as the change of the precomputed terms within a few days of the night.
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+
+from astropy import units as u
+
+from alert_processor import fast_ephemeris
+
+gAccuracy = 20 * u.arcsec
+gMaxEngines = 8
+
+# engines per site and night, filled on demand
+gEngines = OrderedDict()
+
+
+class AltAzEngine:
+    ''' RA/Dec to Alt/Az transformation for one site, with the precession, nutation
+        and aberration terms of the night starting at the local noon 'night_start' (mjd)
+
+        Main functions are:
+         * apparent_place(): RA/Dec of the true equator and equinox of date
+         * alt_az(): altitudes and azimuths of targets at any times
+    '''
+    def __init__(self, site, night_start):
+        self.night_start = night_start
+        self.lat = site.lat.to_value(u.deg)
+        self.lon = site.lon.to_value(u.deg)
+
+        t = fast_ephemeris.julian_centuries(night_start + 0.5)
+        delta_psi, delta_eps, true_eps = fast_ephemeris.nutation(t)
+        self.rotation = (fast_ephemeris.nutation_matrix(delta_psi, delta_eps, true_eps)
+                         @ fast_ephemeris.precession_matrix(t))
+        self.velocity = fast_ephemeris.earth_velocity(t)
+        # apparent - mean sidereal time
+        self.equation_of_equinoxes = delta_psi * np.cos(np.radians(true_eps))
+
+    def apparent_vectors(self, ras, decs):
+        ''' unit vectors (first axis x, y, z) of the apparent places of 'ras', 'decs' (deg) '''
+        vectors = fast_ephemeris.radec_to_vectors(ras, decs)
+        vectors = vectors + self.velocity.reshape((3,) + (1,) * (vectors.ndim - 1))
+        vectors = vectors / np.linalg.norm(vectors, axis=0)
+        return np.tensordot(self.rotation, vectors, axes=1)
+
+    def apparent_place(self, ras, decs):
+        ''' RA, Dec (deg) of the true equator and equinox of date of 'ras', 'decs' (deg) '''
+        vectors = self.apparent_vectors(ras, decs)
+        ras = np.mod(np.degrees(np.arctan2(vectors[1], vectors[0])), 360.)
+        decs = np.degrees(np.arcsin(np.clip(vectors[2], -1., 1.)))
+        return ras, decs
+
+    def alt_az(self, ras, decs, mjds):
+        ''' altitudes and azimuths (deg, north through east, no refraction) of the
+        positions 'ras', 'decs' (deg) at the UTC 'mjds'. Positions and times are broadcast. '''
+        vectors = self.apparent_vectors(np.asarray(ras, dtype=float), np.asarray(decs, dtype=float))
+        lst = fast_ephemeris.local_sidereal_time(mjds, self.lon) + self.equation_of_equinoxes
+        return fast_ephemeris.equatorial_to_horizontal(vectors, lst, self.lat)
+
+
+def get_engine(site, mjd):
+    ''' returns the engine of 'site' for the night (local noon to noon) containing 'mjd' '''
+    noon_offset = 0.5 - site.lon.to_value(u.deg) / 360.
+    night = int(np.floor(mjd - noon_offset))
+    key = (site.name, night)
+    engine = gEngines.get(key)
+    if engine is None:
+        engine = AltAzEngine(site, night + noon_offset)
+        gEngines[key] = engine
+        if len(gEngines) > gMaxEngines:
+            gEngines.popitem(last=False)
+    else:
+        gEngines.move_to_end(key)
+    return engine
+
+
+def source_alt_az(ras, decs, mjds, site):
+    ''' altitudes and azimuths (deg) of the positions 'ras', 'decs' (Quantities) at the
+    UTC 'mjds' at 'site', using the engine of the night of the first time '''
+    engine = get_engine(site, float(np.min(mjds)))
+    return engine.alt_az(ras.to_value(u.deg), decs.to_value(u.deg), mjds)
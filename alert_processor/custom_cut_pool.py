@@ -0,0 +1,225 @@
+'''
+Custom Cut Pool Module
+
+Custom cuts are written by PIs and may be slow or hang. Instead of running them in
+the processing of the alert, they are sent to a pool of worker processes that are
+started in advance (with the IERS tables and all custom cut modules loaded):
+ * every custom cut has a deadline (seconds, from the science config or
+   gCustomCutDeadline). When it passes, the cut fails and its worker process is
+   terminated and replaced by a new one.
+ * the custom cuts of an evaluation stage run concurrently on different workers
+ * changes a cut makes to the custom observation coordinates of the alert are sent
+   back, other changes to the alert or science config in the worker are lost
+
+The pool belongs to the process that started it. A process forked from it (e.g. a
+worker of the site pool) starts a pool of its own with the same settings.
+'''
+
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import time as timer
+
+from alert_processor import custom_cut_registry
+from alert_processor import warm_up
+
+# deadline of custom cuts without a deadline in the science config (seconds)
+gCustomCutDeadline = 10.
+gDefaultWorkers = 2
+
+# (n_workers, iers_path, leap_second_path) of the pool, see configure()
+gPoolSettings = None
+gCustomCutPool = None
+
+
+def worker_loop(connection, iers_path, leap_second_path):
+    ''' main function of a worker process: runs the custom cuts it receives until it
+    gets None. Sends back (status, value or error message, custom coordinates, alert
+    parameter reads). '''
+    warm_up.configure_iers(iers_path, leap_second_path)
+    custom_cut_registry.load_custom_cuts()
+    connection.send(("ready", None, None, None))
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        origin, name, sci_alert, sci_case, obs_window = task
+        coordinates = sci_alert.custom_observation_coordinates
+        # only the parameter reads of this cut are sent back
+        sci_alert.parameter_index().reads.clear()
+        try:
+            function = custom_cut_registry.get_custom_cut(origin, name).function
+            value = function(sci_alert, sci_case, obs_window)
+        except Exception as excep:
+            connection.send(("error", str(excep), None, sci_alert.parameters.reads))
+            continue
+
+        changed_coordinates = None
+        if sci_alert.custom_observation_coordinates is not coordinates:
+            changed_coordinates = sci_alert.custom_observation_coordinates
+        connection.send(("ok", value, changed_coordinates, sci_alert.parameters.reads))
+
+
+class CustomCutWorker:
+    ''' a worker process and the connection to it '''
+    def __init__(self, iers_path=None, leap_second_path=None):
+        self.iers_path = iers_path
+        self.leap_second_path = leap_second_path
+        self.process = None
+        self.connection = None
+        # True until the worker process has reported that it is ready
+        self.starting = False
+        self.start()
+
+    def start(self):
+        ''' starts the worker process '''
+        self.starting = True
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_loop, daemon=True,
+                                               args=(worker_connection, self.iers_path,
+                                                     self.leap_second_path))
+        self.process.start()
+        worker_connection.close()
+
+    def wait_ready(self):
+        ''' waits until the worker process has set up the IERS tables and custom cuts '''
+        if self.starting:
+            self.connection.recv()
+            self.starting = False
+
+    def send(self, task):
+        ''' sends a custom cut to the worker process, the deadline starts afterwards '''
+        self.wait_ready()
+        self.connection.send(task)
+
+    def recycle(self):
+        ''' terminates the worker process (e.g. with a hanging cut) and starts a new one '''
+        self.process.terminate()
+        self.process.join(1.)
+        self.connection.close()
+        self.start()
+
+    def stop(self):
+        ''' asks the worker process to finish '''
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(1.)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class CustomCutResult:
+    ''' result of a custom cut from the pool: status "ok", "error" or "timeout",
+    the value (the error message for errors), changed custom coordinates, the reads of
+    alert parameters and the run time '''
+    def __init__(self, status, value=None, coordinates=None, parameter_reads=None, run_time=0.):
+        self.status = status
+        self.value = value
+        self.coordinates = coordinates
+        self.parameter_reads = parameter_reads
+        self.run_time = run_time
+
+
+class CustomCutPool:
+    ''' pool of worker processes for the custom cuts.
+
+        Main functions are:
+         * run(): runs custom cuts concurrently, each within its deadline
+         * shutdown(): stops the worker processes
+    '''
+    def __init__(self, n_workers, iers_path=None, leap_second_path=None):
+        self.pid = os.getpid()
+        self.settings = (n_workers, iers_path, leap_second_path)
+        self.workers = [CustomCutWorker(iers_path, leap_second_path) for _ in range(n_workers)]
+        for worker in self.workers:
+            worker.wait_ready()
+
+        self.runs = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.run_time = 0.
+
+    def __str__(self):
+        out = "{: <30} : {}\n".format("  * Custom cut workers", len(self.workers))
+        out += "{: <30} : {}, {}, {}\n".format("  * Runs, errors, timeouts", self.runs, self.errors,
+                                               self.timeouts)
+        out += "{: <30} : {:.2f} s\n".format("  * Custom cut run time", self.run_time)
+        return out
+
+    def run(self, tasks, sci_alert, sci_case, obs_window):
+        ''' runs the custom cuts 'tasks' (list of (module name, cut name, deadline in
+        seconds)) for the alert, science config and window on the free workers.
+        Returns one CustomCutResult per task. '''
+        results = [None] * len(tasks)
+        pending = list(range(len(tasks)))
+        idle = list(self.workers)
+        # connection -> (task index, worker, start time)
+        running = {}
+
+        while pending or running:
+            while pending and idle:
+                index = pending.pop(0)
+                worker = idle.pop(0)
+                origin, name, _ = tasks[index]
+                worker.send((origin, name, sci_alert, sci_case, obs_window))
+                running[worker.connection] = (index, worker, timer.perf_counter())
+
+            now = timer.perf_counter()
+            timeout = min(start + tasks[index][2] for index, _, start in running.values()) - now
+            for connection in wait(list(running.keys()), max(timeout, 0.)):
+                index, worker, start = running.pop(connection)
+                try:
+                    status, value, coordinates, reads = connection.recv()
+                except EOFError:
+                    # the worker died during the cut
+                    status, value, coordinates, reads = "error", "worker process ended", None, None
+                    worker.recycle()
+                results[index] = CustomCutResult(status, value, coordinates, reads,
+                                                 timer.perf_counter() - start)
+                idle.append(worker)
+
+            now = timer.perf_counter()
+            for connection, (index, worker, start) in list(running.items()):
+                if now - start >= tasks[index][2]:
+                    del running[connection]
+                    worker.recycle()
+                    results[index] = CustomCutResult("timeout", run_time=now - start)
+                    idle.append(worker)
+
+        for result in results:
+            self.runs += 1
+            self.run_time += result.run_time
+            self.errors += result.status == "error"
+            self.timeouts += result.status == "timeout"
+        return results
+
+    def shutdown(self):
+        ''' stops all worker processes '''
+        for worker in self.workers:
+            worker.stop()
+
+
+def configure(n_workers=gDefaultWorkers, iers_path=None, leap_second_path=None):
+    ''' sets the number of worker processes (0 runs the custom cuts in the processing
+    of the alert) and the IERS tables of the workers '''
+    global gPoolSettings
+    gPoolSettings = (n_workers, iers_path, leap_second_path)
+
+
+def get_pool():
+    ''' returns the custom cut pool of this process, starting it on first use.
+    None if no pool is configured. '''
+    global gCustomCutPool
+    if gPoolSettings is None or not gPoolSettings[0]:
+        return None
+
+    if gCustomCutPool is not None and gCustomCutPool.pid == os.getpid():
+        if gCustomCutPool.settings == gPoolSettings:
+            return gCustomCutPool
+        gCustomCutPool.shutdown()
+
+    # a pool inherited from the parent process is left to the parent
+    gCustomCutPool = CustomCutPool(*gPoolSettings)
+    return gCustomCutPool
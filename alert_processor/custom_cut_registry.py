@@ -0,0 +1,95 @@
+'''
+Custom Cut Registry Module
+
+Custom cuts are supplied by PIs as modules in alert_processor/custom_cuts. A module
+registers each of its cuts with the custom_cut decorator:
+
+    @custom_cut("GRB_selection", needs_window=False)
+    def perform_grb_selection(sci_alert, sci_case, obs_window):
+        ...
+
+The cut "module_name.cut_name" of a science config then refers to the registered
+function. All custom cut modules are imported once (load_custom_cuts()), modules that
+fail to import are reported and their cuts are unknown. The cut plan of a science
+config holds the functions themselves, unknown cuts are rejected when the config is
+loaded.
+'''
+
+import importlib
+import inspect
+import pkgutil
+
+gCustomCutPackage = "alert_processor.custom_cuts"
+
+# (module name, cut name) -> CustomCutSpec of all registered custom cuts
+gRegistry = {}
+# module name -> exception of the custom cut modules that could not be imported
+gModuleErrors = {}
+gLoaded = False
+
+
+class CustomCutSpec:
+    ''' a registered custom cut: the function and its properties for the cut plan '''
+    def __init__(self, origin, name, function, needs_window=True, cost=None):
+        self.origin = origin
+        self.name = name
+        self.function = function
+        # False for cuts that only read the alert, they run before the window search
+        self.needs_window = needs_window
+        # declared evaluation cost in seconds, None for the default of the cuts module
+        self.cost = cost
+
+    def __str__(self):
+        return "%s.%s (%s)" % (self.origin, self.name, self.function.__name__)
+
+
+def custom_cut(name, needs_window=True, cost=None):
+    ''' decorator registering the function as the custom cut 'name' of its module.
+    The function is called with (sci_alert, sci_case, obs_window) and returns the
+    actual value of the cut. '''
+    def register(function):
+        try:
+            inspect.signature(function).bind(None, None, None)
+        except TypeError as excep:
+            raise TypeError("Custom cut %s: %s does not take (sci_alert, sci_case, obs_window)"
+                            % (name, function.__name__)) from excep
+
+        origin = function.__module__.rsplit(".", 1)[-1]
+        registered = gRegistry.get((origin, name))
+        if registered is not None and registered.function.__qualname__ != function.__qualname__:
+            raise ValueError("Custom cut %s.%s is registered twice" % (origin, name))
+
+        gRegistry[(origin, name)] = CustomCutSpec(origin, name, function, needs_window, cost)
+        return function
+
+    return register
+
+
+def load_custom_cuts():
+    ''' imports all custom cut modules once. Modules that can not be imported are
+    reported and kept in gModuleErrors. '''
+    global gLoaded
+    if gLoaded:
+        return
+    gLoaded = True
+
+    package = importlib.import_module(gCustomCutPackage)
+    for module_info in pkgutil.iter_modules(package.__path__):
+        try:
+            importlib.import_module(gCustomCutPackage + "." + module_info.name)
+        except Exception as excep:
+            print("WARNING: Custom cut module %s could not be loaded: " % module_info.name, excep)
+            gModuleErrors[module_info.name] = excep
+
+
+def get_custom_cut(origin, name):
+    ''' the CustomCutSpec of the cut 'name' of the module 'origin'.
+    Raises a ValueError for unknown cuts. '''
+    load_custom_cuts()
+    spec = gRegistry.get((origin, name))
+    if spec is None:
+        reason = ""
+        if origin in gModuleErrors:
+            reason = " (module could not be loaded: %s)" % gModuleErrors[origin]
+        raise ValueError("Unknown custom cut %s.%s%s" % (origin, name, reason))
+    return spec
@@ -1,64 +1,45 @@
-from enum import Enum
-import voeventparse
-
 from astropy import units as u
 from astropy.coordinates import SkyCoord
 
 from datetime import timedelta
-import alert_processor as ap
-
-
-class custom_cuts_list(Enum):
-    GRB_selection = "GRB_selection"
-    Swift_counts = "Swift_counts"
-    Custom_wobble = "Custom_coords"
-
-
-def do_custom_cut(cut_id, sci_alert, sci_case, obs_window):
-    if cut_id == custom_cuts_list.GRB_selection.value:
-        alert_value = perform_grb_selection(sci_alert, sci_case, obs_window)
-        return alert_value
-
-    if cut_id == custom_cuts_list.Swift_counts.value:
-        alert_value = get_swift_counts(sci_alert, sci_case, obs_window)
-        return alert_value
-
-    if cut_id == custom_cuts_list.Custom_wobble.value:
-        alert_value = adjust_custom_coords(sci_alert, sci_case, obs_window)
-        return alert_value
+import numpy as np
+from alert_processor import processing_manager
+from alert_processor.custom_cut_registry import custom_cut
 
 
+@custom_cut("GRB_selection", needs_window=False)
 def perform_grb_selection(sci_alert, sci_case, obs_window):
-    voevent = sci_alert.alert
-    grouped_params = voeventparse.get_grouped_params(voevent)
-    grb_identified = grouped_params['Solution_Status']['GRB_Identified']['value']
+    grb_identified = sci_alert.parameter("GRB_Identified", group="Solution_Status")
 
-    return (grb_identified == "true")
+    return (grb_identified is True)
 
 
+@custom_cut("Swift_counts", needs_window=False)
 def get_swift_counts(sci_alert, sci_case, obs_window):
-    voevent = sci_alert.alert
-    toplevel_params = voeventparse.get_toplevel_params(voevent)
-    counts = toplevel_params["Burst_Inten"]["value"]
-    return float(counts)
+    counts = sci_alert.parameter("Burst_Inten")
+    return counts
 
 
+# the custom coordinates need an observation window search of their own
+@custom_cut("Custom_coords", cost=0.5)
 def adjust_custom_coords(sci_alert, sci_case, obs_window):
     ra = sci_alert.coords.ra
     dec = sci_alert.coords.dec
 
     good_custom_coords = []
 
-    for i in range(0, 4):
-        custom_ra = (ra + i * 0.1) * u.deg
-        custom_dec = dec * u.deg
-        custom_time = sci_alert.alert_received_time + timedelta(minutes=30)
+    custom_ras = (ra + np.arange(4) * 0.1) * u.deg
+    custom_decs = np.full(4, dec) * u.deg
+    custom_time = sci_alert.alert_received_time + timedelta(minutes=30)
+
+    # search for observation windows with the new coordinates all at once
+    custom_windows = processing_manager.find_observation_windows(sci_alert, sci_case,
+                                                                 custom_ras, custom_decs,
+                                                                 custom_time, obs_window.site)
 
-        # search for observation window with the new coordinates
-        custom_window = ap.find_observation_window(sci_alert, sci_case,
-                                                   custom_ra=custom_ra,
-                                                   custom_dec=custom_dec,
-                                                   custom_time=custom_time)
+    for i, custom_window in enumerate(custom_windows):
+        custom_ra = custom_ras[i]
+        custom_dec = custom_decs[i]
 
         # check that the common cuts are still valid
         cut_collection = sci_case.cut_collection
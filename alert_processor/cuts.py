@@ -6,18 +6,42 @@ in CutCollections. Cuts are grouped in common and custom cuts.
 common cuts are available for any alert out of the box.
 custom cuts can be supplied by PIs if advanced processing is
 necessary.
+
+The cuts are evaluated in two stages: the cuts that do not need the observation
+window first, then the observation window is searched and the cuts on the window
+are applied. Within a stage the cheapest cuts run first (declared cost until a cut
+has been timed, then its mean run time) and the evaluation stops at the first
+failed cut, so that alerts failing a cheap cut never reach the window search.
+
+With a custom_cut_pool configured, the custom cuts of a stage run concurrently in
+its worker processes after the common cuts, each within its deadline (optional third
+value of the cut in the science config, e.g. [true, "==", "2 s"]).
+
+For tuning the thresholds of a config, CutCollection.evaluate_batch() evaluates all
+cuts for many (e.g. archived) alerts at once: the values of a cut are collected into
+a column in SI units and compared in one step, the result is a CutMatrix of the
+alerts x cuts.
 '''
 
 
+import copy
 from enum import Enum
+import operator
+import time as timer
 import astropy.units as u
 from astropy.units import Quantity
+import numpy as np
 from numpy import inf
 
-# import custom_cuts
-import importlib
 import voeventparse as vp
 
+from alert_processor import custom_cut_registry
+from alert_processor import custom_cut_pool
+
+# declared evaluation costs in seconds, used until a cut has been timed
+gCommonCutCost = 1e-4
+gCustomCutCost = 1e-2
+
 
 class Comparator(Enum):
     ''' comparing modes used to parse cuts from configs
@@ -43,6 +67,17 @@ class CutCollection:
         self.all_cut_data = all_cut_data
         self.common_cuts = []
         self.custom_cuts = []
+        # evaluation plan of the common cuts, compiled on registration
+        self.common_plan = []
+        self.custom_plan = []
+        # stages of all cuts: without and with the observation window
+        self.site_independent_plan = []
+        self.site_dependent_plan = []
+        # False: stop at the first failed cut, True: evaluate all cuts for the report
+        self.evaluate_all = False
+        # SharedResults of the predicate graph if the collection is part of one
+        self.shared_results = None
+        self.site_independent_passed = True
         self.register_cuts()
 
     def __str__(self):
@@ -73,43 +108,146 @@ class CutCollection:
             req = cust_cut[1][0]
             comp = cust_cut[1][1]
             origin = cust_cut[0].split(".")[0]
-            self.register_cut(Cut(name, req, comp, CutTypes.custom_cuts, origin))
+            a_cut = Cut(name, req, comp, CutTypes.custom_cuts, origin)
+            if len(cust_cut[1]) > 2:
+                a_cut.deadline = parse_deadline(cust_cut[1][2])
+            self.register_cut(a_cut)
 
     def register_cut(self, cut):
-        ''' actual registration into common or custom cut list '''
+        ''' actual registration into common or custom cut list.
+        The cuts are compiled into the evaluation plan. '''
         if cut.cut_type is CutTypes.common_cuts:
             self.common_cuts.append(cut)
+            compiled_cut = CompiledCut(cut)
+            self.common_plan.append(compiled_cut)
         if cut.cut_type is CutTypes.custom_cuts:
             self.custom_cuts.append(cut)
+            compiled_cut = CompiledCustomCut(cut)
+            self.custom_plan.append(compiled_cut)
+
+        if compiled_cut.site_dependent:
+            self.site_dependent_plan.append(compiled_cut)
+        else:
+            self.site_independent_plan.append(compiled_cut)
+
+    def take_results(self, cut_collection):
+        ''' takes over the cut results and measured cut costs of 'cut_collection', a copy
+        of this collection evaluated e.g. in the process pool of the sites '''
+        for a_cut, result in zip(self.common_cuts + self.custom_cuts,
+                                 cut_collection.common_cuts + cut_collection.custom_cuts):
+            a_cut.actual_value = result.actual_value
+            a_cut.performed = result.performed
+            a_cut.passed = result.passed
+        for planned_cut, measured in zip(self.common_plan + self.custom_plan,
+                                         cut_collection.common_plan + cut_collection.custom_plan):
+            planned_cut.n_runs = measured.n_runs
+            planned_cut.total_run_time = measured.total_run_time
+        self.site_independent_passed = cut_collection.site_independent_passed
 
     def execute(self, sci_alert, obs_window, sci_case):
         ''' execution of the cuts by applying the cuts with respect to
         the current science alert.
 
         looks up the correct cutstom cut module for custom cuts.'''
-        for a_cut in self.common_cuts:
-            a_cut.actual_value = determine_value(a_cut, sci_alert, obs_window)
-            a_cut.evaluate()
-            # print(cut)
-        for a_cut in self.custom_cuts:
-            custom_cut_module = importlib.import_module("alert_processor.custom_cuts." + a_cut.custom_origin)
-            print(custom_cut_module)
-            try:
-                a_cut.actual_value = custom_cut_module.do_custom_cut(a_cut.cut_name, sci_alert,
-                                                                     sci_case, obs_window)
-                a_cut.evaluate()
-                # print(cut)
-            except Exception as excep:
-                print("WARNING: Cut %s could not be executed: " % a_cut.cut_name, excep)
-                a_cut._set_failed()
-                # print(cut)
+        self.execute_site_independent_cuts(sci_alert, sci_case)
+        self.execute_site_dependent_cuts(sci_alert, obs_window, sci_case)
+
+    def execute_site_independent_cuts(self, sci_alert, sci_case):
+        ''' execution of the cuts that do not need the observation window, once for all
+        sites. The results of the previous alert are cleared first. Returns False if a cut
+        failed. '''
+        for a_cut in self.common_cuts + self.custom_cuts:
+            a_cut.reset()
+        self.site_independent_passed = self.execute_plan(self.site_independent_plan, sci_alert,
+                                                         None, sci_case)
+        return self.site_independent_passed
+
+    def needs_window(self):
+        ''' True if the observation window has to be searched: the cuts without window
+        passed or all cuts are evaluated '''
+        return self.site_independent_passed or self.evaluate_all
+
+    def execute_site_dependent_cuts(self, sci_alert, obs_window, sci_case):
+        ''' execution of the cuts that depend on the observation window at a site:
+        the common cuts on the window and the custom cuts using it. Returns False if a
+        cut failed. '''
+        return self.execute_plan(self.site_dependent_plan, sci_alert, obs_window, sci_case)
+
+    def execute_plan(self, plan, sci_alert, obs_window, sci_case):
+        ''' evaluates the compiled cuts of 'plan' from the cheapest to the most expensive
+        one. Stops at the first failed cut unless evaluate_all is set. With the custom cut
+        pool the custom cuts run concurrently after the common cuts. Returns False if a
+        cut failed. '''
+        pool = None
+        if any(compiled_cut.cut.cut_type is CutTypes.custom_cuts for compiled_cut in plan):
+            pool = custom_cut_pool.get_pool()
+
+        all_passed = True
+        pooled_cuts = []
+        for compiled_cut in sorted(plan, key=PlannedCut.cost):
+            if pool is not None and compiled_cut.cut.cut_type is CutTypes.custom_cuts:
+                pooled_cuts.append(compiled_cut)
+                continue
+            start = timer.perf_counter()
+            if compiled_cut.cut.cut_type is CutTypes.custom_cuts:
+                compiled_cut.evaluate(sci_alert, obs_window, sci_case)
+            else:
+                compiled_cut.evaluate(sci_alert, obs_window, sci_case, self.shared_results)
+            compiled_cut.record_run_time(timer.perf_counter() - start)
+            if not compiled_cut.cut.passed:
+                all_passed = False
+                if not self.evaluate_all:
+                    return False
+
+        if pooled_cuts:
+            tasks = [compiled_cut.task() for compiled_cut in pooled_cuts]
+            results = pool.run(tasks, sci_alert, sci_case, obs_window)
+            for compiled_cut, result in zip(pooled_cuts, results):
+                compiled_cut.evaluate_result(result, sci_alert)
+                compiled_cut.record_run_time(result.run_time)
+                if not compiled_cut.cut.passed:
+                    all_passed = False
+        return all_passed
+
+    def evaluate_batch(self, sci_alerts, obs_windows=None, sci_case=None):
+        ''' evaluates all cuts for the alerts 'sci_alerts' at once without changing the
+        state of the cuts. 'obs_windows' are the observation windows of the alerts at a
+        site, without them the cuts on the window are not performed. Custom cuts get
+        'sci_case' and run here, not in the custom cut pool. Returns the CutMatrix. '''
+        compiled_cuts = self.common_plan + self.custom_plan
+        matrix = CutMatrix([sci_alert.ivorn for sci_alert in sci_alerts],
+                           [compiled_cut.cut.full_name() for compiled_cut in compiled_cuts])
+
+        for index, compiled_cut in enumerate(compiled_cuts):
+            if compiled_cut.site_dependent and obs_windows is None:
+                continue
+            values = []
+            failed = np.zeros(len(sci_alerts), dtype=bool)
+            for row, sci_alert in enumerate(sci_alerts):
+                obs_window = None if obs_windows is None else obs_windows[row]
+                try:
+                    values.append(compiled_cut.batch_value(sci_alert, obs_window, sci_case))
+                except Exception as excep:
+                    print("WARNING: Cut %s could not be executed for %s: "
+                          % (compiled_cut.cut.cut_name, sci_alert.ivorn), excep)
+                    values.append(None)
+                    failed[row] = True
+
+            column = ColumnComparison(compiled_cut.cut)
+            matrix.values[:, index], matrix.passed[:, index], matrix.performed[:, index] = \
+                column.evaluate(values, failed)
+        return matrix
+
+    def execute_custom_cuts(self, sci_alert, obs_window, sci_case):
+        ''' execution of the custom cuts '''
+        for compiled_cut in self.site_independent_plan + self.site_dependent_plan:
+            if compiled_cut.cut.cut_type is CutTypes.custom_cuts:
+                compiled_cut.evaluate(sci_alert, obs_window, sci_case)
 
     def execute_common_cuts(self, sci_alert, obs_window, sci_case):
         ''' execution of common cuts '''
-        for a_cut in self.common_cuts:
-            a_cut.actual_value = determine_value(a_cut, sci_alert, obs_window)
-            a_cut.evaluate()
-            # print(cut)
+        for compiled_cut in self.common_plan:
+            compiled_cut.evaluate(sci_alert, obs_window, sci_case)
 
     def common_cuts_results(self):
         ''' convenience to access the bulk results of common cuts. '''
@@ -155,13 +293,18 @@ class CutCollection:
         return self.report_common_cuts() + self.report_custom_cuts()
 
 
-def determine_value(cut, sci_alert, obs_window):
-    ''' main function to determine the correct value depending on the cut name
-    with the help of the cut factory implementation. '''
+def common_cut_id(cut):
+    ''' the CommonCutsImpl of a common cut '''
     cut_id = cut.cut_name
     if "." in cut.cut_name:
         cut_id = cut.cut_name.split(".")[0]
-    common_cut = CommonCutsImpl(cut_id)
+    return CommonCutsImpl(cut_id)
+
+
+def determine_value(cut, sci_alert, obs_window):
+    ''' main function to determine the correct value depending on the cut name
+    with the help of the cut factory implementation. '''
+    common_cut = common_cut_id(cut)
     factory = cut_factory_switch(common_cut)
     cut_fact = CutFactory(factory, cut, sci_alert, obs_window)
     return cut_fact.cut_value
@@ -178,15 +321,13 @@ class CommonCutsImpl(Enum):
     position_uncertainty = 'position_uncertainty'
 
 
+# common cuts on the observation window, which depends on the site
+gSiteDependentCuts = [CommonCutsImpl.max_delay, CommonCutsImpl.min_delay]
+
+
 def cut_factory_switch(factory):
     ''' cut factory '''
-    switcher = {CommonCutsImpl.from_parameter: CutFromAlertParameter,
-                CommonCutsImpl.max_delay: CutMaxDelay,
-                CommonCutsImpl.min_delay: CutMinDelay,
-                CommonCutsImpl.currently_in_schedule: CutCurrentlyInSchedule,
-                CommonCutsImpl.position_changed: CutPositionChanged,
-                CommonCutsImpl.position_uncertainty: CutPositionUncertainty}
-    func = switcher.get(factory)
+    func = gCutFactories.get(factory)
     return func()
 
 
@@ -194,9 +335,7 @@ class CutFromAlertParameter:
     ''' apply a cut derived from a voevent parameter '''
     def determine_parameter(self, cut, sci_alert, obs_window):
         param = cut.cut_name.split(".")[1]
-        param_search = ".//Param[@name='%s']" % param
-        param_val = sci_alert.alert.find(param_search).attrib['value']
-        print(param, "---->", param_val, type(param_val))
+        param_val = sci_alert.parameter(param)
         return param_val
 
 
@@ -253,6 +392,314 @@ class CutFactory:
         self.cut_value = self.factory.determine_parameter(cut, sci_alert, obs_window)
 
 
+gCutFactories = {CommonCutsImpl.from_parameter: CutFromAlertParameter,
+                 CommonCutsImpl.max_delay: CutMaxDelay,
+                 CommonCutsImpl.min_delay: CutMinDelay,
+                 CommonCutsImpl.currently_in_schedule: CutCurrentlyInSchedule,
+                 CommonCutsImpl.position_changed: CutPositionChanged,
+                 CommonCutsImpl.position_uncertainty: CutPositionUncertainty}
+
+# comparison of the required with the actual value that passes the cut
+gComparisons = {Comparator.greater: operator.le,
+                Comparator.less: operator.ge,
+                Comparator.equal: operator.eq}
+
+
+class PlannedCut:
+    ''' evaluation cost of a cut in the plan: the declared cost until the cut has
+    been timed, then the mean run time '''
+    def __init__(self, declared_cost):
+        self.declared_cost = declared_cost
+        self.n_runs = 0
+        self.total_run_time = 0.
+
+    def cost(self):
+        ''' expected run time in seconds '''
+        if self.n_runs == 0:
+            return self.declared_cost
+        return self.total_run_time / self.n_runs
+
+    def record_run_time(self, run_time):
+        ''' adds a measured run time in seconds '''
+        self.n_runs += 1
+        self.total_run_time += run_time
+
+
+def threshold_key(required_value):
+    ''' hashable value of a required value, Quantities are converted to SI units. Other
+    values keep their type, as True, 1 and 1.0 are equal (and hash equally) in python. '''
+    if isinstance(required_value, Quantity):
+        si_value = required_value.si
+        return (float(si_value.value), si_value.unit.to_string())
+    return (required_value, type(required_value).__name__)
+
+
+class SharedResults(dict):
+    ''' results of the common cuts of one alert shared between the science configs:
+    (predicate key, observation window) -> (actual value, performed, passed). The first
+    config evaluating a predicate fills it, hits counts the reuses. '''
+    def __init__(self):
+        dict.__init__(self)
+        self.hits = 0
+
+    def clear(self):
+        dict.clear(self)
+        self.hits = 0
+
+
+class CompiledCut(PlannedCut):
+    ''' a common cut prepared for the evaluation of many alerts: the factory is resolved
+    and the required value and comparison are normalized once, when the science config
+    is loaded.
+
+    Actual values that are floats or Quantities in the unit of the required value are
+    compared directly as floats. Any other value (e.g. strings from alert parameters,
+    inf delays without window or other units) is evaluated with Cut.evaluate(), which
+    gives the same results. '''
+    def __init__(self, cut):
+        PlannedCut.__init__(self, gCommonCutCost)
+        self.cut = cut
+        self.compare = gComparisons[cut.comparator]
+        try:
+            self.cut_id = common_cut_id(cut)
+        except ValueError:
+            # unknown cuts only fail when they are evaluated, as without the plan
+            self.cut_id = None
+            self.site_dependent = False
+            self.determine_parameter = determine_value
+        else:
+            self.site_dependent = self.cut_id in gSiteDependentCuts
+            self.determine_parameter = gCutFactories[self.cut_id]().determine_parameter
+
+        # cuts with the same value, comparison and threshold are the same predicate
+        self.predicate_key = None
+        if self.cut_id is not None:
+            self.predicate_key = (cut.cut_name, cut.comparator, threshold_key(cut.required_value))
+
+        # the normalization Cut.evaluate() applies to the required value on every call
+        required = cut.required_value
+        if isinstance(required, int):
+            required = float(required)
+        self.unit = None
+        self.required = None
+        if isinstance(required, Quantity):
+            if required.unit == u.dimensionless_unscaled:
+                # dimensionless actual values are converted to floats by Cut.evaluate()
+                return
+            self.unit = required.unit
+            self.required = required.value
+        elif isinstance(required, float):
+            self.required = required
+
+    def evaluate(self, sci_alert, obs_window, sci_case=None, shared_results=None):
+        ''' determines the actual value of the cut for the alert and evaluates it. With
+        'shared_results' (SharedResults) the result of an equal cut is reused. '''
+        if shared_results is None or self.predicate_key is None:
+            self.evaluate_cut(sci_alert, obs_window)
+            return
+
+        cut = self.cut
+        key = (self.predicate_key, obs_window)
+        result = shared_results.get(key)
+        if result is None:
+            self.evaluate_cut(sci_alert, obs_window)
+            shared_results[key] = (cut.actual_value, cut.performed, cut.passed)
+        else:
+            cut.actual_value, cut.performed, cut.passed = result
+            shared_results.hits += 1
+
+    def batch_value(self, sci_alert, obs_window, sci_case=None):
+        ''' actual value of the cut for CutCollection.evaluate_batch() '''
+        if self.cut_id is CommonCutsImpl.from_parameter:
+            return sci_alert.parameter(self.cut.cut_name.split(".")[1])
+        return self.determine_parameter(self.cut, sci_alert, obs_window)
+
+    def evaluate_cut(self, sci_alert, obs_window):
+        ''' evaluation of the cut itself, see evaluate() '''
+        cut = self.cut
+        value = self.determine_parameter(cut, sci_alert, obs_window)
+        cut.actual_value = value
+
+        if self.unit is not None:
+            if isinstance(value, Quantity) and value.unit == self.unit and value.isscalar:
+                cut.passed = bool(self.compare(self.required, value.value))
+                cut.performed = True
+                return
+        elif (self.required is not None and isinstance(value, float)
+              and not isinstance(value, bool)):
+            cut.passed = bool(self.compare(self.required, value))
+            cut.performed = True
+            return
+
+        cut.evaluate()
+
+
+class CompiledCustomCut(PlannedCut):
+    ''' a custom cut prepared for the evaluation: the registered function is looked up
+    in the custom_cut_registry when the science config is loaded, unknown cuts raise a
+    ValueError. '''
+    def __init__(self, cut):
+        spec = custom_cut_registry.get_custom_cut(cut.custom_origin, cut.cut_name)
+        cost = spec.cost
+        if cost is None:
+            cost = gCustomCutCost
+        PlannedCut.__init__(self, cost)
+        self.cut = cut
+        self.site_dependent = spec.needs_window
+        self.function = spec.function
+        # seconds the cut may take in the custom cut pool
+        self.deadline = cut.deadline
+        if self.deadline is None:
+            self.deadline = custom_cut_pool.gCustomCutDeadline
+
+    def evaluate(self, sci_alert, obs_window, sci_case):
+        ''' runs the custom cut for the alert and evaluates it. Custom cuts get the
+        science config and can change the alert, their results are not shared. '''
+        cut = self.cut
+        try:
+            cut.actual_value = self.function(sci_alert, sci_case, obs_window)
+            cut.evaluate()
+        except Exception as excep:
+            print("WARNING: Cut %s could not be executed: " % cut.cut_name, excep)
+            cut.set_failed()
+
+    def batch_value(self, sci_alert, obs_window, sci_case=None):
+        ''' actual value of the cut for CutCollection.evaluate_batch() '''
+        return self.function(sci_alert, sci_case, obs_window)
+
+    def task(self):
+        ''' the cut for custom_cut_pool.CustomCutPool.run() '''
+        return (self.cut.custom_origin, self.cut.cut_name, self.deadline)
+
+    def evaluate_result(self, result, sci_alert):
+        ''' evaluates the cut with the custom_cut_pool.CustomCutResult of its run in the
+        pool and takes over the custom observation coordinates set and the alert
+        parameters read by the cut '''
+        cut = self.cut
+        if result.parameter_reads:
+            sci_alert.parameter_index().add_reads(result.parameter_reads)
+        if result.status == "timeout":
+            print("WARNING: Cut %s exceeded its deadline of %.1f s" % (cut.cut_name, self.deadline))
+            cut.set_failed()
+            return
+        if result.status != "ok":
+            print("WARNING: Cut %s could not be executed: " % cut.cut_name, result.value)
+            cut.set_failed()
+            return
+
+        if result.coordinates is not None:
+            sci_alert.custom_observation_coordinates = result.coordinates
+        try:
+            cut.actual_value = result.value
+            cut.evaluate()
+        except Exception as excep:
+            print("WARNING: Cut %s could not be executed: " % cut.cut_name, excep)
+            cut.set_failed()
+
+
+class ColumnComparison:
+    ''' evaluation of a cut for the values of many alerts (CutCollection.evaluate_batch()).
+
+    Numbers (for required floats) and Quantities convertible to the unit of the required
+    Quantity are collected into a float column in SI units and compared with the
+    required value in one step. Other values are evaluated one by one with
+    Cut.evaluate() on a copy of the cut, which gives the results of the evaluation of
+    single alerts. '''
+    def __init__(self, cut):
+        self.cut = cut
+        self.compare = gComparisons[cut.comparator]
+        self.unit = None
+        self.required = None
+        required = cut.required_value
+        if isinstance(required, Quantity):
+            if required.unit != u.dimensionless_unscaled:
+                si_required = required.si
+                self.unit = si_required.unit
+                self.required = float(si_required.value)
+        elif isinstance(required, (int, float)) and not isinstance(required, bool):
+            self.required = float(required)
+
+    def evaluate(self, values, failed):
+        ''' returns the column of 'values' (SI units, NaN if not a number) and the
+        passed and performed flags of the alerts. Alerts whose value could not be
+        determined ('failed') fail the cut. The type of each value is checked in one pass
+        over the list, the numbers are then collected with np.fromiter and the Quantities
+        are converted with one scale per unit. '''
+        n_values = len(values)
+        column = np.full(n_values, np.nan)
+        numeric = np.zeros(n_values, dtype=bool)
+        if self.required is not None:
+            usable = ~np.asarray(failed, dtype=bool)
+            if self.unit is None:
+                numeric = usable & np.fromiter(
+                    (isinstance(value, (int, float)) and not isinstance(value, bool)
+                     for value in values), dtype=bool, count=n_values)
+                rows = np.flatnonzero(numeric)
+                column[rows] = np.fromiter((values[row] for row in rows), dtype=float,
+                                           count=len(rows))
+            else:
+                # index of the unit of each scalar Quantity, -1 for other values
+                units = {}
+                unit_indices = np.fromiter(
+                    (units.setdefault(value.unit, len(units))
+                     if isinstance(value, Quantity) and value.isscalar else -1
+                     for value in values), dtype=int, count=n_values)
+                for unit, index in units.items():
+                    try:
+                        scale = unit.to(self.unit)
+                    except u.UnitConversionError:
+                        continue
+                    rows = np.flatnonzero(usable & (unit_indices == index))
+                    column[rows] = scale * np.fromiter((values[row].value for row in rows),
+                                                       dtype=float, count=len(rows))
+                    numeric[rows] = True
+
+        passed = np.zeros(n_values, dtype=bool)
+        passed[numeric] = self.compare(self.required, column[numeric])
+        performed = numeric | failed
+
+        for row in np.flatnonzero(~performed):
+            single_cut = copy.copy(self.cut)
+            single_cut.reset()
+            single_cut.actual_value = values[row]
+            try:
+                single_cut.evaluate()
+            except Exception:
+                single_cut.set_failed()
+            passed[row] = single_cut.passed
+            performed[row] = single_cut.performed
+            if isinstance(single_cut.actual_value, float):
+                column[row] = single_cut.actual_value
+        return column, passed, performed
+
+
+class CutMatrix:
+    ''' result of CutCollection.evaluate_batch(): alerts x cuts matrices of the values
+    (SI units, NaN if not a number), the performed and the passed cuts '''
+    def __init__(self, alerts, cut_names):
+        self.alerts = alerts
+        self.cut_names = cut_names
+        shape = (len(alerts), len(cut_names))
+        self.values = np.full(shape, np.nan)
+        self.performed = np.zeros(shape, dtype=bool)
+        self.passed = np.zeros(shape, dtype=bool)
+
+    def __str__(self):
+        out = "{: <30} : {}, {}\n".format("  * Alerts, cuts", len(self.alerts), len(self.cut_names))
+        for index, name in enumerate(self.cut_names):
+            out += "{: <30} : {}\n".format("  * " + name, int(self.passed[:, index].sum()))
+        out += "{: <30} : {}\n".format("  * Passed all cuts", int(self.result().sum()))
+        return out
+
+    def cut_passed(self, cut_name):
+        ''' passed flags of the cut 'cut_name' for all alerts '''
+        return self.passed[:, self.cut_names.index(cut_name)]
+
+    def result(self):
+        ''' alerts that passed all cuts, as CutCollection.result() for single alerts '''
+        return np.all(self.performed & self.passed, axis=1)
+
+
 def str2bool(in_val):
     is_true = in_val.lower() in ("yes", "true")
     is_false = in_val.lower() in ("no", "false")
@@ -304,6 +751,16 @@ def parse_value(in_val):
     return out_val
 
 
+def parse_deadline(in_val):
+    ''' deadline of a custom cut in seconds from the science config, e.g. "2 s" or 2 '''
+    value = parse_value(in_val)
+    if isinstance(value, Quantity):
+        return float(value.to_value(u.s))
+    if isinstance(value, float):
+        return value
+    raise ValueError("Deadline %s of a custom cut is not a time" % in_val)
+
+
 class Cut:
     ''' base class for cuts, holding the name, required value, comparison, type of cut and actual value '''
     def __init__(self, name, required_value, comp, cut_type, custom_origin=None, actual_value=None):
@@ -322,11 +779,30 @@ class Cut:
         self.comparator = Comparator(comp)
         self.custom_origin = custom_origin
         self.cut_type = cut_type
+        # seconds a custom cut may run in the custom cut pool, None for the default
+        self.deadline = None
 
         self.performed = False
         self.passed = False
         # self.evalulate()
 
+    def full_name(self):
+        ''' name of the cut in the science config, e.g. swift_grb_cuts.GRB_selection '''
+        if self.custom_origin:
+            return self.custom_origin + "." + self.cut_name
+        return self.cut_name
+
+    def reset(self):
+        ''' clears the result of a previous evaluation '''
+        self.actual_value = None
+        self.performed = False
+        self.passed = False
+
+    def set_failed(self):
+        ''' marks the cut as failed, e.g. if its value could not be determined '''
+        self.performed = True
+        self.passed = False
+
     def evaluate(self):
         ''' actual evaluation of a cut '''
         # print(self.cut_name, self.required_value, self.comparator, self.actual_value)
@@ -379,9 +855,7 @@ class Cut:
 
     def __str__(self):
         out = ""
-        name = self.cut_name
-        if self.custom_origin:
-            name = self.custom_origin + "." + self.cut_name
+        name = self.full_name()
         if self.actual_value and not self.performed:
             out = "   *  \'{}\' {} {}  -> actual value: {}".format(name, self.comparator.value,
                                                                    self.required_value,
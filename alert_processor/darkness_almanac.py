@@ -0,0 +1,155 @@
+'''
+Darkness Almanac Module
+
+The sun and moon conditions at a site are the same for every alert. The almanac
+holds them precomputed for a long period (by default one year) on a fine time
+grid, together with the resulting dark time intervals (sun below
+darkness_limits.gSunDown and moon below darkness_limits.gMoonDown).
+
+Both tables are stored as .npy files per site (see startup_scripts/build_darkness_almanac.py)
+and are opened memory-mapped and read-only, so that all worker processes share the
+same pages instead of recomputing the ephemerides. Queries only touch the part of
+the tables found by binary search.
+
+File layout:
+ * <site>_profiles.npy: float64 array of shape (5, n) with the rows
+   mjd (UTC), sun altitude (deg), moon altitude (deg), moon azimuth (deg), moon phase (percent)
+ * <site>_dark_intervals.npy: float64 array of shape (n, 2) of [start, end] mjds
+'''
+
+import os
+
+import numpy as np
+
+from astropy import units as u
+
+from alert_processor import fast_ephemeris
+from alert_processor import darkness_limits
+
+gAlmanacStep = 1. / 60. / 24.  # days
+gAlmanacDays = 366
+gChunkDays = 10
+
+# opened almanacs, keyed by the site name
+gAlmanacs = {}
+
+
+def file_names(site):
+    ''' names of the profile and dark interval files of 'site' '''
+    base = site.name.lower().replace(" ", "_")
+    return base + "_profiles.npy", base + "_dark_intervals.npy"
+
+
+def build_almanac(site, start_mjd, directory, n_days=gAlmanacDays, step=gAlmanacStep):
+    ''' calculates the profiles of 'site' for 'n_days' from 'start_mjd' (UTC) on a grid
+    of 'step' (days) and writes the almanac files to 'directory'.
+    Returns the paths of the profile and dark interval files. '''
+    profiles_name, intervals_name = file_names(site)
+    profiles_path = os.path.join(directory, profiles_name)
+    intervals_path = os.path.join(directory, intervals_name)
+
+    lat, lon, height = (site.lat.to_value(u.deg), site.lon.to_value(u.deg),
+                        site.height.to_value(u.m))
+    n_steps = int(round(n_days / step)) + 1
+    profiles = np.lib.format.open_memmap(profiles_path, mode='w+', dtype=np.float64,
+                                         shape=(5, n_steps))
+
+    # calculated in chunks to limit the memory needed for the moon series
+    chunk_size = int(round(gChunkDays / step))
+    for first in range(0, n_steps, chunk_size):
+        last = min(first + chunk_size, n_steps)
+        mjds = start_mjd + np.arange(first, last) * step
+        sun_alts, _ = fast_ephemeris.sun_alt_az(mjds, lat, lon)
+        moon_alts, moon_azs, moon_phases = fast_ephemeris.moon_alt_az_phase(mjds, lat, lon, height)
+        profiles[:, first:last] = [mjds, sun_alts, moon_alts, moon_azs, moon_phases]
+    profiles.flush()
+
+    dark = ((profiles[1] < darkness_limits.gSunDown.to_value(u.deg))
+            & (profiles[2] < darkness_limits.gMoonDown.to_value(u.deg)))
+    padded = np.concatenate([[False], dark, [False]])
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    intervals = np.column_stack([profiles[0][changes[0::2]], profiles[0][changes[1::2] - 1]])
+    np.save(intervals_path, intervals)
+
+    del profiles
+    return profiles_path, intervals_path
+
+
+class DarknessAlmanac:
+    ''' read-only, memory-mapped almanac of one site.
+
+        Main functions are:
+         * covers(): checks if a time range is part of the almanac
+         * profiles(): interpolated sun and moon profiles (like SiteEphemerisCache)
+         * dark_intervals(): dark time lookup (used by the visibility_prefilter)
+    '''
+    def __init__(self, profiles_path, intervals_path):
+        self.profiles_path = profiles_path
+        self.intervals_path = intervals_path
+        self.table = np.load(profiles_path, mmap_mode='r')
+        self.intervals = np.load(intervals_path, mmap_mode='r')
+
+        self.first_mjd = float(self.table[0, 0])
+        self.last_mjd = float(self.table[0, -1])
+
+    def __str__(self):
+        out = "{: <30} : {}\n".format("  * Almanac", self.profiles_path)
+        out += "{: <30} : {:.3f} - {:.3f}\n".format("  * Covered mjds", self.first_mjd,
+                                                    self.last_mjd)
+        out += "{: <30} : {}\n".format("  * Dark intervals", len(self.intervals))
+        return out
+
+    def covers(self, first_mjd, last_mjd):
+        ''' True if the range 'first_mjd' to 'last_mjd' is part of the almanac '''
+        return self.first_mjd <= first_mjd and last_mjd <= self.last_mjd
+
+    def profiles(self, mjds):
+        ''' returns the sun altitudes, moon altitudes, moon azimuths (deg)
+        and moon phases (percent) interpolated to the times 'mjds' '''
+        mjds = np.asarray(mjds, dtype=float)
+        grid = self.table[0]
+        first = max(np.searchsorted(grid, np.min(mjds), side='right') - 1, 0)
+        last = np.searchsorted(grid, np.max(mjds), side='left') + 1
+        table = np.array(self.table[:, first:last])
+
+        # interpolate the azimuth without the jumps at 360 deg
+        moon_azs = np.degrees(np.unwrap(np.radians(table[3])))
+
+        return (np.interp(mjds, table[0], table[1]),
+                np.interp(mjds, table[0], table[2]),
+                np.mod(np.interp(mjds, table[0], moon_azs), 360.),
+                np.interp(mjds, table[0], table[4]))
+
+    def dark_intervals(self, first_mjd, last_mjd):
+        ''' (n, 2) array of the dark [start, end] mjds overlapping 'first_mjd' to 'last_mjd' '''
+        first = np.searchsorted(self.intervals[:, 1], first_mjd, side='left')
+        last = np.searchsorted(self.intervals[:, 0], last_mjd, side='right')
+        return np.array(self.intervals[first:last])
+
+
+def open_almanac(site, directory):
+    ''' opens the almanac of 'site' in 'directory' if it exists and registers it.
+    Returns the almanac or None. '''
+    profiles_name, intervals_name = file_names(site)
+    profiles_path = os.path.join(directory, profiles_name)
+    intervals_path = os.path.join(directory, intervals_name)
+    if not (os.path.exists(profiles_path) and os.path.exists(intervals_path)):
+        print("No darkness almanac for %s in %s." % (site.name, directory))
+        return None
+
+    almanac = gAlmanacs.get(site.name)
+    if almanac is None or almanac.profiles_path != profiles_path:
+        almanac = DarknessAlmanac(profiles_path, intervals_path)
+        gAlmanacs[site.name] = almanac
+    return almanac
+
+
+def open_almanacs(directory, sites):
+    ''' opens the almanacs of all 'sites' in 'directory' '''
+    for site in sites:
+        open_almanac(site, directory)
+
+
+def get_almanac(site):
+    ''' returns the opened almanac of 'site' or None '''
+    return gAlmanacs.get(site.name)
@@ -0,0 +1,20 @@
+'''
+Darkness Limits Module
+
+The sun and moon altitudes below which the sky counts as dark. They are shared by
+the window search (observation_windows), the darkness almanac and the visibility
+prefilter, and are kept in this module so that none of them has to import another.
+
+Without sky quality limits in the science config the moon has to be down as well, and
+the dark time of a site is the same for every alert (see darkness_almanac).
+'''
+
+from astropy import units as u
+
+gSunDown = -18.0 * u.deg
+gMoonDown = -0.5 * u.deg
+
+
+def has_sky_quality_limits(min_nsb, max_nsb, illumination):
+    ''' True if any of the sky quality limits is set, otherwise only the moon has to be down '''
+    return min_nsb is not None or max_nsb is not None or illumination is not None
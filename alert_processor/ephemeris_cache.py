@@ -0,0 +1,165 @@
+'''
+Ephemeris Cache Module
+
+The sun and moon profiles needed for the observation window search only depend
+on the site and the time, not on the target. They are therefore calculated once
+per site and night on a fixed time grid and kept in a cache, from which every
+ObservationWindow interpolates the values for its own time grid.
+
+A night is defined from local (mean solar) noon to the following local noon,
+so that no dark period is split between two nights. Nights that are over are
+evicted from the cache, the upcoming nights can be kept warm in advance.
+
+If a darkness almanac of the site has been opened (see darkness_almanac), the
+profiles are taken from it instead as long as the requested times are covered.
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+
+from astropy import units as u
+from astropy.time import Time
+
+from alert_processor import fast_ephemeris
+from alert_processor import darkness_almanac
+from alert_processor import time_model
+
+gCacheStep = 2. / 60. / 24.  # days
+gNightsAhead = 2
+gMaxNights = 10
+
+# one cache per site, filled on demand
+gSiteCaches = {}
+
+
+class NightlyEphemeris:
+    ''' sun and moon profiles of a single night at a site on a fixed time grid '''
+    def __init__(self, site, night_start, step):
+        ''' calculates the profiles from the local noon at 'night_start' (mjd)
+        until the next local noon. The grid includes both noons. '''
+        self.night_start = night_start
+        self.night_end = night_start + 1.
+        n_steps = int(round(1. / step)) + 1
+        self.mjds = np.linspace(self.night_start, self.night_end, n_steps)
+
+        from astropy.coordinates import AltAz, get_sun
+        times = Time(self.mjds, format='mjd', scale='utc')
+        altaz_frame = AltAz(obstime=times, location=site.location)
+        self.sun_alts = get_sun(times).transform_to(altaz_frame).alt.to_value(u.deg)
+
+        lat, lon = site.lat.to_value(u.deg), site.lon.to_value(u.deg)
+        height = site.height.to_value(u.m)
+        moon_profiles = fast_ephemeris.moon_alt_az_phase(self.mjds, lat, lon, height)
+        self.moon_alts, self.moon_azs, self.moon_phases = moon_profiles
+
+
+class SiteEphemerisCache:
+    ''' cache of the nightly sun and moon profiles of one site.
+
+        Main functions are:
+         * profiles(): interpolated sun and moon profiles for arbitrary times
+         * keep_warm(): calculation of the upcoming nights in advance
+         * evict_past_nights(): removal of nights that are over
+    '''
+    def __init__(self, site, step=gCacheStep, max_nights=gMaxNights):
+        self.site = site
+        self.step = step
+        self.max_nights = max_nights
+        # offset of the local noon with respect to 0h UTC in days
+        self.noon_offset = 0.5 - site.lon.to_value(u.deg) / 360.
+        self.nights = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.almanac_hits = 0
+
+    def __str__(self):
+        out = "{: <30} : {}\n".format("  * Ephemeris cache site", self.site.name)
+        out += "{: <30} : {}\n".format("  * Cached nights", len(self.nights))
+        out += "{: <30} : {}, {}\n".format("  * Hits, misses", self.hits, self.misses)
+        out += "{: <30} : {}\n".format("  * Almanac hits", self.almanac_hits)
+        return out
+
+    def night_index(self, mjds):
+        ''' index of the night(s) containing the times 'mjds' '''
+        return np.floor(np.asarray(mjds) - self.noon_offset).astype(int)
+
+    def get_night(self, index):
+        ''' returns the profiles of night 'index', calculating them if needed '''
+        night = self.nights.get(index)
+        if night is None:
+            self.misses += 1
+            night = NightlyEphemeris(self.site, index + self.noon_offset, self.step)
+            self.nights[index] = night
+            if len(self.nights) > self.max_nights:
+                self.nights.popitem(last=False)
+        else:
+            self.hits += 1
+            self.nights.move_to_end(index)
+
+        return night
+
+    def profiles(self, mjds):
+        ''' returns the sun altitudes, moon altitudes, moon azimuths (deg)
+        and moon phases (percent) interpolated to the times 'mjds' '''
+        mjds = np.asarray(mjds, dtype=float)
+        almanac = darkness_almanac.get_almanac(self.site)
+        if almanac is not None and almanac.covers(np.min(mjds), np.max(mjds)):
+            self.almanac_hits += 1
+            return almanac.profiles(mjds)
+
+        first, last = self.night_index([np.min(mjds), np.max(mjds)])
+        nights = [self.get_night(index) for index in range(first, last + 1)]
+
+        grid = np.concatenate([night.mjds for night in nights])
+        sun_alts = np.concatenate([night.sun_alts for night in nights])
+        moon_alts = np.concatenate([night.moon_alts for night in nights])
+        moon_azs = np.concatenate([night.moon_azs for night in nights])
+        moon_phases = np.concatenate([night.moon_phases for night in nights])
+
+        # interpolate the azimuth without the jumps at 360 deg
+        moon_azs = np.degrees(np.unwrap(np.radians(moon_azs)))
+
+        return (np.interp(mjds, grid, sun_alts),
+                np.interp(mjds, grid, moon_alts),
+                np.mod(np.interp(mjds, grid, moon_azs), 360.),
+                np.interp(mjds, grid, moon_phases))
+
+    def keep_warm(self, mjd, nights_ahead=gNightsAhead):
+        ''' makes sure the night of 'mjd' and the following nights are cached
+        (nothing to do if they are covered by an almanac) '''
+        almanac = darkness_almanac.get_almanac(self.site)
+        if almanac is not None and almanac.covers(mjd - 1., mjd + nights_ahead + 1.):
+            return
+
+        first = int(self.night_index(mjd))
+        for index in range(first, first + nights_ahead + 1):
+            if index not in self.nights:
+                self.get_night(index)
+
+    def evict_past_nights(self, mjd):
+        ''' removes all nights that ended more than one night before 'mjd'.
+        The previous night is kept as window searches start before the event time. '''
+        first_kept = int(self.night_index(mjd)) - 1
+        for index in list(self.nights):
+            if index < first_kept:
+                del self.nights[index]
+
+
+def get_site_cache(site):
+    ''' returns the ephemeris cache of 'site', creating it on first use '''
+    cache = gSiteCaches.get(site.name)
+    if cache is None:
+        cache = SiteEphemerisCache(site)
+        gSiteCaches[site.name] = cache
+    return cache
+
+
+def keep_warm(site, time, nights_ahead=gNightsAhead):
+    ''' evicts the nights of 'site' that are over at 'time' and
+    calculates the upcoming ones '''
+    cache = get_site_cache(site)
+    mjd = time_model.to_mjd(time)
+    cache.evict_past_nights(mjd)
+    cache.keep_warm(mjd, nights_ahead)
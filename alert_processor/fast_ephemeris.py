@@ -0,0 +1,404 @@
+'''
+Fast Ephemeris Module
+
+Low precision, fully vectorized ephemerides implemented with plain numpy.
+All functions take arrays of times given as UTC modified julian dates (MJD)
+and return arrays, so that whole time grids of an observation window search
+are handled in a single call instead of looping over the individual times.
+
+The moon is calculated from the main terms of the ELP-2000/82 theory and
+the sun from the low precision solar coordinates (both as given in
+J. Meeus, Astronomical Algorithms, chapters 25 and 47). The accuracy is a few
+arcseconds for the sun and ~10 arcseconds for the moon, which is well below
+what is needed for observability decisions.
+
+No astropy is needed here. Angles are handled in degrees and
+positions in km unless noted otherwise.
+'''
+
+import numpy as np
+
+# TT - UTC in days (32.184 s + 37 leap seconds since 2017)
+gTTminusUTC = 69.184 / 86400.
+gMJDJ2000 = 51544.5
+gEarthRadius = 6378.137  # km, WGS84
+gEarthFlattening = 1. / 298.257223563
+gAstronomicalUnit = 149597870.7  # km
+
+# periodic terms for the moon's longitude and distance
+# (multiples of D, M, M', F, coefficient of sin for l in 1e-6 deg, coefficient of cos for r in m)
+gMoonLonDistTerms = np.array([
+    [0, 0, 1, 0, 6288774, -20905355],
+    [2, 0, -1, 0, 1274027, -3699111],
+    [2, 0, 0, 0, 658314, -2955968],
+    [0, 0, 2, 0, 213618, -569925],
+    [0, 1, 0, 0, -185116, 48888],
+    [0, 0, 0, 2, -114332, -3149],
+    [2, 0, -2, 0, 58793, 246158],
+    [2, -1, -1, 0, 57066, -152138],
+    [2, 0, 1, 0, 53322, -170733],
+    [2, -1, 0, 0, 45758, -204586],
+    [0, 1, -1, 0, -40923, -129620],
+    [1, 0, 0, 0, -34720, 108743],
+    [0, 1, 1, 0, -30383, 104755],
+    [2, 0, 0, -2, 15327, 10321],
+    [0, 0, 1, 2, -12528, 0],
+    [0, 0, 1, -2, 10980, 79661],
+    [4, 0, -1, 0, 10675, -34782],
+    [0, 0, 3, 0, 10034, -23210],
+    [4, 0, -2, 0, 8548, -21636],
+    [2, 1, -1, 0, -7888, 24208],
+    [2, 1, 0, 0, -6766, 30824],
+    [1, 0, -1, 0, -5163, -8379],
+    [1, 1, 0, 0, 4987, -16675],
+    [2, -1, 1, 0, 4036, -12831],
+    [2, 0, 2, 0, 3994, -10445],
+    [4, 0, 0, 0, 3861, -11650],
+    [2, 0, -3, 0, 3665, 14403],
+    [0, 1, -2, 0, -2689, -7003],
+    [2, 0, -1, 2, -2602, 0],
+    [2, -1, -2, 0, 2390, 10056],
+    [1, 0, 1, 0, -2348, 6322],
+    [2, -2, 0, 0, 2236, -9884],
+    [0, 1, 2, 0, -2120, 5751],
+    [0, 2, 0, 0, -2069, 0],
+    [2, -2, -1, 0, 2048, -4950],
+    [2, 0, 1, -2, -1773, 4130],
+    [2, 0, 0, 2, -1595, 0],
+    [4, -1, -1, 0, 1215, -3958],
+    [0, 0, 2, 2, -1110, 0],
+    [3, 0, -1, 0, -892, 3258],
+    [2, 1, 1, 0, -810, 2616],
+    [4, -1, -2, 0, 759, -1897],
+    [0, 2, -1, 0, -713, -2117],
+    [2, 2, -1, 0, -700, 2354],
+    [2, 1, -2, 0, 691, 0],
+    [2, -1, 0, -2, 596, 0],
+    [4, 0, 1, 0, 549, -1423],
+    [0, 0, 4, 0, 537, -1117],
+    [4, -1, 0, 0, 520, -1571],
+    [1, 0, -2, 0, -487, -1739],
+    [2, 1, 0, -2, -399, 0],
+    [0, 0, 2, -2, -381, -4421],
+    [1, 1, 1, 0, 351, 0],
+    [3, 0, -2, 0, -340, 0],
+    [4, 0, -3, 0, 330, 0],
+    [2, -1, 2, 0, 327, 0],
+    [0, 2, 1, 0, -323, 1165],
+    [1, 1, -1, 0, 299, 0],
+    [2, 0, 3, 0, 294, 0],
+    [2, 0, -1, -2, 0, 8752]], dtype=float)
+
+# periodic terms for the moon's latitude
+# (multiples of D, M, M', F, coefficient of sin for b in 1e-6 deg)
+gMoonLatTerms = np.array([
+    [0, 0, 0, 1, 5128122],
+    [0, 0, 1, 1, 280602],
+    [0, 0, 1, -1, 277693],
+    [2, 0, 0, -1, 173237],
+    [2, 0, -1, 1, 55413],
+    [2, 0, -1, -1, 46271],
+    [2, 0, 0, 1, 32573],
+    [0, 0, 2, 1, 17198],
+    [2, 0, 1, -1, 9266],
+    [0, 0, 2, -1, 8822],
+    [2, -1, 0, -1, 8216],
+    [2, 0, -2, -1, 4324],
+    [2, 0, 1, 1, 4200],
+    [2, 1, 0, -1, -3359],
+    [2, -1, -1, 1, 2463],
+    [2, -1, 0, 1, 2211],
+    [2, -1, -1, -1, 2065],
+    [0, 1, -1, -1, -1870],
+    [4, 0, -1, -1, 1828],
+    [0, 1, 0, 1, -1794],
+    [0, 0, 0, 3, -1749],
+    [0, 1, -1, 1, -1565],
+    [1, 0, 0, 1, -1491],
+    [0, 1, 1, 1, -1475],
+    [0, 1, 1, -1, -1410],
+    [0, 1, 0, -1, -1344],
+    [1, 0, 0, -1, -1335],
+    [0, 0, 3, 1, 1107],
+    [4, 0, 0, -1, 1021],
+    [4, 0, -1, 1, 833],
+    [0, 0, 1, -3, 777],
+    [4, 0, -2, 1, 671],
+    [2, 0, 0, -3, 607],
+    [2, 0, 2, -1, 596],
+    [2, -1, 1, -1, 491],
+    [2, 0, -2, 1, -451],
+    [0, 0, 3, -1, 439],
+    [2, 0, 2, 1, 422],
+    [2, 0, -3, -1, 421],
+    [2, 1, -1, 1, -366],
+    [2, 1, 0, 1, -351],
+    [4, 0, 0, 1, 331],
+    [2, -1, 1, 1, 315],
+    [2, -2, 0, -1, 302],
+    [0, 0, 1, 3, -283],
+    [2, 1, 1, -1, -229],
+    [1, 1, 0, -1, 223],
+    [1, 1, 0, 1, 223],
+    [0, 1, -2, -1, -220],
+    [2, 1, -1, -1, -220],
+    [1, 0, 1, 1, -185],
+    [2, -1, -2, -1, 181],
+    [0, 1, 2, 1, -177],
+    [4, -2, -1, -1, 176],
+    [4, -1, -1, -1, 166],
+    [1, 0, 1, -1, -164],
+    [4, 0, 1, -1, 132],
+    [1, 0, -1, -1, -119],
+    [4, -1, 0, -1, 115],
+    [2, -2, 0, 1, 107]], dtype=float)
+
+
+def julian_centuries(mjd_utc):
+    ''' julian centuries (TT) since J2000.0 for the UTC mjds 'mjd_utc' '''
+    return (np.asarray(mjd_utc, dtype=float) + gTTminusUTC - gMJDJ2000) / 36525.
+
+
+def nutation(tt_centuries):
+    ''' nutation in longitude and obliquity and the true obliquity of the ecliptic
+    in deg (main terms only, accurate to ~0.5 arcsec) '''
+    t = tt_centuries
+    omega = np.radians(125.04452 - 1934.136261 * t)
+    sun_lon = np.radians(280.4665 + 36000.7698 * t)
+    moon_lon = np.radians(218.3165 + 481267.8813 * t)
+
+    delta_psi = (-17.20 * np.sin(omega) - 1.32 * np.sin(2 * sun_lon)
+                 - 0.23 * np.sin(2 * moon_lon) + 0.21 * np.sin(2 * omega)) / 3600.
+    delta_eps = (9.20 * np.cos(omega) + 0.57 * np.cos(2 * sun_lon)
+                 + 0.10 * np.cos(2 * moon_lon) - 0.09 * np.cos(2 * omega)) / 3600.
+    mean_eps = 23.439291111 - (46.8150 * t + 0.00059 * t**2 - 0.001813 * t**3) / 3600.
+
+    return delta_psi, delta_eps, mean_eps + delta_eps
+
+
+def local_sidereal_time(mjd_utc, lon, delta_psi=None, true_eps=None):
+    ''' local (apparent, if the nutation is supplied) sidereal time in deg
+    at east longitude 'lon' (deg). UT1 is approximated by UTC. '''
+    days = np.asarray(mjd_utc, dtype=float) - gMJDJ2000
+    t = days / 36525.
+    gmst = 280.46061837 + 360.98564736629 * days + 0.000387933 * t**2 - t**3 / 38710000.
+    if delta_psi is not None:
+        gmst = gmst + delta_psi * np.cos(np.radians(true_eps))
+    return np.mod(gmst + lon, 360.)
+
+
+def ecliptic_to_equatorial(xyz, eps):
+    ''' rotates ecliptic cartesian vectors (first axis x, y, z) to the equator
+    for the obliquity 'eps' in deg '''
+    cos_eps = np.cos(np.radians(eps))
+    sin_eps = np.sin(np.radians(eps))
+    return np.array([xyz[0],
+                     xyz[1] * cos_eps - xyz[2] * sin_eps,
+                     xyz[1] * sin_eps + xyz[2] * cos_eps])
+
+
+def sun_ecliptic(tt_centuries):
+    ''' apparent geocentric ecliptic longitude (deg) and distance (km) of the sun '''
+    t = tt_centuries
+    mean_lon = 280.46646 + 36000.76983 * t + 0.0003032 * t**2
+    mean_anomaly = np.radians(357.52911 + 35999.05029 * t - 0.0001537 * t**2)
+    ecc = 0.016708634 - 0.000042037 * t - 0.0000001267 * t**2
+    center = ((1.914602 - 0.004817 * t - 0.000014 * t**2) * np.sin(mean_anomaly)
+              + (0.019993 - 0.000101 * t) * np.sin(2 * mean_anomaly)
+              + 0.000289 * np.sin(3 * mean_anomaly))
+    true_anomaly = mean_anomaly + np.radians(center)
+    dist = 1.000001018 * (1 - ecc**2) / (1 + ecc * np.cos(true_anomaly)) * gAstronomicalUnit
+
+    omega = np.radians(125.04 - 1934.136 * t)
+    apparent_lon = mean_lon + center - 0.00569 - 0.00478 * np.sin(omega)
+
+    return np.mod(apparent_lon, 360.), dist
+
+
+def moon_ecliptic(tt_centuries):
+    ''' geocentric ecliptic longitude, latitude (deg, mean equinox of date)
+    and distance (km) of the moon '''
+    t = np.asarray(tt_centuries, dtype=float)
+    moon_mean_lon = (218.3164477 + 481267.88123421 * t - 0.0015786 * t**2 + t**3 / 538841.
+                     - t**4 / 65194000.)
+    elongation = (297.8501921 + 445267.1114034 * t - 0.0018819 * t**2 + t**3 / 545868.
+                  - t**4 / 113065000.)
+    sun_anomaly = 357.5291092 + 35999.0502909 * t - 0.0001536 * t**2 + t**3 / 24490000.
+    moon_anomaly = (134.9633964 + 477198.8675055 * t + 0.0087414 * t**2 + t**3 / 69699.
+                    - t**4 / 14712000.)
+    lat_argument = (93.2720950 + 483202.0175233 * t - 0.0036539 * t**2 - t**3 / 3526000.
+                    + t**4 / 863310000.)
+    a_1 = np.radians(119.75 + 131.849 * t)
+    a_2 = np.radians(53.09 + 479264.290 * t)
+    a_3 = np.radians(313.45 + 481266.484 * t)
+    ecc = 1 - 0.002516 * t - 0.0000074 * t**2
+
+    # arguments of all terms at once: shape (n_terms, n_times)
+    fundamentals = np.radians(np.array([elongation, sun_anomaly, moon_anomaly, lat_argument]))
+    fundamentals = fundamentals.reshape(4, -1)
+    ecc = ecc.reshape(-1)
+
+    args = gMoonLonDistTerms[:, :4] @ fundamentals
+    ecc_factor = ecc[np.newaxis, :] ** np.abs(gMoonLonDistTerms[:, 1])[:, np.newaxis]
+    sum_l = np.sum(gMoonLonDistTerms[:, 4:5] * ecc_factor * np.sin(args), axis=0)
+    sum_r = np.sum(gMoonLonDistTerms[:, 5:6] * ecc_factor * np.cos(args), axis=0)
+
+    args = gMoonLatTerms[:, :4] @ fundamentals
+    ecc_factor = ecc[np.newaxis, :] ** np.abs(gMoonLatTerms[:, 1])[:, np.newaxis]
+    sum_b = np.sum(gMoonLatTerms[:, 4:5] * ecc_factor * np.sin(args), axis=0)
+
+    sum_l = sum_l.reshape(t.shape)
+    sum_r = sum_r.reshape(t.shape)
+    sum_b = sum_b.reshape(t.shape)
+
+    mean_lon_rad = np.radians(moon_mean_lon)
+    moon_anomaly_rad = np.radians(moon_anomaly)
+    lat_argument_rad = np.radians(lat_argument)
+    sum_l += 3958 * np.sin(a_1) + 1962 * np.sin(mean_lon_rad - lat_argument_rad) + 318 * np.sin(a_2)
+    sum_b += (-2235 * np.sin(mean_lon_rad) + 382 * np.sin(a_3)
+              + 175 * np.sin(a_1 - lat_argument_rad) + 175 * np.sin(a_1 + lat_argument_rad)
+              + 127 * np.sin(mean_lon_rad - moon_anomaly_rad)
+              - 115 * np.sin(mean_lon_rad + moon_anomaly_rad))
+
+    lon = np.mod(moon_mean_lon + sum_l / 1e6, 360.)
+    lat = sum_b / 1e6
+    dist = 385000.56 + sum_r / 1000.
+
+    return lon, lat, dist
+
+
+def geocentric_site(lat, height):
+    ''' distance from the earth's axis and above the equatorial plane (km)
+    of a site with geodetic latitude 'lat' (deg) and height 'height' (m) '''
+    lat_rad = np.radians(lat)
+    axis_ratio = 1. - gEarthFlattening
+    reduced_lat = np.arctan(axis_ratio * np.tan(lat_rad))
+    rho_cos = gEarthRadius * np.cos(reduced_lat) + height / 1000. * np.cos(lat_rad)
+    rho_sin = gEarthRadius * axis_ratio * np.sin(reduced_lat) + height / 1000. * np.sin(lat_rad)
+    return rho_cos, rho_sin
+
+
+def equatorial_to_horizontal(xyz, lst, lat):
+    ''' converts equatorial cartesian vectors of date (first axis x, y, z) to
+    altitude and azimuth (north through east) in deg for the local sidereal
+    time 'lst' and the geodetic latitude 'lat' (both deg) '''
+    lst_rad = np.radians(lst)
+    lat_rad = np.radians(lat)
+    # rotate into the local meridian frame (x: meridian, y: east of it)
+    x_mer = xyz[0] * np.cos(lst_rad) + xyz[1] * np.sin(lst_rad)
+    y_east = xyz[0] * np.sin(lst_rad) - xyz[1] * np.cos(lst_rad)
+    z_pole = xyz[2]
+
+    north = z_pole * np.cos(lat_rad) - x_mer * np.sin(lat_rad)
+    up = z_pole * np.sin(lat_rad) + x_mer * np.cos(lat_rad)
+    east = -y_east
+
+    alt = np.degrees(np.arctan2(up, np.hypot(north, east)))
+    az = np.mod(np.degrees(np.arctan2(east, north)), 360.)
+    return alt, az
+
+
+def moon_alt_az_phase(mjd_utc, lat, lon, height):
+    ''' topocentric altitude and azimuth (deg, no refraction) and the illuminated
+    fraction in percent of the moon for a site at geodetic 'lat', east 'lon' (deg) and
+    'height' (m) for all UTC mjds in 'mjd_utc' '''
+    t = julian_centuries(mjd_utc)
+    delta_psi, _, true_eps = nutation(t)
+
+    moon_lon, moon_lat, moon_distance = moon_ecliptic(t)
+    moon_lon = moon_lon + delta_psi
+    moon_lon_rad = np.radians(moon_lon)
+    moon_lat_rad = np.radians(moon_lat)
+    moon_ecl = moon_distance * np.array([np.cos(moon_lat_rad) * np.cos(moon_lon_rad),
+                                         np.cos(moon_lat_rad) * np.sin(moon_lon_rad),
+                                         np.sin(moon_lat_rad)])
+
+    sun_lon, sun_distance = sun_ecliptic(t)
+    sun_lon_rad = np.radians(sun_lon)
+    sun_ecl = sun_distance * np.array([np.cos(sun_lon_rad),
+                                       np.sin(sun_lon_rad),
+                                       np.zeros_like(sun_lon_rad)])
+
+    # phase angle at the moon between the directions to the sun and to the earth
+    moon_to_sun = sun_ecl - moon_ecl
+    cos_phase_angle = -np.sum(moon_to_sun * moon_ecl, axis=0) / \
+        (np.linalg.norm(moon_to_sun, axis=0) * np.linalg.norm(moon_ecl, axis=0))
+    phase = 50. * (1. + cos_phase_angle)
+
+    # topocentric position: subtract the geocentric position of the site
+    lst = local_sidereal_time(mjd_utc, lon, delta_psi, true_eps)
+    rho_cos, rho_sin = geocentric_site(lat, height)
+    lst_rad = np.radians(lst)
+    moon_equ = ecliptic_to_equatorial(moon_ecl, true_eps)
+    site_equ = np.array([rho_cos * np.cos(lst_rad),
+                         rho_cos * np.sin(lst_rad),
+                         rho_sin * np.ones_like(lst_rad)])
+    alt, az = equatorial_to_horizontal(moon_equ - site_equ, lst, lat)
+
+    return alt, az, phase
+
+
+def sun_alt_az(mjd_utc, lat, lon):
+    ''' altitude and azimuth (deg, no refraction) of the sun for a site at
+    geodetic 'lat' and east 'lon' (deg) for all UTC mjds in 'mjd_utc'.
+    The parallax of the sun (< 9 arcsec) is neglected. '''
+    t = julian_centuries(mjd_utc)
+    delta_psi, _, true_eps = nutation(t)
+
+    sun_lon, _ = sun_ecliptic(t)
+    sun_lon_rad = np.radians(sun_lon)
+    sun_ecl = np.array([np.cos(sun_lon_rad), np.sin(sun_lon_rad), np.zeros_like(sun_lon_rad)])
+
+    lst = local_sidereal_time(mjd_utc, lon, delta_psi, true_eps)
+    return equatorial_to_horizontal(ecliptic_to_equatorial(sun_ecl, true_eps), lst, lat)
+
+
+def rotation_matrix(angle, axis):
+    ''' matrix of a rotation of the coordinate frame by 'angle' (deg)
+    around the axis 0 (x), 1 (y) or 2 (z) '''
+    cos_angle = np.cos(np.radians(angle))
+    sin_angle = np.sin(np.radians(angle))
+    first, second = (axis + 1) % 3, (axis + 2) % 3
+    matrix = np.eye(3)
+    matrix[first, first] = cos_angle
+    matrix[second, second] = cos_angle
+    matrix[first, second] = sin_angle
+    matrix[second, first] = -sin_angle
+    return matrix
+
+
+def precession_matrix(tt_centuries):
+    ''' rotation from the mean equator and equinox of J2000 to the mean equator and
+    equinox of date (IAU 1976 precession) for a scalar 'tt_centuries' '''
+    t = tt_centuries
+    zeta = (2306.2181 * t + 0.30188 * t**2 + 0.017998 * t**3) / 3600.
+    z = (2306.2181 * t + 1.09468 * t**2 + 0.018203 * t**3) / 3600.
+    theta = (2004.3109 * t - 0.42665 * t**2 - 0.041833 * t**3) / 3600.
+    return rotation_matrix(-z, 2) @ rotation_matrix(theta, 1) @ rotation_matrix(-zeta, 2)
+
+
+def nutation_matrix(delta_psi, delta_eps, true_eps):
+    ''' rotation from the mean to the true equator and equinox of date for the
+    nutation angles and the true obliquity (deg, see nutation()) '''
+    mean_eps = true_eps - delta_eps
+    return (rotation_matrix(-true_eps, 0) @ rotation_matrix(-delta_psi, 2)
+            @ rotation_matrix(mean_eps, 0))
+
+
+def earth_velocity(tt_centuries):
+    ''' velocity of the earth in units of the speed of light as an equatorial vector
+    (J2000), for the annual aberration. The orbit is taken as circular (error < 0.4 arcsec). '''
+    sun_lon, _ = sun_ecliptic(tt_centuries)
+    sun_lon_rad = np.radians(sun_lon)
+    aberration_constant = np.radians(20.49552 / 3600.)
+    velocity = aberration_constant * np.array([np.sin(sun_lon_rad), -np.cos(sun_lon_rad), 0.])
+    return ecliptic_to_equatorial(velocity, 23.439291111)
+
+
+def radec_to_vectors(ra, dec):
+    ''' unit vectors (first axis x, y, z) of the positions 'ra', 'dec' (deg) '''
+    ra_rad = np.radians(ra)
+    dec_rad = np.radians(dec)
+    return np.array([np.cos(dec_rad) * np.cos(ra_rad),
+                     np.cos(dec_rad) * np.sin(ra_rad),
+                     np.sin(dec_rad)])
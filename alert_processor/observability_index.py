@@ -0,0 +1,206 @@
+'''
+Observability Index Module
+
+Instead of transforming every target position to AltAz along the time grid of
+its window search, the altitudes of a whole-sky grid of pixels are precomputed
+once per site and night. A target's altitude is then looked up from the pixel
+it falls in and interpolated in time.
+
+The pixels are equal-area: declination bands equally spaced in sin(dec), each
+divided into the same number of RA cells. The altitude of any position differs
+from the altitude of its pixel center by at most their angular distance, so a
+lookup decides the zenith constraint for sure as long as the center altitude is
+further from the limit than the pixel radius (plus the small engine and time
+interpolation errors). Only the remaining samples close to an edge are
+calculated exactly for the target position itself with the altaz_engine. The
+resulting altitudes therefore give the same zenith constraint as the full
+astropy transform, up to the arcsecond accuracy of the altaz_engine.
+
+A night is defined from local (mean solar) noon to the following local noon,
+like in the ephemeris_cache.
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+
+from astropy import units as u
+from alert_processor import altaz_engine
+from alert_processor import time_model
+
+gIndexStep = 5. / 60. / 24.  # days
+gDecBands = 64
+gRaCells = 128
+gMaxNights = 3
+# altaz_engine accuracy and error of the linear interpolation in time (deg)
+gLookupError = 0.02
+
+# one index per site, filled on demand
+gSiteIndexes = {}
+
+
+def pixel_grid(n_bands=gDecBands, n_ra=gRaCells):
+    ''' centers (ra, dec in deg) and radii (deg, largest distance between the
+    center and the pixel corners) of the equal-area pixels '''
+    sin_edges = np.linspace(-1., 1., n_bands + 1)
+    dec_edges = np.degrees(np.arcsin(sin_edges))
+    band_decs = np.degrees(np.arcsin(0.5 * (sin_edges[:-1] + sin_edges[1:])))
+    half_width = np.radians(180. / n_ra)
+
+    # distance of the band centers to the lower and upper corners of their pixels
+    radii = []
+    for corner_decs in [dec_edges[:-1], dec_edges[1:]]:
+        cos_distance = (np.sin(np.radians(band_decs)) * np.sin(np.radians(corner_decs))
+                        + np.cos(np.radians(band_decs)) * np.cos(np.radians(corner_decs))
+                        * np.cos(half_width))
+        radii.append(np.degrees(np.arccos(np.clip(cos_distance, -1., 1.))))
+    band_radii = np.maximum(*radii)
+
+    cell_ras = (np.arange(n_ra) + 0.5) * 360. / n_ra
+    ras = np.tile(cell_ras, n_bands)
+    decs = np.repeat(band_decs, n_ra)
+    return ras, decs, np.repeat(band_radii, n_ra)
+
+
+def pixel_index(ras, decs, n_bands=gDecBands, n_ra=gRaCells):
+    ''' pixel numbers of the positions 'ras', 'decs' (deg) '''
+    bands = np.floor((np.sin(np.radians(decs)) + 1.) / 2. * n_bands).astype(int)
+    cells = np.floor(np.mod(ras, 360.) / 360. * n_ra).astype(int)
+    return np.clip(bands, 0, n_bands - 1) * n_ra + np.clip(cells, 0, n_ra - 1)
+
+
+class NightlyObservabilityIndex:
+    ''' altitudes of all pixel centers during a single night at a site '''
+    def __init__(self, site, night_start, step, n_bands, n_ra):
+        ''' calculates the altitudes from the local noon at 'night_start' (mjd)
+        until the next local noon. The grid includes both noons. '''
+        self.night_start = night_start
+        n_steps = int(round(1. / step)) + 1
+        self.mjds = np.linspace(night_start, night_start + 1., n_steps)
+
+        ras, decs, _ = pixel_grid(n_bands, n_ra)
+        engine = altaz_engine.AltAzEngine(site, night_start)
+        alts, _ = engine.alt_az(ras[:, np.newaxis], decs[:, np.newaxis], self.mjds[np.newaxis, :])
+        self.alts = alts.astype(np.float32)
+
+
+class SiteObservabilityIndex:
+    ''' observability index of one site for the nights that have been requested.
+
+        Main functions are:
+         * source_alts(): altitudes of any number of targets along their time grids,
+           looked up from the index and exact close to the altitude limit
+         * is_cached(): checks if a time range can be answered without calculating a night
+         * keep_warm(): calculation of the upcoming nights in advance
+    '''
+    def __init__(self, site, step=gIndexStep, n_bands=gDecBands, n_ra=gRaCells,
+                 max_nights=gMaxNights):
+        self.site = site
+        self.step = step
+        self.n_bands = n_bands
+        self.n_ra = n_ra
+        self.max_nights = max_nights
+        self.radii = pixel_grid(n_bands, n_ra)[2]
+        # offset of the local noon with respect to 0h UTC in days
+        self.noon_offset = 0.5 - site.lon.to_value(u.deg) / 360.
+        self.nights = OrderedDict()
+
+        self.lookups = 0
+        self.exact_transforms = 0
+
+    def __str__(self):
+        out = "{: <30} : {}\n".format("  * Observability index site", self.site.name)
+        out += "{: <30} : {}\n".format("  * Cached nights", len(self.nights))
+        out += "{: <30} : {}, {}\n".format("  * Lookups, exact transforms", self.lookups,
+                                           self.exact_transforms)
+        return out
+
+    def night_index(self, mjds):
+        ''' index of the night(s) containing the times 'mjds' '''
+        return np.floor(np.asarray(mjds) - self.noon_offset).astype(int)
+
+    def get_night(self, index):
+        ''' returns the altitudes of night 'index', calculating them if needed '''
+        night = self.nights.get(index)
+        if night is None:
+            night = NightlyObservabilityIndex(self.site, index + self.noon_offset, self.step,
+                                              self.n_bands, self.n_ra)
+            self.nights[index] = night
+            if len(self.nights) > self.max_nights:
+                self.nights.popitem(last=False)
+        else:
+            self.nights.move_to_end(index)
+
+        return night
+
+    def is_cached(self, mjds):
+        ''' True if all nights of the times 'mjds' are already calculated '''
+        first, last = self.night_index([np.min(mjds), np.max(mjds)])
+        return all(index in self.nights for index in range(first, last + 1))
+
+    def keep_warm(self, mjd, nights_ahead=1):
+        ''' makes sure the night of 'mjd' and the following nights are calculated '''
+        first = int(self.night_index(mjd))
+        for index in range(first, first + nights_ahead + 1):
+            self.get_night(index)
+
+    def lookup_alts(self, pixels, mjds):
+        ''' altitudes of the centers of 'pixels' (N,) interpolated to the times 'mjds'
+        (N, M). Returns an (N, M) array in deg. '''
+        mjds = np.asarray(mjds, dtype=float)
+        first, last = self.night_index([np.min(mjds), np.max(mjds)])
+        nights = [self.get_night(index) for index in range(first, last + 1)]
+
+        # the nights share their noons: a uniform grid from the first noon on
+        unique_pixels, rows = np.unique(pixels, return_inverse=True)
+        table = np.concatenate([night.alts[unique_pixels, :-1] for night in nights[:-1]]
+                               + [nights[-1].alts[unique_pixels]], axis=1)
+
+        positions = (mjds - nights[0].night_start) / self.step
+        steps = np.clip(np.floor(positions).astype(int), 0, table.shape[1] - 2)
+        fractions = positions - steps
+        rows = rows[:, np.newaxis]
+        return (1. - fractions) * table[rows, steps] + fractions * table[rows, steps + 1]
+
+    def source_alts(self, ras, decs, mjds, alt_limit):
+        ''' altitudes (deg) of the targets 'ras', 'decs' (Quantity arrays of N positions)
+        at the times 'mjds' ((N, M) or (M,) UTC mjds). Looked up values are used where
+        they are certainly on one side of the Quantity 'alt_limit', all other samples
+        are calculated exactly with exact_alts(). '''
+        ras = np.atleast_1d(ras.to_value(u.deg))
+        decs = np.atleast_1d(decs.to_value(u.deg))
+        mjds = np.broadcast_to(np.asarray(mjds, dtype=float), (len(ras), np.shape(mjds)[-1]))
+
+        pixels = pixel_index(ras, decs, self.n_bands, self.n_ra)
+        alts = self.lookup_alts(pixels, mjds)
+        margins = self.radii[pixels][:, np.newaxis] + gLookupError
+        uncertain = np.abs(alts - alt_limit.to_value(u.deg)) <= margins
+
+        rows, columns = np.nonzero(uncertain)
+        if len(rows):
+            alts[rows, columns] = self.exact_alts(ras, decs, mjds, rows, columns)
+        self.lookups += alts.size - len(rows)
+        self.exact_transforms += len(rows)
+
+        return alts
+
+    def exact_alts(self, ras, decs, mjds, rows, columns):
+        ''' altitudes (deg) of the samples [rows, columns] of the targets 'ras', 'decs' (deg)
+        at the times 'mjds' (N, M), calculated for the target positions themselves '''
+        engine = altaz_engine.get_engine(self.site, np.min(mjds[rows, columns]))
+        alts, _ = engine.alt_az(ras[rows], decs[rows], mjds[rows, columns])
+        return alts
+
+
+def get_site_index(site):
+    ''' returns the observability index of 'site', creating it on first use '''
+    index = gSiteIndexes.get(site.name)
+    if index is None:
+        index = SiteObservabilityIndex(site)
+        gSiteIndexes[site.name] = index
+    return index
+
+
+def keep_warm(site, time, nights_ahead=1):
+    ''' calculates the index of 'site' for the night of 'time' and the following nights '''
+    get_site_index(site).keep_warm(time_model.to_mjd(time), nights_ahead)
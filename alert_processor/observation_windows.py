@@ -8,27 +8,94 @@ which are currently being evaluated by the TH alerter.
 
 '''
 
-from datetime import datetime
+from enum import Enum
 
 import numpy as np
-import ephem
 
 from astropy import units as u
 from astropy.units import Quantity
 from astropy.time import Time
-from astropy.coordinates import SkyCoord, AltAz, FK5, Angle
-from astropy.coordinates import get_sun
-
-from matplotlib.dates import num2date, date2num
 
 from utilities import observatories
-
-gSunDown = -18.0 * u.deg
-gMoonDown = -0.5 * u.deg
+from alert_processor import fast_ephemeris
+from alert_processor import altaz_engine
+from alert_processor.darkness_limits import gSunDown, gMoonDown, has_sky_quality_limits
+from alert_processor import ephemeris_cache
+from alert_processor import observability_index
+from alert_processor import sky_brightness
+from alert_processor import time_model
+
+# NSB rate of a camera pixel under dark sky at zenith, used to convert the sky
+# brightness model to the NSB limits of the science configs
+gDarkNSBRate = 0.25 * u.GHz
+
+# settings of the adaptive window search
+gCoarseStep = 15 * u.min
+gEdgeTolerance = 1 * u.s
+gRefineSubsteps = 15
+gMaxGap = 1 * u.hour
+
+# settings of the analytic window search
+gAnalyticStep = 30 * u.min
+gMaxSolverIterations = 50
+
+# step of the grid search mode when searching night by night (25 steps per hour)
+gNightGridStep = 2.4 * u.min
+
+# number of targets from which the batch search uses the observability index
+gIndexMinTargets = 100
+
+# all windows found in the search range: start, end and duration in hours
+gWindowDtype = np.dtype([('start', 'datetime64[us]'),
+                         ('end', 'datetime64[us]'),
+                         ('duration', 'f8')])
+
+
+class WindowSearchMode(Enum):
+    ''' ways of searching the observation window:
+        grid: all constraints are sampled on a fixed grid of up to 500 steps
+        adaptive: a coarse scan finds the valid intervals and only the edges of the
+                  sun, moon and source constraints are refined to a given tolerance
+        analytic: the altitudes are bracketed on a coarse grid and the times where they
+                  cross the sun, moon and zenith limits are solved for with a root finder '''
+    grid = "grid"
+    adaptive = "adaptive"
+    analytic = "analytic"
+
+
+class WindowEngine(Enum):
+    ''' calculation of the sun, moon and source profiles:
+        cached: sun and moon from the nightly ephemeris_cache, the source from the
+                observability_index or the altaz_engine
+        fast: only fast_ephemeris and the altaz_engine (plain numpy) on the time grid of
+              the search, without astropy and without filling caches (e.g. for a first
+              alert in a fresh process). The window edges agree with the astropy engine
+              within gFastEngineMargin.
+        astropy: the astropy transforms (get_sun, get_body, SkyCoord), the reference for
+                 the validation of the other engines
+        The margins of the analytic search mode are always calculated as in the fast engine. '''
+    cached = "cached"
+    fast = "fast"
+    astropy = "astropy"
+
+
+# engines used for the urgency of a science config if no engine is configured
+gUrgencyEngines = {"rapid-now": WindowEngine.fast}
+# largest difference of the window edges of the fast engine with respect to the astropy engine
+gFastEngineMargin = 10 * u.s
+
+
+def engine_for_urgency(urgency):
+    ''' name of the WindowEngine for the 'urgency' of a science config, None for the default '''
+    engine = gUrgencyEngines.get(urgency)
+    if engine is None:
+        return None
+    return engine.value
 
 
 def radec_from_altaztime(alt, az, time, site):
     ''' converts ra dec coordinates to alt az at a given time and site location'''
+    from astropy.coordinates import AltAz, FK5, Angle
     alt_az = AltAz(alt=Angle(float(alt), unit=u.deg),
                    az=Angle(float(az), unit=u.deg),
                    location=site.location,
@@ -53,24 +120,21 @@ def is_darkness(sunAlt, moonAlt):
 
 def source_alt(obs_time, ra, dec, site):
     ''' calculates the altitude of a source at time 'obs_time' at location 'site' '''
-    position = SkyCoord(ra, dec, unit=u.deg)
-    alert_time = Time(obs_time)
-    source_alt_az = position.transform_to(AltAz(obstime=alert_time,
-                                                location=site.location))
-    return source_alt_az.alt / u.deg
+    alt, _ = altaz_engine.source_alt_az(Quantity(ra, u.deg), Quantity(dec, u.deg),
+                                        time_model.to_mjd(obs_time), site)
+    return alt
 
 
 def source_az(obs_time, ra, dec, site):
     ''' calculates the azimuth of a source at time 'obs_time' at location 'site' '''
-    position = SkyCoord(ra, dec, unit=u.deg)
-    alert_time = Time(obs_time)
-    source_alt_az = position.transform_to(AltAz(obstime=alert_time,
-                                                location=site.location))
-    return source_alt_az.az / u.deg
+    _, az = altaz_engine.source_alt_az(Quantity(ra, u.deg), Quantity(dec, u.deg),
+                                       time_model.to_mjd(obs_time), site)
+    return az
 
 
 def sun_alt(obs_time, site):
     ''' calculates the altitude of the sun at time 'obs_time' at location 'site' '''
+    from astropy.coordinates import AltAz, get_sun
     sun = get_sun(Time(obs_time)).transform_to(AltAz(obstime=Time(obs_time),
                                                      location=site.location))
     return sun.alt / u.deg
@@ -78,6 +142,7 @@ def sun_alt(obs_time, site):
 
 def moon_alt(obs_time, site):
     ''' calculates the altitude of the moon at time 'obs_time' at location 'site' '''
+    import ephem
     moon = ephem.Moon()
     obs = ephem.Observer()
     obs.lon = str(site.lon / u.deg)
@@ -93,6 +158,7 @@ def moon_alt(obs_time, site):
 
 def moon_phase(obs_time, site):
     ''' calculates moon phase in percent at time 'obs_time' at location 'site' '''
+    import ephem
     moon = ephem.Moon()
     obs = ephem.Observer()
     obs.lon = str(site.lon / u.deg)
@@ -108,6 +174,7 @@ def moon_phase(obs_time, site):
 
 def moon_az(obs_time, site):
     ''' calculates the moons azimuth at time 'obs_time' at location 'site' '''
+    import ephem
     moon = ephem.Moon()
     obs = ephem.Observer()
     obs.lon = str(site.lon / u.deg)
@@ -119,21 +186,304 @@ def moon_az(obs_time, site):
     return moon.az * 180 / np.pi
 
 
+def moon_alt_az_phase(obs_times, site):
+    ''' vectorized moon ephemeris for all times in 'obs_times' at location 'site'.
+    returns arrays of the altitude and azimuth in deg and the illuminated fraction
+    in percent (same definition as ephem.Moon().phase).
+    The altitudes are geometric (no refraction) like the sun and source profiles.
+    See fast_ephemeris for the accuracy. '''
+    obs_mjds = time_model.to_mjd(obs_times)
+    return fast_ephemeris.moon_alt_az_phase(obs_mjds, site.lat.to_value(u.deg),
+                                            site.lon.to_value(u.deg), site.height.to_value(u.m))
+
+
+def fast_sun_moon_profiles(mjds, site):
+    ''' sun altitudes, moon altitudes, moon azimuths (deg) and moon phases (percent)
+    at the UTC 'mjds' from fast_ephemeris '''
+    lat, lon, height = site.lat.to_value(u.deg), site.lon.to_value(u.deg), site.height.to_value(u.m)
+    sun_alts, _ = fast_ephemeris.sun_alt_az(mjds, lat, lon)
+    moon_alts, moon_azs, moon_phases = fast_ephemeris.moon_alt_az_phase(mjds, lat, lon, height)
+    return sun_alts, moon_alts, moon_azs, moon_phases
+
+
+def astropy_sun_moon_profiles(mjds, site):
+    ''' fast_sun_moon_profiles() calculated with astropy (reference engine). The moon
+    phase is the illuminated fraction from the geocentric sun-moon phase angle. '''
+    from astropy.coordinates import AltAz, get_sun, get_body
+    times = Time(mjds, format='mjd', scale='utc')
+    altaz_frame = AltAz(obstime=times, location=site.location)
+    sun = get_sun(times)
+    moon = get_body('moon', times)
+    sun_alts = sun.transform_to(altaz_frame).alt.to_value(u.deg)
+    moon_altaz = get_body('moon', times, site.location).transform_to(altaz_frame)
+
+    elongation = sun.separation(moon).to_value(u.rad)
+    sun_distance = sun.distance.to_value(u.km)
+    phase_angle = np.arctan2(sun_distance * np.sin(elongation),
+                             moon.distance.to_value(u.km) - sun_distance * np.cos(elongation))
+    moon_phases = 50. * (1. + np.cos(phase_angle))
+
+    return sun_alts, moon_altaz.alt.to_value(u.deg), moon_altaz.az.to_value(u.deg), moon_phases
+
+
+def astropy_source_alt_az(ra, dec, mjds, site):
+    ''' altitudes and azimuths (deg) of the position 'ra', 'dec' (Quantities) at the UTC
+    'mjds' calculated with astropy (reference engine) '''
+    from astropy.coordinates import SkyCoord, AltAz
+    times = Time(mjds, format='mjd', scale='utc')
+    source = SkyCoord(ra, dec).transform_to(AltAz(obstime=times, location=site.location))
+    return source.alt.to_value(u.deg), source.az.to_value(u.deg)
+
+
 def moon_dist(obs_time, ra, dec, site):
     ''' calculates the angular distance between the moon and a
         target at ra, dec at time 'obs_time' at location 'site' '''
-    a_moon_alt = Angle(moon_alt(obs_time, site) * u.deg, unit=u.deg)
-    a_moon_az = Angle(moon_az(obs_time, site) * u.deg, unit=u.deg)
-    a_source_alt = Angle(source_alt(obs_time, ra, dec, site) * u.deg, unit=u.deg)
-    a_source_az = Angle(source_az(obs_time, ra, dec, site) * u.deg, unit=u.deg)
+    from astropy.coordinates import Angle
+    return Angle(moon_dist_array(obs_time, ra, dec, site), unit=u.deg)
 
-    a_source_altaz = AltAz(alt=a_source_alt, az=a_source_az, location=site.location, obstime=obs_time)
-    a_moon_altaz = AltAz(alt=a_moon_alt, az=a_moon_az, location=site.location, obstime=obs_time)
-    a_moon_sep = a_moon_altaz.separation(a_source_altaz)
-
-    # print "Distance between source and moon = %s deg" % (moon_sep.deg)
-
-    return a_moon_sep
+
+def source_alt_array(obs_times, ras, decs, site):
+    ''' array version of source_alt(): altitudes (deg) of the targets 'ras', 'decs'
+    (deg or Quantities) at the times 'obs_times'. Times and positions are broadcast. '''
+    return altaz_engine.source_alt_az(Quantity(ras, u.deg), Quantity(decs, u.deg),
+                                      time_model.to_mjd(obs_times), site)[0]
+
+
+def source_az_array(obs_times, ras, decs, site):
+    ''' array version of source_az(), see source_alt_array() '''
+    return altaz_engine.source_alt_az(Quantity(ras, u.deg), Quantity(decs, u.deg),
+                                      time_model.to_mjd(obs_times), site)[1]
+
+
+def sun_alt_array(obs_times, site):
+    ''' array version of sun_alt(): altitudes (deg) of the sun at the times 'obs_times' '''
+    return fast_ephemeris.sun_alt_az(time_model.to_mjd(obs_times), site.lat.to_value(u.deg),
+                                     site.lon.to_value(u.deg))[0]
+
+
+def moon_alt_array(obs_times, site):
+    ''' array version of moon_alt(): altitudes (deg) of the moon at the times 'obs_times' '''
+    return moon_alt_az_phase(obs_times, site)[0]
+
+
+def moon_az_array(obs_times, site):
+    ''' array version of moon_az(): azimuths (deg) of the moon at the times 'obs_times' '''
+    return moon_alt_az_phase(obs_times, site)[1]
+
+
+def moon_phase_array(obs_times, site):
+    ''' array version of moon_phase(): illuminated fractions (percent) of the moon '''
+    return moon_alt_az_phase(obs_times, site)[2]
+
+
+def moon_dist_array(obs_times, ras, decs, site):
+    ''' array version of moon_dist(): angular distances (deg) between the moon and the
+    targets 'ras', 'decs' (deg or Quantities) at the times 'obs_times', calculated from
+    the unit vectors of both in the horizontal frame. Times and positions are broadcast. '''
+    mjds = time_model.to_mjd(obs_times)
+    lat, lon, height = site.lat.to_value(u.deg), site.lon.to_value(u.deg), site.height.to_value(u.m)
+    moon_altitudes, moon_azimuths, _ = fast_ephemeris.moon_alt_az_phase(mjds, lat, lon, height)
+    source_altitudes, source_azimuths = altaz_engine.source_alt_az(
+        Quantity(ras, u.deg), Quantity(decs, u.deg), mjds, site)
+    moon_x, moon_y, moon_z = fast_ephemeris.radec_to_vectors(moon_azimuths, moon_altitudes)
+    source_x, source_y, source_z = fast_ephemeris.radec_to_vectors(source_azimuths,
+                                                                   source_altitudes)
+
+    cross = np.sqrt((moon_y * source_z - moon_z * source_y)**2
+                    + (moon_z * source_x - moon_x * source_z)**2
+                    + (moon_x * source_y - moon_y * source_x)**2)
+    dot = moon_x * source_x + moon_y * source_y + moon_z * source_z
+    return np.degrees(np.arctan2(cross, dot))
+
+
+def time_window_offsets(max_delay, step=None):
+    ''' offsets (in hours) of the grid of times where the observation window will be
+    searched in with respect to the full hour of the event. The range varies depending
+    on the maximum allowed delay time. If no 'step' is given, up to 500 steps are used. '''
+    time_range_to_test = [-0.2 * max_delay, +1.5 * max_delay]
+    total_range_hours = time_range_to_test[1] - time_range_to_test[0]
+    if step is None:
+        n_steps = np.minimum(500, int(total_range_hours.to_value(u.hour)) * 25)
+    else:
+        n_steps = int(np.ceil((total_range_hours / step).to_value(u.dimensionless_unscaled))) + 1
+
+    return np.linspace(time_range_to_test[0].to_value(u.hour),
+                       time_range_to_test[1].to_value(u.hour),
+                       n_steps)
+
+
+def refine_edges(mask_function, lows, highs, low_values, tolerance, n_substeps=gRefineSubsteps):
+    ''' coarse-to-fine search of the times where the boolean 'mask_function' changes
+    its value, for all edges at once. Each edge is bracketed by the mjds 'lows' (where the
+    mask is 'low_values') and 'highs' (where it is not). In every iteration 'n_substeps'
+    samples per bracket are evaluated in a single call and the bracket is narrowed to the
+    first change, until it is shorter than 'tolerance' (days).
+    Returns the narrowed lows and highs. '''
+    lows = np.array(lows, dtype=float)
+    highs = np.array(highs, dtype=float)
+    fractions = np.linspace(0., 1., n_substeps + 2)
+
+    while lows.size and np.max(highs - lows) > tolerance:
+        samples = lows[:, np.newaxis] + (highs - lows)[:, np.newaxis] * fractions[np.newaxis, :]
+        values = np.empty(samples.shape, dtype=bool)
+        values[:, 0] = low_values
+        values[:, -1] = ~low_values
+        values[:, 1:-1] = mask_function(samples[:, 1:-1].ravel()).reshape(len(lows), n_substeps)
+
+        first_change = np.argmax(values != low_values[:, np.newaxis], axis=1)
+        rows = np.arange(len(lows))
+        lows = samples[rows, first_change - 1]
+        highs = samples[rows, first_change]
+
+    return lows, highs
+
+
+def mask_intervals(mjds, mask, mask_function=None, tolerance=None):
+    ''' converts a mask sampled at 'mjds' to an (n, 2) array of the [start, end] mjds of
+    the intervals where it is True. If 'mask_function' is given, the interval edges are
+    refined to 'tolerance' (days) with refine_edges(). '''
+    changes = np.flatnonzero(mask[1:] != mask[:-1])
+    lows = mjds[changes]
+    highs = mjds[changes + 1]
+    if mask_function is not None and changes.size:
+        lows, highs = refine_edges(mask_function, lows, highs, mask[changes], tolerance)
+
+    # rising edges start an interval at the first True time, falling edges end it at the last one
+    rising = ~mask[changes]
+    starts = highs[rising]
+    ends = lows[~rising]
+    if mask[0]:
+        starts = np.concatenate([[mjds[0]], starts])
+    if mask[-1]:
+        ends = np.concatenate([ends, [mjds[-1]]])
+
+    return np.column_stack([starts, ends])
+
+
+def union_intervals(intervals_a, intervals_b):
+    ''' union of two sorted (n, 2) arrays of non-overlapping intervals '''
+    intervals = np.concatenate([intervals_a, intervals_b]).reshape(-1, 2)
+    if len(intervals) == 0:
+        return intervals
+    intervals = intervals[np.argsort(intervals[:, 0])]
+    ends = np.maximum.accumulate(intervals[:, 1])
+    first = np.flatnonzero(np.concatenate([[True], intervals[1:, 0] > ends[:-1]]))
+    last = np.concatenate([first[1:] - 1, [len(intervals) - 1]])
+    return np.column_stack([intervals[first, 0], ends[last]])
+
+
+def intersect_intervals(intervals_a, intervals_b):
+    ''' intersection of two sorted (n, 2) arrays of non-overlapping intervals '''
+    starts = np.maximum(intervals_a[:, np.newaxis, 0], intervals_b[np.newaxis, :, 0])
+    ends = np.minimum(intervals_a[:, np.newaxis, 1], intervals_b[np.newaxis, :, 1])
+    overlap = starts <= ends
+    intersection = np.column_stack([starts[overlap], ends[overlap]])
+    return intersection[np.argsort(intersection[:, 0])]
+
+
+def solve_crossings(function, lows, highs, low_values, high_values,
+                    tolerance, max_iterations=gMaxSolverIterations):
+    ''' vectorized root finding (regula falsi, Illinois variant) of the continuous
+    'function' for all brackets at once. Each root is bracketed by the mjds 'lows' and
+    'highs' with function values of opposite sign 'low_values' and 'high_values'.
+    Every iteration evaluates the function once for all brackets, until all of them are
+    shorter than 'tolerance' (days). Returns the mjds of the roots. '''
+    lows = np.array(lows, dtype=float)
+    highs = np.array(highs, dtype=float)
+    low_values = np.array(low_values, dtype=float)
+    high_values = np.array(high_values, dtype=float)
+
+    for _ in range(max_iterations):
+        active = (np.abs(highs - lows) > tolerance) & (high_values != 0)
+        if not np.any(active):
+            break
+
+        guesses = (lows * high_values - highs * low_values) / (high_values - low_values)
+        values = np.zeros_like(guesses)
+        values[active] = function(guesses[active])
+
+        # keep the bracket; if the same side is kept twice its value is halved
+        flipped = active & (np.sign(values) != np.sign(high_values))
+        kept = active & ~flipped
+        lows = np.where(flipped, highs, lows)
+        low_values = np.where(flipped, high_values, np.where(kept, low_values / 2., low_values))
+        highs = np.where(active, guesses, highs)
+        high_values = np.where(active, values, high_values)
+
+    return highs
+
+
+def crossing_intervals(function, mjds, values, tolerance):
+    ''' (n, 2) array of the [start, end] mjds of the intervals where the continuous
+    'function' is positive. It is sampled by 'values' at 'mjds', the sign changes between
+    the samples are solved for to 'tolerance' (days) with solve_crossings().
+    Crossings that are closer than the sampling step can be missed. '''
+    positive = values > 0
+    changes = np.flatnonzero(positive[1:] != positive[:-1])
+    roots = solve_crossings(function, mjds[changes], mjds[changes + 1],
+                            values[changes], values[changes + 1], tolerance)
+
+    rising = ~positive[changes]
+    starts = roots[rising]
+    ends = roots[~rising]
+    if positive[0]:
+        starts = np.concatenate([[mjds[0]], starts])
+    if positive[-1]:
+        ends = np.concatenate([ends, [mjds[-1]]])
+
+    return np.column_stack([starts, ends])
+
+
+def night_sky_background(sun_alts, moon_alts, moon_phases, separations, source_alts):
+    ''' NSB rate (Quantity) in the direction of the target for the sun and moon altitudes,
+    moon phases, moon-target separations and target altitudes (all in deg or percent) '''
+    return sky_brightness.relative_nsb(sun_alts, moon_alts, moon_phases,
+                                       separations, source_alts) * gDarkNSBRate
+
+
+def sky_quality_mask(moon_alts, moon_phases, nsb, min_nsb, max_nsb, illumination):
+    ''' moon constraint including observations under moonlight: either the moon is down,
+    or its illuminated fraction is at most 'illumination' (0 - 1). With a 'max_nsb' but
+    without 'illumination' the moon may be up at any phase, otherwise without
+    'illumination' the moon has to be down. In addition the NSB has to be within
+    'min_nsb' and 'max_nsb' (Quantities, no limit if None). '''
+    mask = np.asarray(moon_alts) < gMoonDown.to_value(u.deg)
+    if illumination is not None:
+        mask |= np.asarray(moon_phases) <= 100. * illumination
+    elif max_nsb is not None:
+        mask = np.ones_like(mask)
+    if max_nsb is not None:
+        mask &= (nsb <= max_nsb)
+    if min_nsb is not None:
+        mask &= (nsb >= min_nsb)
+    return mask
+
+
+def run_intervals(dates, mask):
+    ''' run-length detection of the contiguous True samples of 'mask'.
+    Returns the first and last of the 'dates' of every run. '''
+    padded = np.concatenate([[False], mask, [False]])
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return dates[changes[0::2]], dates[changes[1::2] - 1]
+
+
+def windows_from_intervals(starts, ends, max_gap=gMaxGap):
+    ''' merges the sorted intervals [starts, ends] (datetime64) that are separated by
+    gaps of up to 'max_gap' into observation windows.
+    Returns a structured array (see gWindowDtype) with one entry per window. '''
+    if len(starts) == 0:
+        return np.zeros(0, dtype=gWindowDtype)
+
+    gaps = starts[1:] - ends[:-1]
+    long_gaps = np.flatnonzero(gaps > np.timedelta64(int(max_gap.to_value(u.us)), 'us'))
+    first = np.concatenate([[0], long_gaps + 1])
+    last = np.concatenate([long_gaps, [len(starts) - 1]])
+
+    windows = np.zeros(len(first), dtype=gWindowDtype)
+    windows['start'] = starts[first]
+    windows['end'] = ends[last]
+    windows['duration'] = (windows['end'] - windows['start']) / np.timedelta64(1, 'h')
+    return windows
 
 
 class ObservationWindow:
@@ -157,30 +507,35 @@ class ObservationWindow:
         self.ra = ra
         self.dec = dec
 
-        self.event_time = event_time
-        if not self.event_time:
-            self.event_time = datetime.utcnow()
+        if event_time is None:
+            self.event_time = time_model.utc_now()
+        else:
+            self.event_time = time_model.to_datetime64(event_time)
 
         self.site = observatory_site
         if not self.site:
-            self.site = observatories.CTANorth
-
+            self.site = observatories.CTANorth()
+
+        self.search_mode = WindowSearchMode.grid
+        self.engine = WindowEngine.cached
+        self.edge_tolerance = gEdgeTolerance
+        self.min_nsb = None
+        self.max_nsb = None
+        self.illumination = None
         if obs_window_cfg:
-            self.source_zenith_max = obs_window_cfg.max_zenith_angle
-            self.source_alt_limit = 90 * u.deg - self.source_zenith_max
-            self.max_delay = obs_window_cfg.max_delay_to_event
-            self.min_duration = obs_window_cfg.min_window_duration
-            # ToBeUsed
-            self.min_nsb = obs_window_cfg.min_nsb
-            self.max_nsb = obs_window_cfg.max_nsb
-            self.illumination = obs_window_cfg.illumination
+            self.read_requirements(obs_window_cfg)
             self.test_dates = self.setup_time_window_search()
 
         # Filled by CalculateSourceSunMoon()
         self.sun_alts = None
         self.moon_alts = None
+        self.moon_azs = None
+        self.moon_phases = None
         self.source_alts = None
-        if self.ra and self.dec:
+        self.nsb = None
+        # altitude limit the source profile is exact for if it was taken from the index
+        self.source_alts_limit = None
+        if self.ra is not None and self.dec is not None:
             self.calculate_source_sun_moon()
 
         # filled by FindObservationWindow()
@@ -189,6 +544,9 @@ class ObservationWindow:
         self.end = None
         self.duration = 0
         self.all_valid_times = None
+        self.windows = np.zeros(0, dtype=gWindowDtype)
+        # [start, end] mjds of the adaptive and analytic search modes
+        self.valid_intervals = None
 
     def __str__(self):
         ''' formatted output of the observation window final values '''
@@ -196,120 +554,384 @@ class ObservationWindow:
             out = "\nOBSERVATION WINDOW:\n"
             out += "{: <30} : {:.2f}, {:.2f}\n".format("  * Ra, Dec", self.ra, self.dec)
             out += "{: <30} : {:.2f}\n".format("  * delay", self.delay)
-            out += "{: <30} : {}\n".format("  * start time", self.start)
-            out += "{: <30} : {}\n".format("  * end time", self.end)
+            out += "{: <30} : {}\n".format("  * start time", time_model.to_string(self.start))
+            out += "{: <30} : {}\n".format("  * end time", time_model.to_string(self.end))
             out += "{: <30} : {:.2f}\n".format("  * duration", self.duration)
             return out
 
         return "\n NO OBSERVATION WINDOW FOUND!\n"
 
+    def read_requirements(self, obs_window_cfg):
+        ''' reads the observability criteria from the science config '''
+        self.source_zenith_max = obs_window_cfg.max_zenith_angle
+        self.source_alt_limit = 90 * u.deg - self.source_zenith_max
+        self.max_delay = obs_window_cfg.max_delay_to_event
+        self.min_duration = obs_window_cfg.min_window_duration
+        # sky quality: observations under moonlight are allowed if a max. NSB or an
+        # illumination is given, see sky_quality_mask()
+        self.min_nsb = obs_window_cfg.min_nsb
+        self.max_nsb = obs_window_cfg.max_nsb
+        self.illumination = obs_window_cfg.illumination
+
+        self.search_mode = WindowSearchMode(obs_window_cfg.search_mode)
+        if obs_window_cfg.engine is not None:
+            self.engine = WindowEngine(obs_window_cfg.engine)
+        self.edge_tolerance = obs_window_cfg.edge_tolerance
+        if self.edge_tolerance is None:
+            self.edge_tolerance = gEdgeTolerance
+
     def setup_time_window_search(self):
         ''' prepares the grid of times where the observation window will be searched in.
         The range varies depending on the maximum allowed delay time. '''
         self.time_range_to_test = [-0.2 * self.max_delay, +1.5 * self.max_delay]
-        total_range_hours = self.time_range_to_test[1] - self.time_range_to_test[0]
-        n_steps = np.minimum(500, int(total_range_hours.value) * 25)
-
-        centerdate = Time(datetime(self.event_time.year, self.event_time.month,
-                                   self.event_time.day, self.event_time.hour))
+        centerdate = time_model.full_hour(self.event_time)
+        if self.search_mode is WindowSearchMode.adaptive:
+            time_range = time_window_offsets(self.max_delay, gCoarseStep)
+        elif self.search_mode is WindowSearchMode.analytic:
+            time_range = time_window_offsets(self.max_delay, gAnalyticStep)
+        else:
+            time_range = time_window_offsets(self.max_delay)
 
-        time_range = np.linspace(self.time_range_to_test[0].value,
-                                 self.time_range_to_test[1].value,
-                                 n_steps)
-
-        self.test_times = centerdate + time_range * u.hour
-        self.test_dates = None
-        try:
-            self.test_dates = np.array([date2num(x.datetime) for x in self.test_times])
-        except Exception as x:
-            print(x)
+        self.test_dates = centerdate + np.round(time_range * 3600e6).astype('timedelta64[us]')
+        self.test_mjds = time_model.to_mjd(self.test_dates)
 
         return self.test_dates
 
     def calculate_source_sun_moon(self):
         ''' caluclates the altitude profiles along the time range for the observation window search
         for the source position, moon and sun '''
+        if self.search_mode is WindowSearchMode.analytic or self.engine is WindowEngine.fast:
+            self.calculate_fast_profiles()
+            return
+        if self.engine is WindowEngine.astropy:
+            self.calculate_astropy_profiles()
+            return
+
         ra = self.ra
         dec = self.dec
+        test_mjds = self.test_mjds
 
-        position = SkyCoord(ra.value, dec.value, unit=ra.unit)
-        # print(position)
-
-        altaz_frame = AltAz(obstime=self.test_times, location=self.site.location)
-        sun_alt_azs = get_sun(self.test_times).transform_to(altaz_frame)
-        source_alt_az = position.transform_to(AltAz(obstime=self.test_times,
-                                                    location=self.site.location))
-
-        moon = ephem.Moon()
-        obs = ephem.Observer()
-        obs.lon = str(self.site.lon / u.deg)
-        obs.lat = str(self.site.lat / u.deg)
-        obs.elev = self.site.height / u.m
-
-        moon_alts = np.zeros_like(self.test_dates)
-        moon_azs = np.zeros_like(self.test_dates)
-        moon_phase = np.zeros_like(self.test_dates)
-
-        for ii, tt in enumerate(self.test_times):
-            obs.date = ephem.Date(tt.datetime)
-            moon.compute(obs)
-            moon_alts[ii] = moon.alt * 180. / np.pi
-            moon_azs[ii] = moon.az * 180. / np.pi
-            moon_phase[ii] = moon.phase
+        # the source is looked up from the observability index if its nights are calculated
+        sky_index = observability_index.get_site_index(self.site)
+        if sky_index.is_cached(test_mjds):
+            source_alts = sky_index.source_alts(ra, dec, test_mjds,
+                                                self.source_alt_limit)[0] * u.deg
+            self.source_alts_limit = self.source_alt_limit
+        else:
+            source_alts = self.fast_source_alt_az(test_mjds)[0] * u.deg
 
-        moon_alt_az = AltAz(alt=Angle(moon_alts, unit=u.deg),
-                            az=Angle(moon_azs, unit=u.deg),
-                            location=self.site.location, obstime=self.test_times)
+        # sun and moon only depend on the site and time: taken from the nightly cache
+        site_cache = ephemeris_cache.get_site_cache(self.site)
+        sun_alts, moon_alts, moon_azs, moon_phases = site_cache.profiles(test_mjds)
 
         # store information for plotting
-        self.sun_alts = sun_alt_azs.alt
-        self.source_alts = source_alt_az.alt
-        self.moon_alts = moon_alt_az.alt
+        self.sun_alts = sun_alts * u.deg
+        self.source_alts = source_alts
+        self.moon_alts = moon_alts * u.deg
+        self.moon_azs = moon_azs * u.deg
+        self.moon_phases = moon_phases
+
+    def calculate_fast_profiles(self):
+        ''' calculate_source_sun_moon() for the analytic search mode and the fast engine: all
+        altitudes are calculated with the fast_ephemeris functions and the altaz_engine. '''
+        profiles = fast_sun_moon_profiles(self.test_mjds, self.site)
+        sun_alts, moon_alts, moon_azs, moon_phases = profiles
+        source_alts, _ = self.fast_source_alt_az(self.test_mjds)
+
+        self.sun_alts = sun_alts * u.deg
+        self.source_alts = source_alts * u.deg
+        self.moon_alts = moon_alts * u.deg
+        self.moon_azs = moon_azs * u.deg
+        self.moon_phases = moon_phases
+
+    def calculate_astropy_profiles(self):
+        ''' calculate_source_sun_moon() for the astropy engine '''
+        profiles = astropy_sun_moon_profiles(self.test_mjds, self.site)
+        sun_alts, moon_alts, moon_azs, moon_phases = profiles
+        source_alts, _ = astropy_source_alt_az(self.ra, self.dec, self.test_mjds, self.site)
+
+        self.sun_alts = sun_alts * u.deg
+        self.source_alts = source_alts * u.deg
+        self.moon_alts = moon_alts * u.deg
+        self.moon_azs = moon_azs * u.deg
+        self.moon_phases = moon_phases
+
+    def copy_profiles(self, other):
+        ''' takes over the sun, moon and source profiles of the ObservationWindow 'other'
+        which has the same target, event time, site and time grid '''
+        self.sun_alts = other.sun_alts
+        self.moon_alts = other.moon_alts
+        self.moon_azs = other.moon_azs
+        self.moon_phases = other.moon_phases
+        self.source_alts = other.source_alts
+        self.source_alts_limit = other.source_alts_limit
+
+    def fast_source_alt_az(self, mjds):
+        ''' altitudes and azimuths (deg) of the source at the times 'mjds' (see altaz_engine) '''
+        return altaz_engine.source_alt_az(self.ra, self.dec, mjds, self.site)
+
+    def source_alt_az(self, mjds):
+        ''' altitudes and azimuths (deg) of the source at the times 'mjds' with the engine
+        of the window '''
+        if self.engine is WindowEngine.astropy:
+            return astropy_source_alt_az(self.ra, self.dec, mjds, self.site)
+        return self.fast_source_alt_az(mjds)
+
+    def sun_moon_profiles(self, mjds):
+        ''' sun altitudes, moon altitudes, moon azimuths (deg) and moon phases (percent)
+        at the times 'mjds' with the engine of the window '''
+        if self.engine is WindowEngine.fast:
+            return fast_sun_moon_profiles(mjds, self.site)
+        if self.engine is WindowEngine.astropy:
+            return astropy_sun_moon_profiles(mjds, self.site)
+        return ephemeris_cache.get_site_cache(self.site).profiles(mjds)
+
+    def moon_sky_mask(self, mjds, sun_alts, moon_alts, moon_azs, moon_phases):
+        ''' moon constraint at the times 'mjds' for the given sun and moon profiles (deg,
+        percent): the moon has to be down unless sky quality limits are configured, then
+        the sky quality constraints apply (see sky_quality_mask()). Returns the mask and
+        the NSB. '''
+        if not has_sky_quality_limits(self.min_nsb, self.max_nsb, self.illumination):
+            return np.asarray(moon_alts) < gMoonDown.to_value(u.deg), None
+
+        source_alts, source_azs = self.source_alt_az(mjds)
+        separations = sky_brightness.angular_separation(source_alts, source_azs, moon_alts,
+                                                        moon_azs)
+        nsb = night_sky_background(sun_alts, moon_alts, moon_phases, separations, source_alts)
+        mask = sky_quality_mask(moon_alts, moon_phases, nsb, self.min_nsb, self.max_nsb,
+                                self.illumination)
+        return mask, nsb
+
+    def sun_margin(self, mjds):
+        ''' distance (deg) of the sun below the darkness limit at the times 'mjds' '''
+        sun_alts, _ = fast_ephemeris.sun_alt_az(mjds, self.site.lat.to_value(u.deg),
+                                                self.site.lon.to_value(u.deg))
+        return gSunDown.to_value(u.deg) - sun_alts
+
+    def moon_margins(self, mjds):
+        ''' margins of the configured moon constraints at the times 'mjds', each positive
+        where its constraint is fulfilled: "moon" (deg of the moon below gMoonDown),
+        "illumination" (percent), "max_nsb" and "min_nsb" (dex). The margins have different
+        units, moon_intervals() combines their intervals as sky_quality_mask() does. '''
+        lat, lon = self.site.lat.to_value(u.deg), self.site.lon.to_value(u.deg)
+        height = self.site.height.to_value(u.m)
+        moon_alts, moon_azs, moon_phases = fast_ephemeris.moon_alt_az_phase(mjds, lat, lon, height)
+        margins = {"moon": gMoonDown.to_value(u.deg) - moon_alts}
+        if not has_sky_quality_limits(self.min_nsb, self.max_nsb, self.illumination):
+            return margins
+
+        sun_alts, _ = fast_ephemeris.sun_alt_az(mjds, lat, lon)
+        source_alts, source_azs = self.fast_source_alt_az(mjds)
+        separations = sky_brightness.angular_separation(source_alts, source_azs, moon_alts,
+                                                        moon_azs)
+        nsb = night_sky_background(sun_alts, moon_alts, moon_phases, separations, source_alts)
+
+        if self.illumination is not None:
+            margins["illumination"] = 100. * self.illumination - moon_phases
+        if self.max_nsb is not None:
+            max_nsb_ratios = (self.max_nsb / nsb).to_value(u.dimensionless_unscaled)
+            margins["max_nsb"] = np.log10(max_nsb_ratios)
+        if self.min_nsb is not None and self.min_nsb > 0:
+            min_nsb_ratios = (nsb / self.min_nsb).to_value(u.dimensionless_unscaled)
+            margins["min_nsb"] = np.log10(min_nsb_ratios)
+        return margins
+
+    def moon_intervals(self, mjds, tolerance):
+        ''' (n, 2) array of the [start, end] mjds where the moon constraints are fulfilled:
+        the crossings of each margin of moon_margins() are solved for separately and the
+        intervals are combined like the masks of sky_quality_mask() '''
+        margins = self.moon_margins(mjds)
+        intervals = {}
+        for name, values in margins.items():
+            def margin_function(test_mjds, name=name):
+                return self.moon_margins(test_mjds)[name]
+            intervals[name] = crossing_intervals(margin_function, mjds, values, tolerance)
+
+        moon_intervals = intervals["moon"]
+        if "illumination" in intervals:
+            moon_intervals = union_intervals(moon_intervals, intervals["illumination"])
+        elif "max_nsb" in intervals:
+            moon_intervals = np.array([[mjds[0], mjds[-1]]])
+        for name in ["max_nsb", "min_nsb"]:
+            if name in intervals:
+                moon_intervals = intersect_intervals(moon_intervals, intervals[name])
+        return moon_intervals
+
+    def source_margin(self, mjds):
+        ''' distance (deg) of the source above the zenith limit at the times 'mjds' '''
+        source_alts, _ = self.fast_source_alt_az(mjds)
+        return source_alts - self.source_alt_limit.to_value(u.deg)
+
+    def sun_mask(self, mjds):
+        ''' sun constraint at the times 'mjds' '''
+        sun_alts = self.sun_moon_profiles(mjds)[0]
+        return sun_alts < gSunDown.to_value(u.deg)
+
+    def moon_mask(self, mjds):
+        ''' moon constraint at the times 'mjds' '''
+        profiles = self.sun_moon_profiles(mjds)
+        return self.moon_sky_mask(mjds, *profiles)[0]
+
+    def source_mask(self, mjds):
+        ''' source altitude constraint at the times 'mjds' '''
+        source_alts, _ = self.source_alt_az(mjds)
+        return source_alts > self.source_alt_limit.to_value(u.deg)
+
+    def find_valid_intervals(self):
+        ''' adaptive search: the valid intervals of each constraint are taken from the
+        coarse grid, their edges are refined to the edge tolerance and the intervals of
+        all constraints are intersected. Returns an (n, 2) array of [start, end] mjds. '''
+        mjds = self.test_mjds
+        tolerance = self.edge_tolerance.to_value(u.day)
+
+        sun_intervals = mask_intervals(mjds, np.asarray(self.sun_alts < gSunDown),
+                                       self.sun_mask, tolerance)
+        moon_intervals = mask_intervals(mjds, self.moon_mask(mjds), self.moon_mask, tolerance)
+        source_mask = np.asarray(self.source_alts > self.source_alt_limit)
+        source_intervals = mask_intervals(mjds, source_mask, self.source_mask, tolerance)
+
+        dark_intervals = intersect_intervals(sun_intervals, moon_intervals)
+        return intersect_intervals(dark_intervals, source_intervals)
+
+    def find_analytic_intervals(self):
+        ''' analytic search: the crossings of the sun, moon and zenith limits are
+        bracketed on the coarse grid and solved for to the edge tolerance, the intervals
+        of all constraints are intersected. Returns an (n, 2) array of [start, end] mjds. '''
+        mjds = self.test_mjds
+        tolerance = self.edge_tolerance.to_value(u.day)
+
+        sun_intervals = crossing_intervals(self.sun_margin, mjds,
+                                           (gSunDown - self.sun_alts).to_value(u.deg), tolerance)
+        moon_intervals = self.moon_intervals(mjds, tolerance)
+        source_margins = (self.source_alts - self.source_alt_limit).to_value(u.deg)
+        source_intervals = crossing_intervals(self.source_margin, mjds, source_margins, tolerance)
+
+        dark_intervals = intersect_intervals(sun_intervals, moon_intervals)
+        return intersect_intervals(dark_intervals, source_intervals)
+
+    def intervals_on_grid(self, mjds):
+        ''' (n, 2) array of the [start, end] mjds where all constraints are fulfilled,
+        searched on the grid 'mjds' with the search mode of this window. Unlike
+        find_valid_intervals() and find_analytic_intervals() the profiles are calculated
+        for 'mjds' instead of being taken from the time grid of the window. '''
+        tolerance = self.edge_tolerance.to_value(u.day)
+        if self.search_mode is WindowSearchMode.analytic:
+            sun_intervals = crossing_intervals(self.sun_margin, mjds, self.sun_margin(mjds),
+                                               tolerance)
+            moon_intervals = self.moon_intervals(mjds, tolerance)
+            source_intervals = crossing_intervals(self.source_margin, mjds,
+                                                  self.source_margin(mjds), tolerance)
+        else:
+            refine = self.search_mode is WindowSearchMode.adaptive
+            sun_intervals = mask_intervals(mjds, self.sun_mask(mjds),
+                                           self.sun_mask if refine else None, tolerance)
+            moon_intervals = mask_intervals(mjds, self.moon_mask(mjds),
+                                            self.moon_mask if refine else None, tolerance)
+            source_intervals = mask_intervals(mjds, self.source_mask(mjds),
+                                              self.source_mask if refine else None, tolerance)
+
+        dark_intervals = intersect_intervals(sun_intervals, moon_intervals)
+        return intersect_intervals(dark_intervals, source_intervals)
+
+    def night_step(self):
+        ''' grid step (days) of the night by night search for the search mode '''
+        if self.search_mode is WindowSearchMode.adaptive:
+            return gCoarseStep.to_value(u.day)
+        if self.search_mode is WindowSearchMode.analytic:
+            return gAnalyticStep.to_value(u.day)
+        return gNightGridStep.to_value(u.day)
+
+    def iterate_windows(self, now, n_nights=None):
+        ''' generator of the observation windows after 'now', night by night (local noon to
+        local noon, when the sun is up at the sites). Each night is only calculated when
+        the iteration reaches it, so the caller can stop early. Yields entries of
+        gWindowDtype (start, end, duration in hours). Without 'n_nights', the windows
+        starting up to the max. delay after the event are returned. '''
+        now_mjd = time_model.to_mjd(now)
+        last_mjd = np.inf
+        if n_nights is None:
+            last_mjd = time_model.to_mjd(self.event_time) + self.max_delay.to_value(u.day)
+
+        noon_offset = 0.5 - self.site.lon.to_value(u.deg) / 360.
+        night = int(np.floor(now_mjd - noon_offset))
+        step = self.night_step()
+        n_steps = int(np.ceil(1. / step)) + 1
+        n_searched = 0
+        while n_nights is None or n_searched < n_nights:
+            night_start = night + noon_offset
+            if night_start > last_mjd:
+                return
+            mjds = np.linspace(night_start, night_start + 1., n_steps)
+
+            intervals = self.intervals_on_grid(mjds)
+            intervals = intervals[(intervals[:, 1] > now_mjd) & (intervals[:, 0] <= last_mjd)]
+            if len(intervals):
+                intervals[:, 0] = np.maximum(intervals[:, 0], now_mjd)
+                for window in windows_from_intervals(time_model.from_mjd(intervals[:, 0]),
+                                                     time_model.from_mjd(intervals[:, 1])):
+                    yield window
+
+            night += 1
+            n_searched += 1
 
     def find_observation_window(self, now):
         ''' actual application of the visibility constraints given by the science config at
         time 'now' '''
+        if self.search_mode is WindowSearchMode.adaptive:
+            return self.find_interval_observation_window(self.find_valid_intervals(), now)
+        if self.search_mode is WindowSearchMode.analytic:
+            return self.find_interval_observation_window(self.find_analytic_intervals(), now)
 
         sun_mask = self.sun_alts < gSunDown
-        moon_mask = self.moon_alts < gMoonDown
+        moon_mask, self.nsb = self.moon_sky_mask(self.test_mjds, self.sun_alts.to_value(u.deg),
+                                                 self.moon_alts.to_value(u.deg),
+                                                 self.moon_azs.to_value(u.deg), self.moon_phases)
         source_mask = self.source_alts > self.source_alt_limit
-        all_masks = sun_mask & moon_mask & source_mask
-        valid_dates = self.test_dates[all_masks]
+        all_masks = np.asarray(sun_mask & moon_mask & source_mask)
 
-        good_obs_times = [num2date(d) for d in valid_dates]
-
-        if len(good_obs_times) is 0:
-            # print "No observation Window found!"
+        if not np.any(all_masks):
             # print("No observation Window in darktime found!")
             return False
 
-        ar_obstimes = np.array([o.replace(tzinfo=None) for o in good_obs_times])
-        future = ar_obstimes > now
-        fut_obstimes = ar_obstimes[future]
-
-        if len(fut_obstimes) is 0:
+        future_masks = all_masks & (self.test_dates > time_model.to_datetime64(now))
+        if not np.any(future_masks):
             print("no observation window > alert time in darktime")
             return False
 
-        fut_window = fut_obstimes
+        # gaps between valid samples of up to one hour are bridged
+        starts, ends = run_intervals(self.test_dates, future_masks)
+        self.windows = windows_from_intervals(starts, ends)
+        self.all_valid_times = self.test_dates[future_masks]
+        self.set_first_window()
 
-        # get delay, start and end time of the window
-        obs_delay = round((fut_window[0] - self.event_time).total_seconds() / 60. / 60., 3)
-        self.delay = Quantity(obs_delay * u.hour)
-        start_time = fut_window[0].replace(tzinfo=None)
-        self.start = start_time
-        end_time = fut_window[-1].replace(tzinfo=None)
-        self.end = end_time
+        return True
 
-        for i in range(len(fut_obstimes) - 1):
-            delta = (fut_window[i + 1] - fut_window[i]).total_seconds()
-            if delta > 1. * 60. * 60.:
-                end_time = fut_window[i].replace(tzinfo=None)
-                break
+    def set_first_window(self):
+        ''' delay, start time and duration of the first of the found windows. The end time
+        is the last valid time of the search range (the end of the last window). '''
+        first = self.windows[0]
+        obs_delay = round(time_model.hours_between(self.event_time, first['start']), 3)
+        self.delay = Quantity(obs_delay * u.hour)
+        self.start = first['start']
+        self.end = self.windows[-1]['end']
+        self.duration = Quantity(first['duration'] * u.hour)
+
+    def find_interval_observation_window(self, valid_intervals, now):
+        ''' find_observation_window() for the search modes that provide the (n, 2) array
+        of [start, end] mjds 'valid_intervals' where all constraints are fulfilled '''
+        self.valid_intervals = valid_intervals
+        now_mjd = time_model.to_mjd(now)
+        future = self.valid_intervals[self.valid_intervals[:, 1] > now_mjd]
+        if len(future) == 0:
+            print("no observation window > alert time in darktime")
+            return False
 
-        obs_dur = (end_time - start_time).total_seconds() / 60. / 60.
-        self.duration = Quantity(obs_dur * u.hour)
-        self.all_valid_times = fut_window
+        future[0, 0] = max(future[0, 0], now_mjd)
+        starts = time_model.from_mjd(future[:, 0])
+        ends = time_model.from_mjd(future[:, 1])
+        self.windows = windows_from_intervals(starts, ends)
+        self.all_valid_times = time_model.from_mjd(future.ravel())
+        self.set_first_window()
 
         return True
 
@@ -322,7 +944,7 @@ class ObservationWindow:
 
         self.ra = ra
         self.dec = dec
-        self.event_time = time
+        self.event_time = time_model.to_datetime64(time)
         self.site = site
 
         self.source_zenith_max = zenith_max
@@ -346,13 +968,13 @@ class ObservationWindow:
             print("ObservationWindowTest: Delay of the found window is incorrect!")
             print("... Got:", self.delay, "Expected:", expected_delay)
             delay_ok = False
-        if not (expected_start - self.start).total_seconds() < 2:
-            print((expected_start - self.start).total_seconds())
+        if not time_model.hours_between(self.start, expected_start) * 3600. < 2:
+            print(time_model.hours_between(self.start, expected_start) * 3600.)
             print("ObservationWindowTest: Start Time of the found window is incorrect!")
             print("... Got:", self.start, "Expected:", expected_start)
             start_ok = False
-        if not (expected_end - self.end).total_seconds() < 2:
-            print((expected_end - self.end).total_seconds())
+        if not time_model.hours_between(self.end, expected_end) * 3600. < 2:
+            print(time_model.hours_between(self.end, expected_end) * 3600.)
             print("ObservationWindowTest: End Time of the found window is incorrect!")
             print("... Got:", self.end, "Expected:", expected_end)
             end_ok = False
@@ -369,3 +991,286 @@ class ObservationWindow:
 
         print("ObservationWindowTest: all tests passed.")
         return True
+
+
+def iterate_observation_windows(ra, dec, event_time, site, obs_window_cfg, now, n_nights=None):
+    ''' generator of the observation windows of the target 'ra', 'dec' after 'now',
+    night by night (see ObservationWindow.iterate_windows()). The profiles along the
+    full time grid of the window search are not calculated. '''
+    obs_window = ObservationWindow(event_time=event_time, observatory_site=site,
+                                   obs_window_cfg=obs_window_cfg)
+    obs_window.ra = ra
+    obs_window.dec = dec
+    return obs_window.iterate_windows(now, n_nights)
+
+
+def quantity_key(quantity, unit):
+    ''' hashable value of an optional Quantity for the ObservationWindowMemo '''
+    if quantity is None:
+        return None
+    return float(quantity.to_value(unit))
+
+
+class ObservationWindowMemo:
+    ''' memoization of the observation windows of one alert for all matched science configs.
+
+        Windows are keyed on the target, time, site and all requirements that enter the
+        window search; configs with equal requirements share one ObservationWindow.
+        Configs that only differ in the constraints (zenith limit, sky quality) reuse
+        the sun, moon and source profiles of the first window with the same time grid.
+
+        The hit and miss counts of both levels are kept in window_hits, window_misses,
+        profile_hits and profile_misses.
+    '''
+    def __init__(self):
+        self.windows = {}
+        self.profiles = {}
+        self.window_hits = 0
+        self.window_misses = 0
+        self.profile_hits = 0
+        self.profile_misses = 0
+
+    def __str__(self):
+        out = "{: <30} : {}, {}\n".format("  * Window memo hits, misses", self.window_hits,
+                                          self.window_misses)
+        out += "{: <30} : {}, {}\n".format("  * Profile memo hits, misses", self.profile_hits,
+                                           self.profile_misses)
+        return out
+
+    def get_window(self, ra, dec, time, site, obs_window_cfg, now):
+        ''' returns the ObservationWindow of the target 'ra', 'dec' at 'time' and 'site' for
+        the requirements 'obs_window_cfg' searched at 'now', and if a window was found '''
+        profile_key = (quantity_key(ra, u.deg), quantity_key(dec, u.deg), time, site.name,
+                       quantity_key(obs_window_cfg.max_delay_to_event, u.hour),
+                       obs_window_cfg.search_mode, obs_window_cfg.engine)
+        window_key = profile_key + (now,
+                                    quantity_key(obs_window_cfg.max_zenith_angle, u.deg),
+                                    quantity_key(obs_window_cfg.min_nsb, u.Hz),
+                                    quantity_key(obs_window_cfg.max_nsb, u.Hz),
+                                    obs_window_cfg.illumination,
+                                    quantity_key(obs_window_cfg.edge_tolerance, u.s))
+
+        if window_key in self.windows:
+            self.window_hits += 1
+            return self.windows[window_key]
+        self.window_misses += 1
+
+        source_alt_limit = 90 * u.deg - obs_window_cfg.max_zenith_angle
+        shared = self.profiles.get(profile_key)
+        if shared is not None and (shared.source_alts_limit is None
+                                   or shared.source_alts_limit == source_alt_limit):
+            self.profile_hits += 1
+            obs_window = ObservationWindow(event_time=time, observatory_site=site,
+                                           obs_window_cfg=obs_window_cfg)
+            obs_window.ra = ra
+            obs_window.dec = dec
+            obs_window.copy_profiles(shared)
+        else:
+            self.profile_misses += 1
+            obs_window = ObservationWindow(ra, dec, time, site, obs_window_cfg)
+            self.profiles[profile_key] = obs_window
+
+        result = (obs_window, obs_window.find_observation_window(now))
+        self.windows[window_key] = result
+        return result
+
+
+class ObservationWindowBatch:
+    ''' Observation windows for many targets at once, e.g. for tiling and wobble searches.
+
+        Takes N target positions and either one event time shared by all targets or
+        N event times (one per position). The time grid and the sun and moon profiles
+        are shared, all targets are transformed in one vectorized AltAz call and the
+        window parameters are returned as arrays with one entry per target:
+         * delays, durations: Quantity arrays in hours (inf and 0 without window)
+         * starts, ends: datetime64 arrays (NaT without window)
+
+        Only the grid search with the cached engine is vectorized. With another search
+        mode or engine in the config, the window of each target is searched by its own
+        ObservationWindow, so the results are the same as for single targets.
+    '''
+
+    def __init__(self, ras, decs, event_times=None, observatory_site=None, obs_window_cfg=None):
+        ''' ras and decs are Quantity arrays of the N target positions. '''
+        self.ras = np.atleast_1d(ras)
+        self.decs = np.atleast_1d(decs)
+
+        if event_times is None:
+            event_times = time_model.utc_now()
+        self.event_times = np.atleast_1d(time_model.to_datetime64(event_times))
+
+        self.site = observatory_site
+        if not self.site:
+            self.site = observatories.CTANorth()
+
+        self.source_zenith_max = obs_window_cfg.max_zenith_angle
+        self.source_alt_limit = 90 * u.deg - self.source_zenith_max
+        self.max_delay = obs_window_cfg.max_delay_to_event
+        self.min_nsb = obs_window_cfg.min_nsb
+        self.max_nsb = obs_window_cfg.max_nsb
+        self.illumination = obs_window_cfg.illumination
+        self.obs_window_cfg = obs_window_cfg
+        self.search_mode = WindowSearchMode(obs_window_cfg.search_mode)
+        self.engine = WindowEngine.cached
+        if obs_window_cfg.engine is not None:
+            self.engine = WindowEngine(obs_window_cfg.engine)
+
+        # ObservationWindow of each target if the search is not vectorized
+        self.target_windows = None
+        self.test_mjds = None
+
+        # Filled by calculate_source_sun_moon(), shape (N, n_times) or (1, n_times)
+        self.sun_alts = None
+        self.moon_alts = None
+        self.moon_azs = None
+        self.moon_phases = None
+        self.source_alts = None
+        if self.search_mode is WindowSearchMode.grid and self.engine is WindowEngine.cached:
+            self.test_mjds = self.setup_time_window_search()
+            self.calculate_source_sun_moon()
+        else:
+            self.target_windows = [ObservationWindow(self.ras[index], self.decs[index],
+                                                     self.event_time(index), self.site,
+                                                     obs_window_cfg)
+                                   for index in range(len(self.ras))]
+
+        # filled by find_observation_windows()
+        n_targets = len(self.ras)
+        self.valid = np.zeros(n_targets, dtype=bool)
+        self.delays = np.full(n_targets, np.inf) * u.hour
+        self.starts = np.full(n_targets, np.datetime64('NaT'), dtype='datetime64[us]')
+        self.ends = np.full(n_targets, np.datetime64('NaT'), dtype='datetime64[us]')
+        self.durations = np.zeros(n_targets) * u.hour
+        self.valid_masks = None
+
+    def event_time(self, index):
+        ''' event time of the target 'index' '''
+        return self.event_times[min(index, len(self.event_times) - 1)]
+
+    def setup_time_window_search(self):
+        ''' prepares the grid of times (mjd), shared by all targets if there is a single
+        event time '''
+        offsets = time_window_offsets(self.max_delay) / 24.
+        center_mjds = time_model.to_mjd(time_model.full_hour(self.event_times))
+        return np.atleast_1d(center_mjds)[:, np.newaxis] + offsets[np.newaxis, :]
+
+    def calculate_source_sun_moon(self):
+        ''' calculates the altitude profiles of all targets, the sun and the moon.
+        For many targets (see gIndexMinTargets) the observability index is used. '''
+        if len(self.ras) >= gIndexMinTargets:
+            sky_index = observability_index.get_site_index(self.site)
+            source_alts = sky_index.source_alts(self.ras, self.decs, self.test_mjds,
+                                                self.source_alt_limit) * u.deg
+        else:
+            source_alts = altaz_engine.source_alt_az(self.ras[:, np.newaxis],
+                                                     self.decs[:, np.newaxis],
+                                                     self.test_mjds, self.site)[0] * u.deg
+
+        site_cache = ephemeris_cache.get_site_cache(self.site)
+        sun_alts, moon_alts, moon_azs, moon_phases = site_cache.profiles(self.test_mjds)
+
+        self.sun_alts = sun_alts * u.deg
+        self.moon_alts = moon_alts * u.deg
+        self.moon_azs = moon_azs * u.deg
+        self.moon_phases = moon_phases
+        self.source_alts = source_alts
+
+    def moon_sky_mask(self):
+        ''' moon constraint of all targets, see ObservationWindow.moon_sky_mask() '''
+        if not has_sky_quality_limits(self.min_nsb, self.max_nsb, self.illumination):
+            return self.moon_alts < gMoonDown
+
+        source_alts, source_azs = altaz_engine.source_alt_az(self.ras[:, np.newaxis],
+                                                             self.decs[:, np.newaxis],
+                                                             self.test_mjds, self.site)
+        moon_alts = self.moon_alts.to_value(u.deg)
+        separations = sky_brightness.angular_separation(source_alts, source_azs, moon_alts,
+                                                        self.moon_azs.to_value(u.deg))
+        nsb = night_sky_background(self.sun_alts.to_value(u.deg), moon_alts, self.moon_phases,
+                                   separations, source_alts)
+        return sky_quality_mask(moon_alts, self.moon_phases, nsb, self.min_nsb, self.max_nsb,
+                                self.illumination)
+
+    def find_observation_windows(self, now):
+        ''' application of the visibility constraints at time 'now' (a single
+        time or one per target) for all targets at once. Like for the ObservationWindow
+        the first window after 'now' is selected, its duration ends at the first gap of
+        more than one hour and the end time is the last valid time of the search range.
+        Returns the boolean array of targets with a valid window. '''
+        if self.target_windows is not None:
+            return self.find_target_windows(now)
+
+        test_mjds = np.broadcast_to(self.test_mjds, self.source_alts.shape)
+        now_mjds = np.atleast_1d(time_model.to_mjd(now))
+
+        sun_mask = self.sun_alts < gSunDown
+        moon_mask = self.moon_sky_mask()
+        source_mask = self.source_alts > self.source_alt_limit
+        future_mask = test_mjds > now_mjds[:, np.newaxis]
+        valid_masks = sun_mask & moon_mask & source_mask & future_mask
+        self.valid_masks = valid_masks
+
+        has_window = np.any(valid_masks, axis=1)
+        n_times = test_mjds.shape[1]
+        first = np.argmax(valid_masks, axis=1)
+
+        # time of the last valid sample up to each sample, to find gaps > 1 hour
+        last_valid = np.maximum.accumulate(np.where(valid_masks, test_mjds, -np.inf), axis=1)
+        previous_valid = np.concatenate([np.full((len(test_mjds), 1), -np.inf), last_valid[:, :-1]],
+                                        axis=1)
+        after_first = np.arange(n_times)[np.newaxis, :] > first[:, np.newaxis]
+        gaps = valid_masks & after_first & (test_mjds - previous_valid > 1. / 24.)
+        first_gap = np.where(np.any(gaps, axis=1), np.argmax(gaps, axis=1), n_times)
+
+        rows = np.arange(len(test_mjds))
+        start_mjds = np.where(has_window, test_mjds[rows, first], 0.)
+        end_mjds = np.where(has_window, last_valid[rows, first_gap - 1], 0.)
+        last_mjds = np.where(has_window, last_valid[:, -1], 0.)
+
+        event_mjds = time_model.to_mjd(self.event_times)
+        delays = np.round((start_mjds - event_mjds) * 24., 3)
+
+        self.valid = has_window
+        self.delays = np.where(has_window, delays, np.inf) * u.hour
+        self.durations = np.where(has_window, (end_mjds - start_mjds) * 24., 0.) * u.hour
+        self.starts = np.where(has_window, time_model.from_mjd(start_mjds), np.datetime64('NaT'))
+        self.ends = np.where(has_window, time_model.from_mjd(last_mjds), np.datetime64('NaT'))
+
+        return has_window
+
+    def find_target_windows(self, now):
+        ''' find_observation_windows() with the search mode and engine of the config:
+        the window of each target is searched on its own '''
+        now_times = np.atleast_1d(time_model.to_datetime64(now))
+        for index, window in enumerate(self.target_windows):
+            now_time = now_times[min(index, len(now_times) - 1)]
+            self.valid[index] = window.find_observation_window(now_time)
+            if self.valid[index]:
+                self.delays[index] = window.delay
+                self.starts[index] = window.start
+                self.ends[index] = window.end
+                self.durations[index] = window.duration
+
+        return self.valid
+
+    def window(self, index):
+        ''' ObservationWindow object of the target 'index' (e.g. for applying cuts) '''
+        if self.target_windows is not None:
+            return self.target_windows[index]
+
+        window = ObservationWindow(event_time=self.event_time(index), observatory_site=self.site)
+        window.ra = self.ras[index]
+        window.dec = self.decs[index]
+        window.read_requirements(self.obs_window_cfg)
+        if self.valid[index]:
+            test_mjds = np.broadcast_to(self.test_mjds, self.source_alts.shape)[index]
+            window.delay = self.delays[index]
+            window.start = self.starts[index]
+            window.end = self.ends[index]
+            window.duration = self.durations[index]
+            window.all_valid_times = time_model.from_mjd(test_mjds[self.valid_masks[index]])
+        return window
+
+    def windows(self):
+        ''' ObservationWindow objects for all targets '''
+        return [self.window(index) for index in range(len(self.ras))]
@@ -0,0 +1,69 @@
+'''
+Predicate Graph Module
+
+Many science configs share cuts, e.g. max_delay < 10 h or the same threshold on an
+alert parameter, and listen to the same alert types. The loaded configs are compiled
+into a graph of their distinct predicates (cut value, comparison and threshold, see
+cuts.CompiledCut.predicate_key) and their alert types:
+ * every distinct common cut is evaluated once per alert (and observation window), the
+   other configs take over its result from the shared cuts.SharedResults
+ * every distinct alert type is compared once to the ivorn of an alert
+
+The cost per alert therefore grows with the number of distinct predicates rather than
+with the number of configs. Custom cuts are not shared, they get the science config.
+'''
+
+from collections import OrderedDict
+
+from alert_processor import cuts
+
+
+class PredicateGraph:
+    ''' distinct predicates and alert types of all loaded science configs.
+
+        Main functions are:
+         * match(): the science configs an alert is allowed for
+         * start_alert(): clears the shared results of the previous alert
+    '''
+    def __init__(self, science_configs):
+        self.results = cuts.SharedResults()
+        # predicate key -> compiled cuts of all configs
+        self.predicates = OrderedDict()
+        # alert type -> (config index, type index, science config) of the configs allowing it
+        self.alert_types = OrderedDict()
+        self.n_configs = len(science_configs)
+        self.n_cuts = 0
+
+        for config_index, science_case in enumerate(science_configs):
+            for type_index, allowed_type in enumerate(science_case.allowed_alert_types):
+                type_configs = self.alert_types.setdefault(allowed_type.alert_type, [])
+                type_configs.append((config_index, type_index, science_case))
+
+            cut_collection = science_case.cut_collection
+            cut_collection.shared_results = self.results
+            for compiled_cut in cut_collection.common_plan:
+                if compiled_cut.predicate_key is not None:
+                    self.predicates.setdefault(compiled_cut.predicate_key, []).append(compiled_cut)
+                    self.n_cuts += 1
+
+    def __str__(self):
+        out = "{: <30} : {}\n".format("  * Predicate graph configs", self.n_configs)
+        out += "{: <30} : {}, {}\n".format("  * Common cuts, predicates", self.n_cuts,
+                                           len(self.predicates))
+        out += "{: <30} : {}, {}\n".format("  * Evaluated, shared", len(self.results),
+                                           self.results.hits)
+        return out
+
+    def start_alert(self):
+        ''' clears the results of the previous alert '''
+        self.results.clear()
+
+    def match(self, ivorn):
+        ''' science configs allowing the alert 'ivorn', once per matching allowed alert
+        type and in the order of the configs, like match_science_configurations() '''
+        entries = []
+        for alert_type, type_entries in self.alert_types.items():
+            if alert_type in ivorn:
+                entries.extend(type_entries)
+        entries.sort(key=lambda entry: entry[:2])
+        return [entry[2] for entry in entries]
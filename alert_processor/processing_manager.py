@@ -4,20 +4,49 @@ This module handles the different processing steps of:
 - matching science cases and the alert
 - initiation of the core processing
 - finalization after the core processing (e.g. reporting and communication)
+
+The observation windows and the cuts depending on them are evaluated for every
+site of the site configuration. Alert parsing, matching and the site independent
+cuts are done once; with several sites the sites are evaluated in parallel in a
+pool of single-process workers. Each site is pinned to one worker, so that the sun and
+moon profiles kept warm there are used by the next alert. Each follow-up opportunity keeps the decision of every site and the
+best site (accepted, with the shortest delay), whose results are used afterwards.
 '''
 
+import copy
+import time as timer
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import astropy.units as u
 from astropy.units import Quantity
 
 import communicator.communicator as cmn
 from alert_processor import observation_windows
-from utilities.observatories import CTANorth
+from alert_processor import ephemeris_cache
+from alert_processor import darkness_almanac
+from alert_processor import observability_index
+from alert_processor import warm_up
+from alert_processor import visibility_prefilter
+from alert_processor import predicate_graph
+from alert_processor import custom_cut_pool
+from alert_processor import time_model
+from utilities.observatories import CTANorth, get_site
+
+# single-process workers of the site evaluation, created on first use
+gSiteWorkers = []
 
 
 # copied here from core_processing
 def find_observation_window(sci_alert, case,
-                            custom_ra=None, custom_dec=None, custom_unit=None, custom_time=None):
-    ''' function that triggers the calculation of observation windows '''
+                            custom_ra=None, custom_dec=None, custom_unit=None, custom_time=None,
+                            window_memo=None, site=None):
+    ''' function that triggers the calculation of observation windows at 'site' (CTANorth
+    by default). With a 'window_memo' (observation_windows.ObservationWindowMemo) windows are
+    shared between science configs with the same requirements. '''
+    if site is None:
+        site = CTANorth()
+
     ra = sci_alert.coords.ra * u.Unit(sci_alert.coords.units)
     dec = sci_alert.coords.dec * u.Unit(sci_alert.coords.units)
     time = sci_alert.alert_received_time
@@ -30,9 +59,24 @@ def find_observation_window(sci_alert, case,
         time = custom_time
 
     obs_window_reqs = case.obsevation_window_reqs
-    obs_window = observation_windows.ObservationWindow(ra, dec, time,
-                                                       CTANorth(), obs_window_reqs)
-    valid_window = obs_window.find_observation_window(time.replace(tzinfo=None))
+
+    # targets that can not be visible get an empty window without searching
+    reject_reason = visibility_prefilter.gPrefilter.reject(dec, time, time, site, obs_window_reqs)
+    if reject_reason is not None:
+        print("No observation window possible (%s). Continuing!" % reject_reason)
+        obs_window = observation_windows.ObservationWindow(event_time=time, observatory_site=site,
+                                                           obs_window_cfg=obs_window_reqs)
+        obs_window.ra = ra
+        obs_window.dec = dec
+        return obs_window
+
+    if window_memo is not None:
+        obs_window, valid_window = window_memo.get_window(ra, dec, time, site, obs_window_reqs,
+                                                          time)
+    else:
+        obs_window = observation_windows.ObservationWindow(ra, dec, time,
+                                                           site, obs_window_reqs)
+        valid_window = obs_window.find_observation_window(time)
     if not valid_window:
         print("No valid observation window found. Continuing!")
 
@@ -40,22 +84,61 @@ def find_observation_window(sci_alert, case,
 
     return obs_window
 
+
+def find_observation_windows(sci_alert, case, custom_ras, custom_decs, custom_times=None,
+                             site=None):
+    ''' function that calculates the observation windows of many positions at once
+    (e.g. for tiling or wobble searches) at 'site' (CTANorth by default). 'custom_times'
+    can be a single time or one per position, the alert received time is used if it is not given.
+    Returns a list of ObservationWindow objects, one per position. '''
+    times = custom_times
+    if times is None:
+        times = sci_alert.alert_received_time
+    if site is None:
+        site = CTANorth()
+
+    obs_window_reqs = case.obsevation_window_reqs
+    batch = observation_windows.ObservationWindowBatch(custom_ras, custom_decs, times,
+                                                       site, obs_window_reqs)
+    batch.find_observation_windows(times)
+
+    return batch.windows()
+
+
+def process_site_independent_cuts(sci_alert, science_case):
+    ''' applies the cuts that do not need the observation window, once for all sites '''
+    if not science_case.cut_collection.execute_site_independent_cuts(sci_alert, science_case):
+        print("  --> %s: cut failed before the observation window search." % science_case.name)
+
+
 # copied here from core_processing
-def process_cases(sci_alert, science_case):
+def process_cases(sci_alert, science_case, window_memo=None, site=None):
     '''function that cycles trhough the appropriate combinations
-       of science alerts and science configs '''
+       of science alerts and science configs at 'site' (CTANorth by default).
+       The site independent cuts have to be applied before (process_site_independent_cuts).
+       If one of them failed, the observation window is not searched. '''
+    if site is None:
+        site = CTANorth()
 
     print("\n -------------")
-    print("  HANDLING: %s" % science_case.name)
+    print("  HANDLING: %s (%s)" % (science_case.name, site.name))
     print(" -------------- \n")
 
-    valid_window = find_observation_window(sci_alert, science_case)
+    cut_collection = science_case.cut_collection
+    if not cut_collection.needs_window():
+        science_case.observation_window = observation_windows.ObservationWindow(
+            event_time=sci_alert.alert_received_time, observatory_site=site)
+        print("  --> Cuts failed before the observation window search. -> No action.")
+        return
+
+    valid_window = find_observation_window(sci_alert, science_case, window_memo=window_memo,
+                                           site=site)
     science_case.observation_window = valid_window
 
     # apply cuts
     print("CUTS:")
 
-    science_case.cut_collection.execute(sci_alert, valid_window, science_case)
+    cut_collection.execute_site_dependent_cuts(sci_alert, valid_window, science_case)
 
     all_applied_cuts_results = science_case.cut_collection.result()
 
@@ -65,6 +148,80 @@ def process_cases(sci_alert, science_case):
         print("  --> All cuts passed. -> Initiating further actions.")
 
 
+def evaluate_site(site_name, cases, window_memo=None):
+    ''' evaluates the observation windows and site dependent cuts of the (sci_alert,
+    science_case) pairs 'cases' at the site 'site_name'. The cases are modified (in the
+    site workers they are copies). Returns one SiteDecision per case. '''
+    site = get_site(site_name)
+    if window_memo is None:
+        window_memo = observation_windows.ObservationWindowMemo()
+
+    decisions = []
+    for sci_alert, science_case in cases:
+        process_cases(sci_alert, science_case, window_memo, site)
+        decisions.append(SiteDecision(site.name, sci_alert, science_case))
+    print(window_memo)
+    print(visibility_prefilter.gPrefilter)
+
+    return decisions
+
+
+def keep_site_warm(site_name, time):
+    ''' prepares the sun and moon profiles and the sky index of a site for the next alerts '''
+    site = get_site(site_name)
+    ephemeris_cache.keep_warm(site, time)
+    observability_index.keep_warm(site, time)
+
+
+def report_warm_failure(future):
+    ''' done callback of keep_site_warm() in a site worker, prints its failure '''
+    if not future.cancelled() and future.exception() is not None:
+        print("WARNING: keeping the site warm failed: %s" % future.exception())
+
+
+def get_site_workers(n_workers, iers_path=None, leap_second_path=None):
+    ''' returns the 'n_workers' single-process executors of the site evaluation, creating
+    them on first use. The IERS tables of the workers are set up as in
+    warm_up.configure_iers(). '''
+    while len(gSiteWorkers) < n_workers:
+        gSiteWorkers.append(ProcessPoolExecutor(max_workers=1, initializer=warm_up.configure_iers,
+                                                initargs=(iers_path, leap_second_path)))
+    return gSiteWorkers[:n_workers]
+
+
+class SiteDecision:
+    ''' result of a follow-up opportunity at one site: the observation window,
+    the cuts and the custom observation coordinates evaluated there. '''
+    def __init__(self, site_name, sci_alert, science_case):
+        self.site_name = site_name
+        self.observation_window = science_case.observation_window
+        self.cut_collection = science_case.cut_collection
+        self.custom_observation_coordinates = sci_alert.custom_observation_coordinates
+        self.accepted = self.cut_collection.result()
+
+    def delay(self):
+        ''' delay of the observation window in hours (inf without window) '''
+        delay = getattr(self.observation_window, "delay", None)
+        if delay is None:
+            return np.inf
+        return Quantity(delay, u.h).to_value(u.h)
+
+    def apply(self, sci_alert, science_case):
+        ''' sets the results of this site in the science case and alert. The cut
+        collection of the science case is kept, the results of copies evaluated in other
+        processes are taken over. '''
+        science_case.observation_window = self.observation_window
+        if science_case.cut_collection is not self.cut_collection:
+            science_case.cut_collection.take_results(self.cut_collection)
+        sci_alert.custom_observation_coordinates = self.custom_observation_coordinates
+
+    def __str__(self):
+        out = "{: <30} : {}\n".format("  * Site", self.site_name)
+        out += "{: <30} : {}\n".format("  * Accepted", self.accepted)
+        out += "{: <30} : {:.2f} h\n".format("  * Delay", self.delay())
+        return out
+
+
 class ProcessingManager:
     ''' core class of the processing manager holding the configurations and
     the matches of science cases and the alert.
@@ -75,6 +232,64 @@ class ProcessingManager:
         self.site_config = site_config
         self.communicator = None
         self.matches = None
+        self.window_memo = None
+
+        site_names = getattr(site_config, "sites", None)
+        if site_names:
+            self.sites = [get_site(name) for name in site_names]
+        else:
+            self.sites = [CTANorth()]
+        self.site_workers = getattr(site_config, "site_workers", None) or len(self.sites)
+
+        # stop at the first failed cut unless all cuts are needed for the reports
+        evaluate_all_cuts = getattr(site_config, "evaluate_all_cuts", False)
+        for science_case in science_configs:
+            science_case.cut_collection.evaluate_all = evaluate_all_cuts
+        # cuts and alert types shared between the configs
+        self.predicate_graph = predicate_graph.PredicateGraph(science_configs)
+        # worker processes running the custom cuts within their deadlines, 0 runs them here
+        custom_cut_workers = site_config.custom_cut_workers
+        if custom_cut_workers is None:
+            custom_cut_workers = custom_cut_pool.gDefaultWorkers
+        custom_cut_pool.configure(custom_cut_workers, getattr(site_config, "iers_path", None),
+                                  getattr(site_config, "leap_second_path", None))
+
+        # precomputed sun and moon profiles shared by all processes
+        if getattr(site_config, "almanac_path", None):
+            darkness_almanac.open_almanacs(site_config.almanac_path, self.sites)
+
+    def warm_up(self):
+        ''' prepares the processing of the first alert at all sites, including the
+        site workers. Returns the duration in seconds. '''
+        duration = warm_up.warm_up(self.sites, getattr(self.site_config, "almanac_path", None),
+                                   getattr(self.site_config, "iers_path", None),
+                                   getattr(self.site_config, "leap_second_path", None))
+        if self.use_site_workers():
+            start = timer.time()
+            now = time_model.utc_now()
+            futures = [self.site_worker(i).submit(keep_site_warm, site.name, now)
+                       for i, site in enumerate(self.sites)]
+            for future in futures:
+                future.result()
+            pool_duration = timer.time() - start
+            print("Warm-up of the site workers took %.2f s" % pool_duration)
+            duration += pool_duration
+
+        start = timer.time()
+        if custom_cut_pool.get_pool() is not None:
+            pool_duration = timer.time() - start
+            print("Start of the custom cut pool took %.2f s" % pool_duration)
+            duration += pool_duration
+
+        return duration
+
+    def site_worker(self, site_index):
+        ''' the worker (single-process executor) that evaluates the site 'site_index' of
+        self.sites. Each site always uses the same worker. '''
+        workers = get_site_workers(min(self.site_workers, len(self.sites)),
+                                   getattr(self.site_config, "iers_path", None),
+                                   getattr(self.site_config, "leap_second_path", None))
+        return workers[site_index % len(workers)]
 
     def process(self, sci_alert, communicator):
         ''' main chain calling the different processing setps '''
@@ -84,27 +299,79 @@ class ProcessingManager:
         self.core_processing()
         self.finalize_processing()
 
+        # prepare the sun and moon profiles and the sky index for the next alerts, in the
+        # worker that evaluates the site
+        for i, site in enumerate(self.sites):
+            if self.use_site_workers():
+                future = self.site_worker(i).submit(keep_site_warm, site.name,
+                                                    sci_alert.alert_received_time)
+                future.add_done_callback(report_warm_failure)
+            else:
+                keep_site_warm(site.name, sci_alert.alert_received_time)
+
+    def use_site_workers(self):
+        ''' True if the sites are evaluated in the site workers '''
+        return len(self.sites) > 1 and self.site_workers > 1
+
     def initiate_processing(self, science_alert):
         ''' prepratory actions for the processing, including matching of
             alert and science config as well as communicating -on_received- '''
 
+        # the science configs are kept for the following alerts
+        for science_case in self.science_config:
+            science_case.pointing_pattern = None
+
         # search matching science configs
-        matches = match_science_configurations(science_alert, self.science_config)
+        self.predicate_graph.start_alert()
+        matches = match_science_configurations(science_alert, self.science_config,
+                                               self.predicate_graph)
         # start processing in parallel
         sorted_matches = sorted(matches, key=lambda matches: matches.science_config.observation_config.priority,
                                 reverse=True)
         self.matches = sorted_matches
         self.communicator.register_all_matches(self.matches)
 
+        # observation windows are shared between the matches of this alert
+        self.window_memo = observation_windows.ObservationWindowMemo()
+
         for match in self.matches:
             if match.science_config.notification_opts.any_on_received():
                 # do this in parallel to the main process_cases task.
                 self.communicator.communicate_received(match)
 
     def core_processing(self):
-        ''' process the list of follow-up opportunities one after another '''
-        for match in self.matches:
-            process_cases(match.science_alert, match.science_config)
+        ''' process the list of follow-up opportunities: the site independent cuts
+        once, then the observation windows and the remaining cuts for every site '''
+        cases = [(match.science_alert, match.science_config) for match in self.matches]
+        for sci_alert, science_case in cases:
+            process_site_independent_cuts(sci_alert, science_case)
+
+        site_decisions = self.evaluate_sites(cases)
+        print(self.predicate_graph)
+        if custom_cut_pool.gCustomCutPool is not None:
+            print(custom_cut_pool.gCustomCutPool)
+        # all matches share the alert
+        if cases and cases[0][0].parameters is not None:
+            print(cases[0][0].parameters)
+
+        for i, match in enumerate(self.matches):
+            for decisions in site_decisions:
+                match.add_site_decision(decisions[i])
+            match.choose_best_site()
+
+    def evaluate_sites(self, cases):
+        ''' evaluates the 'cases' at all sites. Returns the list of SiteDecisions
+        of every site (in the order of self.sites). '''
+        if len(self.sites) == 1:
+            return [evaluate_site(self.sites[0].name, cases, self.window_memo)]
+
+        if not self.use_site_workers():
+            return [evaluate_site(site.name, copy.deepcopy(cases), self.window_memo)
+                    for site in self.sites]
+
+        futures = [self.site_worker(i).submit(evaluate_site, site.name, cases)
+                   for i, site in enumerate(self.sites)]
+        return [future.result() for future in futures]
 
     def finalize_processing(self):
         ''' finalizes the processing steps by communcating,
@@ -177,17 +444,21 @@ def generate_wobble_offsets(number_blocks, offset):
     return ra_offsets, dec_offsets
 
 
-def match_science_configurations(science_alert, science_configs):
-    ''' function that matches the science alert to science configs '''
+def match_science_configurations(science_alert, science_configs, graph=None):
+    ''' function that matches the science alert to science configs. With the
+    predicate_graph.PredicateGraph 'graph' of the configs each alert type is checked once. '''
     print("Matching Science configs...")
     ivorn = science_alert.ivorn
     matches = []
 
-    for sci_case in science_configs:
-        for allowed_type in sci_case.allowed_alert_types:
-            if allowed_type.alert_type in ivorn:
-                pair = FollowupOpportunity(science_alert, sci_case)
-                matches.append(pair)
+    if graph is not None:
+        matches = [FollowupOpportunity(science_alert, sci_case) for sci_case in graph.match(ivorn)]
+    else:
+        for sci_case in science_configs:
+            for allowed_type in sci_case.allowed_alert_types:
+                if allowed_type.alert_type in ivorn:
+                    pair = FollowupOpportunity(science_alert, sci_case)
+                    matches.append(pair)
 
     print("Found Matching science configurations:")
     for match in matches:
@@ -203,6 +474,23 @@ class FollowupOpportunity:
         self.science_alert = alert
         self.science_config = config
         self.summary = None
+        self.site_decisions = []
+        self.best_site = None
+
+    def add_site_decision(self, decision):
+        ''' registers the SiteDecision of one site '''
+        self.site_decisions.append(decision)
+
+    def choose_best_site(self):
+        ''' chooses the best site: accepted sites before rejected ones, then the
+        shortest delay. Its results are set in the science config and alert. '''
+        if not self.site_decisions:
+            return None
+        best = min(self.site_decisions, key=lambda decision: (not decision.accepted,
+                                                              decision.delay()))
+        best.apply(self.science_alert, self.science_config)
+        self.best_site = best.site_name
+        return best
 
     def report(self):
         ''' generates a breif report and prints it'''
@@ -212,6 +500,10 @@ class FollowupOpportunity:
         out += self.science_config.name + "\n"
         out += "--" * 10 + "\n"
         out += str(self.science_config.cut_collection)
+        if len(self.site_decisions) > 1:
+            for decision in self.site_decisions:
+                out += str(decision)
+            out += "{: <30} : {}\n".format("  * Best site", self.best_site)
 
         print(out)
 
@@ -0,0 +1,86 @@
+'''
+Sky Brightness Module
+
+Vectorized model of the night sky background (NSB) in the direction of a target,
+used for observations under moonlight. All functions take arrays (e.g. the whole
+time grid of an observation window search) and work in plain numpy.
+
+The scattered moonlight is calculated with the model of Krisciunas & Schaefer
+(1991, PASP 103, 1033), the dark sky brightness increases with the airmass of the
+target as given there. Twilight is approximated by an exponential brightening of
+1 mag per degree of sun altitude, reaching the dark sky level at gTwilightZero.
+Brightnesses are in nanoLamberts (V band), the NSB is returned relative to the
+dark sky at zenith.
+'''
+
+import numpy as np
+
+# V band extinction coefficient (mag / airmass)
+gExtinction = 0.172
+# dark sky brightness at zenith (V mag / arcsec^2)
+gDarkSkyMagnitude = 21.6
+# sun altitude (deg) at which the twilight is as bright as the dark sky
+gTwilightZero = -13.
+# largest zenith angle (deg) used for the airmass, to avoid the divergence at the horizon
+gMaxZenith = 87.
+
+
+def magnitude_to_nanolambert(magnitude):
+    ''' converts a surface brightness in V mag / arcsec^2 to nanoLamberts '''
+    return 34.08 * np.exp(20.7233 - 0.92104 * magnitude)
+
+
+def airmass(alt):
+    ''' airmass for the altitudes 'alt' (deg) (Krisciunas & Schaefer eq. 3) '''
+    zenith = np.radians(np.minimum(90. - np.asarray(alt), gMaxZenith))
+    return 1. / np.sqrt(1. - 0.96 * np.sin(zenith)**2)
+
+
+def angular_separation(alt_1, az_1, alt_2, az_2):
+    ''' angular distance (deg) between the horizontal positions 1 and 2 (deg) '''
+    alt_1, az_1 = np.radians(alt_1), np.radians(az_1)
+    alt_2, az_2 = np.radians(alt_2), np.radians(az_2)
+    cos_distance = (np.sin(alt_1) * np.sin(alt_2)
+                    + np.cos(alt_1) * np.cos(alt_2) * np.cos(az_1 - az_2))
+    return np.degrees(np.arccos(np.clip(cos_distance, -1., 1.)))
+
+
+def dark_sky_brightness(source_alt):
+    ''' dark sky brightness (nL) in the direction of the altitudes 'source_alt' (deg) '''
+    source_airmass = airmass(source_alt)
+    zenith_brightness = magnitude_to_nanolambert(gDarkSkyMagnitude)
+    return zenith_brightness * 10**(-0.4 * gExtinction * (source_airmass - 1.)) * source_airmass
+
+
+def moon_brightness(moon_phase, moon_alt, separation, source_alt):
+    ''' scattered moonlight (nL) for the illuminated fraction 'moon_phase' (percent),
+    the moon altitude, the moon-target separation and the target altitude (deg).
+    Zero if the moon is below the horizon. '''
+    phase_angle = np.degrees(np.arccos(np.clip(2. * np.asarray(moon_phase) / 100. - 1., -1., 1.)))
+    moon_illuminance = 10**(-0.4 * (3.84 + 0.026 * phase_angle + 4e-9 * phase_angle**4))
+
+    separation_rad = np.radians(separation)
+    scattering = (10**5.36 * (1.06 + np.cos(separation_rad)**2)
+                  + 10**(6.15 - np.asarray(separation) / 40.))
+
+    brightness = (scattering * moon_illuminance
+                  * 10**(-0.4 * gExtinction * airmass(moon_alt))
+                  * (1. - 10**(-0.4 * gExtinction * airmass(source_alt))))
+    return np.where(np.asarray(moon_alt) > 0., brightness, 0.)
+
+
+def twilight_brightness(sun_alt):
+    ''' twilight sky brightness (nL) for the sun altitudes 'sun_alt' (deg).
+    The brightening is only followed up to sunset. '''
+    zenith_brightness = magnitude_to_nanolambert(gDarkSkyMagnitude)
+    return zenith_brightness * 10**(0.4 * (np.minimum(sun_alt, 0.) - gTwilightZero))
+
+
+def relative_nsb(sun_alt, moon_alt, moon_phase, separation, source_alt):
+    ''' night sky background in the direction of the target relative to the dark sky at
+    zenith, for the sun and moon altitudes (deg), the moon phase (percent), the moon-target
+    separation (deg) and the target altitude (deg). '''
+    brightness = (dark_sky_brightness(source_alt)
+                  + moon_brightness(moon_phase, moon_alt, separation, source_alt)
+                  + twilight_brightness(sun_alt))
+    return brightness / magnitude_to_nanolambert(gDarkSkyMagnitude)
@@ -0,0 +1,71 @@
+'''
+Time Model Module
+
+All times on the processing path, from the parsed alert to the window search and
+the summaries, are naive UTC numpy datetime64 values with microsecond resolution
+(single values or arrays, e.g. the time grid and the windows of an
+ObservationWindow). The ephemeris calculations work on float UTC mjds.
+
+Python datetimes, astropy Times and strings are converted only at the edges: when
+an alert is parsed, when test conditions are applied and when a time is printed.
+'''
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from astropy.time import Time
+
+gTimeDtype = np.dtype('datetime64[us]')
+# mjd of the numpy datetime64 epoch 1970-01-01
+gEpochMjd = 40587.
+gMicroSecondsPerDay = 86400e6
+
+
+def to_datetime64(times):
+    ''' converts 'times' (datetime, aware datetimes are converted to UTC, astropy Time,
+    ISO string or datetime64, single or arrays) to datetime64[us] '''
+    if isinstance(times, Time):
+        return times.utc.datetime64.astype(gTimeDtype)
+    if isinstance(times, datetime) and times.tzinfo is not None:
+        times = times.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.asarray(times, dtype=gTimeDtype)[()]
+
+
+def utc_now():
+    ''' the current UTC time as datetime64[us] '''
+    return np.datetime64(datetime.utcnow(), 'us')
+
+
+def to_mjd(times):
+    ''' converts 'times' (see to_datetime64()) to UTC mjds '''
+    micro_seconds = to_datetime64(times).astype('int64')
+    return micro_seconds / gMicroSecondsPerDay + gEpochMjd
+
+
+def from_mjd(mjds):
+    ''' converts UTC mjds to datetime64[us] '''
+    micro_seconds = np.round((np.asarray(mjds) - gEpochMjd) * gMicroSecondsPerDay)
+    return micro_seconds.astype('int64').astype(gTimeDtype)
+
+
+def full_hour(times):
+    ''' the start of the hour of 'times' '''
+    return to_datetime64(times).astype('datetime64[h]').astype(gTimeDtype)
+
+
+def hours_between(start, end):
+    ''' time from 'start' to 'end' in hours (float) '''
+    return (to_datetime64(end) - to_datetime64(start)) / np.timedelta64(1, 'h')
+
+
+def to_datetime(time):
+    ''' converts a single time to a naive UTC datetime, e.g. for printing '''
+    return to_datetime64(time).astype(datetime)
+
+
+def to_string(time):
+    ''' formatted time for the summaries, 'None' if it is not set '''
+    if time is None:
+        return str(None)
+    return str(to_datetime(time))
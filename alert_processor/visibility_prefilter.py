@@ -0,0 +1,156 @@
+'''
+Visibility Prefilter Module
+
+Constant-time checks that reject targets which can not have an observation
+window, before an ObservationWindow is built:
+ * declination: the highest altitude of a target is 90 deg - |lat - dec|. If it
+   stays below the zenith limit, the target never rises high enough.
+ * daylight: if the sun stays above the darkness limit from the alert until the
+   end of the search range (1.5 times the max. delay after the full hour of the
+   event, as in observation_windows), no window can be found.
+ * moonlight: without sky quality limits the moon has to be down as well. If a
+   darkness almanac of the site covers the search range and none of its dark
+   intervals overlaps it, no window can be found.
+
+The twilight times (sun crossing gSunDown) are kept in a small table per site and
+night, calculated with fast_ephemeris. All checks keep a margin, so that they only
+reject targets which the full window search would reject as well.
+'''
+
+from collections import OrderedDict
+
+import numpy as np
+
+from astropy import units as u
+
+from alert_processor import fast_ephemeris
+from alert_processor import darkness_almanac
+from alert_processor import darkness_limits
+from alert_processor import time_model
+
+# difference of the apparent and the J2000 declination (precession, nutation, aberration)
+gDeclinationMargin = 0.5 * u.deg
+# accuracy of the twilight times
+gTwilightMargin = 5 * u.min
+gTwilightStep = 10. / 60. / 24.  # days
+gMaxNights = 8
+
+
+class VisibilityPrefilter:
+    ''' prefilter with the twilight tables of all sites and the reject counts.
+
+        Main functions are:
+         * reject(): reason for rejecting a target, None if it may be visible
+         * twilight_times(): dusk and dawn of a night at a site
+    '''
+    def __init__(self):
+        self.twilight_tables = {}
+        self.checks = 0
+        self.declination_rejects = 0
+        self.daylight_rejects = 0
+        self.moonlight_rejects = 0
+
+    def __str__(self):
+        out = "{: <30} : {}\n".format("  * Prefilter checks", self.checks)
+        out += "{: <30} : {}, {}, {}\n".format("  * Rejects dec, day, moon",
+                                               self.declination_rejects, self.daylight_rejects,
+                                               self.moonlight_rejects)
+        out += "{: <30} : {:.1f} %\n".format("  * Reject rate", 100. * self.reject_rate())
+        return out
+
+    def reject_rate(self):
+        ''' fraction of the checked targets that were rejected '''
+        if self.checks == 0:
+            return 0.
+        return (self.declination_rejects + self.daylight_rejects
+                + self.moonlight_rejects) / self.checks
+
+    def twilight_times(self, site, night):
+        ''' mjds of the dusk and dawn (sun crossing darkness_limits.gSunDown) in the
+        night 'night' (local noon to noon) at 'site'. nan if the sun does not set that far. '''
+        table = self.twilight_tables.setdefault(site.name, OrderedDict())
+        times = table.get(night)
+        if times is not None:
+            table.move_to_end(night)
+            return times
+
+        noon_offset = 0.5 - site.lon.to_value(u.deg) / 360.
+        n_steps = int(round(1. / gTwilightStep)) + 1
+        mjds = np.linspace(night + noon_offset, night + noon_offset + 1., n_steps)
+        sun_alts, _ = fast_ephemeris.sun_alt_az(mjds, site.lat.to_value(u.deg),
+                                                site.lon.to_value(u.deg))
+        margins = darkness_limits.gSunDown.to_value(u.deg) - sun_alts
+
+        dark = np.flatnonzero(margins > 0)
+        if len(dark) == 0:
+            times = (np.nan, np.nan)
+        else:
+            first, last = dark[0], dark[-1]
+            dusk = mjds[first]
+            if first > 0:
+                dusk = np.interp(0., [margins[first - 1], margins[first]],
+                                 [mjds[first - 1], mjds[first]])
+            dawn = mjds[last]
+            if last < n_steps - 1:
+                dawn = np.interp(0., [margins[last + 1], margins[last]],
+                                 [mjds[last + 1], mjds[last]])
+            times = (dusk, dawn)
+
+        table[night] = times
+        if len(table) > gMaxNights:
+            table.popitem(last=False)
+        return times
+
+    def dark_time_between(self, site, first_mjd, last_mjd):
+        ''' True if the sun is below the darkness limit at some time between
+        'first_mjd' and 'last_mjd' (within gTwilightMargin) '''
+        margin = gTwilightMargin.to_value(u.day)
+        noon_offset = 0.5 - site.lon.to_value(u.deg) / 360.
+        first_night = int(np.floor(first_mjd - noon_offset))
+        last_night = int(np.floor(last_mjd - noon_offset))
+        for night in range(first_night, last_night + 1):
+            dusk, dawn = self.twilight_times(site, night)
+            if np.isnan(dusk):
+                continue
+            if dusk - margin <= last_mjd and dawn + margin >= first_mjd:
+                return True
+        return False
+
+    def almanac_dark_time_between(self, site, first_mjd, last_mjd):
+        ''' True if the darkness almanac of 'site' has a dark interval between 'first_mjd'
+        and 'last_mjd' (within gTwilightMargin), None if no almanac covers the range '''
+        margin = gTwilightMargin.to_value(u.day)
+        almanac = darkness_almanac.get_almanac(site)
+        if almanac is None or not almanac.covers(first_mjd - margin, last_mjd + margin):
+            return None
+        return len(almanac.dark_intervals(first_mjd - margin, last_mjd + margin)) > 0
+
+    def reject(self, dec, time, now, site, obs_window_cfg):
+        ''' reason ("declination", "daylight" or "moonlight") why the target at 'dec' of an
+        event at 'time' has no observation window at 'site' for the requirements
+        'obs_window_cfg' when searched at 'now'. None if it may have one. '''
+        self.checks += 1
+        lat = site.lat.to_value(u.deg)
+        zenith_distance = abs(lat - dec.to_value(u.deg)) - gDeclinationMargin.to_value(u.deg)
+        if zenith_distance >= obs_window_cfg.max_zenith_angle.to_value(u.deg):
+            self.declination_rejects += 1
+            return "declination"
+
+        search_end = (time_model.to_mjd(time_model.full_hour(time))
+                      + 1.5 * obs_window_cfg.max_delay_to_event.to_value(u.day))
+        if not self.dark_time_between(site, time_model.to_mjd(now), search_end):
+            self.daylight_rejects += 1
+            return "daylight"
+
+        if not darkness_limits.has_sky_quality_limits(obs_window_cfg.min_nsb,
+                                                      obs_window_cfg.max_nsb,
+                                                      obs_window_cfg.illumination):
+            if self.almanac_dark_time_between(site, time_model.to_mjd(now), search_end) is False:
+                self.moonlight_rejects += 1
+                return "moonlight"
+
+        return None
+
+
+# prefilter of this process
+gPrefilter = VisibilityPrefilter()
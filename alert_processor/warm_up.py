@@ -0,0 +1,65 @@
+'''
+Warm Up Module
+
+Preparations at the start of the TH, before the broker hands over the first alert,
+so that the first alert is processed as fast as the following ones:
+ * the IERS and leap second tables are loaded from local files (e.g. a mirror of
+   finals2000A.all and leap-seconds.list). Automatic downloads are switched off,
+   the sites have no outbound network.
+ * one AltAz transform per site runs through the full astropy chain, which loads
+   the remaining tables and builds the site locations
+ * the altaz_engine, ephemeris_cache and observability_index of the current
+   night are calculated
+'''
+
+import time as timer
+
+from astropy import units as u
+from astropy.time import Time, update_leap_seconds
+from astropy.coordinates import SkyCoord, AltAz
+from astropy.utils import iers
+
+from alert_processor import altaz_engine
+from alert_processor import darkness_almanac
+from alert_processor import ephemeris_cache
+from alert_processor import observability_index
+from alert_processor import time_model
+
+
+def configure_iers(iers_path=None, leap_second_path=None):
+    ''' switches off the IERS downloads and loads the IERS-A table 'iers_path' and the
+    leap second file 'leap_second_path' if given. Otherwise the tables bundled with
+    astropy are used. '''
+    iers.conf.auto_download = False
+    if iers_path:
+        iers.earth_orientation_table.set(iers.IERS_A.open(iers_path))
+
+    leap_second_files = [leap_second_path] if leap_second_path else None
+    update_leap_seconds(leap_second_files)
+
+
+def dummy_transform(site, time):
+    ''' AltAz transform of a fixed position at 'site' and 'time' '''
+    obs_time = Time(time)
+    return SkyCoord(0 * u.deg, 0 * u.deg).transform_to(AltAz(obstime=obs_time,
+                                                             location=site.location))
+
+
+def warm_up(sites, almanac_path=None, iers_path=None, leap_second_path=None):
+    ''' prepares the processing of the first alert at 'sites' (see module docstring).
+    Returns the duration of the warm-up in seconds. '''
+    start = timer.time()
+    configure_iers(iers_path, leap_second_path)
+    if almanac_path:
+        darkness_almanac.open_almanacs(almanac_path, sites)
+
+    now = time_model.utc_now()
+    for site in sites:
+        dummy_transform(site, now)
+        altaz_engine.get_engine(site, time_model.to_mjd(now))
+        ephemeris_cache.keep_warm(site, now)
+        observability_index.keep_warm(site, now)
+
+    duration = timer.time() - start
+    print("Warm-up for %s took %.2f s" % (", ".join(site.name for site in sites), duration))
+    return duration
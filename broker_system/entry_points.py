@@ -15,6 +15,10 @@ from broker_system import alert_verifyer
 import os
 from enum import Enum
 
+# (config files state, site config, processing manager) of the last alert: the loaded
+# configs, their compiled cut plans with the measured cut costs and the predicate graph
+# are kept for the following alerts while the config files are unchanged
+gProcessingSetup = None
 
 
 def setup_site_cfg():
@@ -30,12 +34,46 @@ def setup_science_cfgs(site_cfg):
 
     science_cfgs = []
     for cfg in cfgs:
-        sci = ScienceConfiguration(cfg)
+        try:
+            sci = ScienceConfiguration(cfg)
+        except ValueError as excep:
+            # e.g. unknown custom cuts
+            print("WARNING: Science config %s rejected: " % cfg, excep)
+            continue
         print(sci)
         science_cfgs.append(sci)
     return science_cfgs
 
 
+def config_files_state(site_cfg_path, science_cfg_path):
+    ''' paths and modification times of the site config and the science config files '''
+    state = [(site_cfg_path, os.path.getmtime(site_cfg_path))]
+    if science_cfg_path and os.path.isdir(science_cfg_path):
+        for cfg in sorted(os.listdir(science_cfg_path)):
+            cfg_path = science_cfg_path + "/" + cfg
+            state.append((cfg_path, os.path.getmtime(cfg_path)))
+    return state
+
+
+def setup_processing():
+    ''' the site config and the ProcessingManager with the science configs. They are
+    loaded for the first alert and again only if a config file changed. '''
+    global gProcessingSetup
+    site_cfg_path = os.environ['TH_site_config']
+    if gProcessingSetup is not None:
+        state, site_cfg, proc_manager = gProcessingSetup
+        current_state = config_files_state(site_cfg_path, site_cfg.science_config_paths)
+        if state[0][0] == site_cfg_path and state == current_state:
+            return site_cfg, proc_manager
+
+    site_cfg = setup_site_cfg()
+    science_cfgs = setup_science_cfgs(site_cfg)
+    proc_manager = processing_manager.ProcessingManager(science_cfgs, site_cfg)
+    gProcessingSetup = (config_files_state(site_cfg_path, site_cfg.science_config_paths), site_cfg,
+                        proc_manager)
+    return site_cfg, proc_manager
+
+
 class alert_origin(Enum):
     # different origins of alerts according to interface list and use
     # cases, different extraction of information can occur.
@@ -56,14 +94,19 @@ def factory_switch(origin):
     return func()
 
 
+def warm_up():
+    ''' prepares the TH before the first alert is handed over (IERS tables, site
+    frames and caches, see alert_processor.warm_up). Returns the duration in seconds. '''
+    _, proc_manager = setup_processing()
+    return proc_manager.warm_up()
+
+
 def alert_entry(alert, origin, test_conditions=None):
     print("Received alert of origin: %s" % origin)
 
-    site_cfg = setup_site_cfg()
-    science_cfgs = setup_science_cfgs(site_cfg)
+    site_cfg, proc_manager = setup_processing()
 
     allowed_alert_types = site_cfg.allowed_alert_types
-    proc_manager = processing_manager.ProcessingManager(science_cfgs, site_cfg)
 
     factory = factory_switch(origin)
     sci_alert_factory = saf(factory, alert)
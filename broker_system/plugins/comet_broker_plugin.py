@@ -31,6 +31,8 @@ class TH_Entry(object):
 
     def __init__(self):
         self.allowed_types = []
+        # the first alert should not wait for IERS tables and caches
+        entry_points.warm_up()
 
     def __call__(self, event):
         self.ivorn = event.element.attrib['ivorn']
@@ -1,3 +1,6 @@
+from alert_processor import time_model
+
+
 class alert_summary:
     def __init__(self, followup_op):
         self.followup_op = followup_op
@@ -48,8 +51,9 @@ class sci_alert_summary:
         summ += "{}\n".format("Processed alert:")
         summ += "{: <20}  {}\n".format("Unique ID:", alert.ivorn)
         summ += "{: <20}  {}\n".format("Coordinates:", coord)
-        summ += "{: <20}  {}\n".format("Event Time:", alert.event_time)
-        summ += "{: <20}  {}\n".format("Received Time:", alert.alert_received_time)
+        summ += "{: <20}  {}\n".format("Event Time:", time_model.to_string(alert.event_time))
+        summ += "{: <20}  {}\n".format("Received Time:",
+                                       time_model.to_string(alert.alert_received_time))
 
         self.summary = summ
 
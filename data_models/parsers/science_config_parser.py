@@ -58,9 +58,18 @@ def parse_observation_window_requiremnts(data):
     delay = data['MaximumDelayToEvent']
     window_reqs.max_delay_to_event = delay[0] * u.Unit(delay[1])
 
-    window_reqs.min_nsb_range = data['SkyQuality']['min_nsb_range']
-    window_reqs.max_nsb_range = data['SkyQuality']['max_nsb_range']
-    window_reqs.illumination = data['SkyQuality']['illumination']
+    # sky quality: NSB range (rates, e.g. "1 GHz") and the max. illuminated fraction of the moon
+    window_reqs.min_nsb = Quantity(data['SkyQuality']['min_nsb_range'])
+    window_reqs.max_nsb = Quantity(data['SkyQuality']['max_nsb_range'])
+    window_reqs.illumination = float(data['SkyQuality']['illumination'])
+
+    # optional: adaptive or analytic window search with a given precision of the window edges
+    window_reqs.search_mode = data.get('SearchMode', window_reqs.search_mode)
+    # optional: engine of the profile calculation, otherwise chosen by the urgency
+    window_reqs.engine = data.get('Engine', window_reqs.engine)
+    if 'EdgeTolerance' in data:
+        tolerance = data['EdgeTolerance']
+        window_reqs.edge_tolerance = tolerance[0] * u.Unit(tolerance[1])
 
     return window_reqs
 
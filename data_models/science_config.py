@@ -11,6 +11,7 @@ import json
 
 from data_models.parsers import science_config_parser as sci_conf_parser
 from alert_processor import cuts
+from alert_processor import observation_windows
 from utilities import observation_types
 
 
@@ -38,6 +39,9 @@ class ScienceConfiguration:
         self.cut_collection = cuts.CutCollection(self.data['ProcessingCuts'])
         obs_window_req_data = self.data['ObservationWindowRequirements']
         self.obsevation_window_reqs = sci_conf_parser.parse_observation_window_requiremnts(obs_window_req_data)
+        if self.obsevation_window_reqs.engine is None:
+            urgency = self.observation_config.urgency
+            self.obsevation_window_reqs.engine = observation_windows.engine_for_urgency(urgency)
         notify_data = self.data['Notifications']
         self.notification_opts = sci_conf_parser.parse_notification_options(notify_data)
         self.detections_public = self.data['DetectionsPublic']
@@ -144,13 +148,21 @@ class ObsWindowRequirements:
         self.max_nsb = None
         self.illumination = None
 
+        # observation window search (see observation_windows.WindowSearchMode)
+        self.search_mode = "grid"
+        self.edge_tolerance = None
+        # profile calculation (see observation_windows.WindowEngine), None for the default
+        self.engine = None
+
     def __str__(self):
         out_map = {"   * Max. Zenith angle": self.max_zenith_angle,
                    "   * Min. Window duration": self.min_window_duration,
                    "   * Max. Delay to Event": self.max_delay_to_event,
                    "   * Min. allowed NSB": self.min_nsb,
                    "   * Max. allowed NSB": self.max_nsb,
-                   "   * Illumination": self.illumination}
+                   "   * Illumination": self.illumination,
+                   "   * Window search mode": self.search_mode,
+                   "   * Window engine": self.engine}
         out = ""
         for name, val in out_map.items():
             out += "{: <30} : {}\n".format(name, val)
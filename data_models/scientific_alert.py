@@ -2,8 +2,11 @@
 # can be created from external scientific (voevent) alerts as well as from
 # SAG alerts.
 
+from collections import OrderedDict
+
 import voeventparse as vp
-from datetime import datetime
+
+from alert_processor import time_model
 
 
 class InjectVoeventSciAlertFactory:
@@ -47,6 +50,96 @@ class ScientificAlertFactory:
         self.sci_alert = self.factory.generate_scientific_alert(received_alert)
 
 
+def parse_param_value(value, data_type=None):
+    ''' typed value of a VOEvent Param: booleans for "true" and "false", floats for
+    numbers and strings otherwise or for Params with dataType="string" '''
+    if value is None or data_type == "string":
+        return value
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class AlertParameter:
+    ''' a Param of a VOEvent: name, group (None for top level Params), typed value and unit '''
+    def __init__(self, name, group, value, unit=None):
+        self.name = name
+        self.group = group
+        self.value = value
+        self.unit = unit
+
+
+class AlertParameterIndex:
+    ''' index of the Params of a VOEvent, filled in one pass over the What section.
+
+        Params are found by name (the first Param of that name in the document, like
+        the XPath .//Param[@name='...']) or by group and name. The reads of every
+        parameter are counted in 'reads' to see which parameters the cuts use.
+    '''
+    def __init__(self, voevent):
+        # name -> AlertParameter, first in document order
+        self.params = OrderedDict()
+        # group name -> name -> AlertParameter
+        self.groups = OrderedDict()
+        # "name" or "group.name" -> number of reads
+        self.reads = OrderedDict()
+
+        what = None
+        if voevent is not None:
+            what = voevent.find("What")
+        if what is None:
+            return
+        for element in what.iterchildren():
+            if element.tag == "Param":
+                self.add_param(element, None)
+            elif element.tag == "Group":
+                group = element.attrib.get("name")
+                for param in element.iterchildren("Param"):
+                    self.add_param(param, group)
+
+    def __str__(self):
+        out = "{: <30} : {}, {}\n".format("  * Alert parameters, groups", len(self.params),
+                                           len(self.groups))
+        out += "{: <30} : {}\n".format("  * Parameters read", ", ".join(
+            "%s (%i)" % read for read in self.reads.items()))
+        return out
+
+    def add_param(self, element, group):
+        ''' adds the Param 'element' of the group 'group' to the index '''
+        attrib = element.attrib
+        name = attrib.get("name")
+        value = parse_param_value(attrib.get("value"), attrib.get("dataType"))
+        parameter = AlertParameter(name, group, value, attrib.get("unit"))
+        self.params.setdefault(name, parameter)
+        if group is not None:
+            self.groups.setdefault(group, OrderedDict()).setdefault(name, parameter)
+
+    def get(self, name, group=None):
+        ''' the AlertParameter 'name' (of the group 'group'), counted as read.
+        Raises a KeyError for unknown parameters. '''
+        try:
+            if group is None:
+                parameter = self.params[name]
+            else:
+                parameter = self.groups[group][name]
+        except KeyError:
+            raise KeyError("Alert has no parameter %s"
+                           % (name if group is None else group + "." + name)) from None
+
+        key = name if group is None else group + "." + name
+        self.reads[key] = self.reads.get(key, 0) + 1
+        return parameter
+
+    def add_reads(self, reads):
+        ''' adds the counted 'reads' of another index of the same alert, e.g. from a worker
+        process '''
+        for key, count in reads.items():
+            self.reads[key] = self.reads.get(key, 0) + count
+
+
 class ScientificAlert:
     ''' class containg the base information for any scientific alert
         handled by the TH. Can be created from different input science alerts
@@ -75,17 +168,30 @@ class ScientificAlert:
         # optional parameters that may be used
         self.custom_observation_coordinates = []
 
+        # AlertParameterIndex of the VOEvent, created on first use
+        self.parameters = None
+
     def from_voevent(self, voevent):
         ''' fill the alert from voevents '''
         self.alert = voevent
         self.is_voevent = True
         self.ivorn = voevent.attrib['ivorn']
         self.coords = vp.get_event_position(voevent)
-        self.event_time = vp.convenience.get_event_time_as_utc(voevent).replace(tzinfo=None)
-        self.alert_received_time = datetime.utcnow().replace(tzinfo=None)
+        self.event_time = time_model.to_datetime64(vp.convenience.get_event_time_as_utc(voevent))
+        self.alert_received_time = time_model.utc_now()
         self.alert_authored_time = voevent['Who']['Date']
         self.author = voevent['Who']['Author']['shortName']
 
+    def parameter_index(self):
+        ''' the AlertParameterIndex of the alert, created on first use '''
+        if self.parameters is None:
+            self.parameters = AlertParameterIndex(self.alert)
+        return self.parameters
+
+    def parameter(self, name, group=None):
+        ''' typed value of the VOEvent Param 'name' (of the group 'group') '''
+        return self.parameter_index().get(name, group).value
+
     def register_processing_results(self):
         pass
 
@@ -104,9 +210,9 @@ class ScientificAlert:
             out_map = {"ivorn": self.ivorn,
                        "author": self.author,
                        "alert authored time": self.alert_authored_time,
-                       "alert received time": self.alert_received_time,
+                       "alert received time": time_model.to_string(self.alert_received_time),
                        "coordinates": self.coords,
-                       "event time": self.event_time,
+                       "event time": time_model.to_string(self.event_time),
                        "test conditions": self.testing_conditions_applied}
 
         for name, val in out_map.items():
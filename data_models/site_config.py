@@ -11,8 +11,15 @@ class SiteConfiguration:
         self.site_cfg_path = None
         self.state = None
         self.site = None
+        self.sites = []
+        self.site_workers = None
+        self.custom_cut_workers = None
         self.science_config_paths = None
         self.allowed_alert_types = []
+        self.almanac_path = None
+        self.iers_path = None
+        self.leap_second_path = None
+        self.evaluate_all_cuts = False
 
     def read_site_cfg(self, site_cfg_path):
         ''' reads the actual site config file '''
@@ -23,7 +30,14 @@ class SiteConfiguration:
         print(data)
         self.science_config_paths = parse_science_config_paths(data)
         self.site = parse_site(data)
+        self.sites = parse_sites(self.site)
+        self.site_workers = parse_site_workers(data)
+        self.custom_cut_workers = parse_custom_cut_workers(data)
         self.allowed_alert_types = parse_allowed_alerts(data)
+        self.almanac_path = parse_almanac_path(data)
+        self.iers_path = parse_iers_path(data)
+        self.leap_second_path = parse_leap_second_path(data)
+        self.evaluate_all_cuts = parse_evaluate_all_cuts(data)
 
     def __str__(self):
         return ""
@@ -48,6 +62,23 @@ def parse_allowed_alerts(data):
 
     return None
 
+def parse_almanac_path(data):
+    ''' parses the (optional) directory of the precomputed darkness almanacs '''
+    return data['SiteConfig'].get("almanac_path")
+
+def parse_iers_path(data):
+    ''' parses the (optional) path of a local IERS-A table (finals2000A.all) '''
+    return data['SiteConfig'].get("iers_path")
+
+def parse_leap_second_path(data):
+    ''' parses the (optional) path of a local leap second file '''
+    return data['SiteConfig'].get("leap_second_path")
+
+def parse_evaluate_all_cuts(data):
+    ''' parses the (optional) switch to evaluate all cuts instead of stopping at the
+    first failed one '''
+    return bool(data['SiteConfig'].get("evaluate_all_cuts", False))
+
 def parse_site(data):
     ''' parses the site specified in the site config '''
     try:
@@ -57,3 +88,29 @@ def parse_site(data):
         print("Unable to read the site.")
 
     return None
+
+def parse_sites(site):
+    ''' list of the site names from the "site" entry, which is either
+    a single name or a list of names '''
+    if site is None:
+        return []
+    if isinstance(site, str):
+        return [site]
+    return list(site)
+
+def parse_site_workers(data):
+    ''' parses the (optional) number of processes evaluating the sites in parallel '''
+    workers = data['SiteConfig'].get("site_workers")
+    if workers is None:
+        return None
+    return int(workers)
+
+def parse_custom_cut_workers(data):
+    ''' parses the (optional) number of processes running the custom cuts, 0 runs them
+    in the processing of the alert '''
+    workers = data['SiteConfig'].get("custom_cut_workers")
+    if workers is None:
+        return None
+    if isinstance(workers, bool) or int(workers) != workers or workers < 0:
+        raise ValueError("custom_cut_workers has to be a non-negative integer, not %s" % workers)
+    return int(workers)
@@ -0,0 +1,31 @@
+'''
+Precomputes the darkness almanacs (sun and moon profiles and dark time intervals)
+of the CTA sites. The directory they are written to has to be set as
+"almanac_path" in the th_site_config.json.
+
+usage: python build_darkness_almanac.py <directory> [start date (YYYY-MM-DD)] [days]
+'''
+
+import sys
+sys.path.append("/Users/hoischen/CTA/github/TransientsHandler")
+
+from astropy.time import Time
+
+from alert_processor import darkness_almanac
+from utilities.observatories import CTANorth, CTASouth
+
+
+def main():
+    directory = sys.argv[1]
+    start = Time(sys.argv[2]) if len(sys.argv) > 2 else Time.now()
+    n_days = int(sys.argv[3]) if len(sys.argv) > 3 else darkness_almanac.gAlmanacDays
+
+    # start at 0h UTC of the (previous) day, so that the first night is fully covered
+    start_mjd = int(start.utc.mjd) - 1
+    for site in [CTANorth(), CTASouth()]:
+        paths = darkness_almanac.build_almanac(site, start_mjd, directory, n_days + 1)
+        print("%s: %s, %s" % (site.name, paths[0], paths[1]))
+
+
+if __name__ == '__main__':
+    main()
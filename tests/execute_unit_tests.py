@@ -1,16 +1,50 @@
 import sys
 sys.path.append("/Users/hoischen/CTA/TransientsHandler")
 
-from utilities.observatories import CTA_North
+from utilities.observatories import CTANorth, CTASouth, get_site
 
-from processing import observation_windows
+from alert_processor import observation_windows
 from datetime import datetime
 import astropy.units as u
+from astropy.time import Time
+from astropy.coordinates import AltAz, SkyCoord, get_sun, get_body
+import numpy as np
+import ephem
+
+from alert_processor import cuts
+from alert_processor import ephemeris_cache
+from alert_processor import darkness_almanac
+from alert_processor import observability_index
+from alert_processor import altaz_engine
+from alert_processor import sky_brightness
+from alert_processor import warm_up
+from alert_processor import visibility_prefilter
+from alert_processor import time_model
+from alert_processor import predicate_graph
+from alert_processor import custom_cut_registry
+from alert_processor import custom_cut_pool
+from alert_processor import processing_manager
+from data_models import site_config
+from broker_system import entry_points
+from utilities.testing_conditions import TestingConditions
+from data_models.scientific_alert import InjectVoeventSciAlertFactory
+from data_models.science_config import AllowedAlertTypes
+
+
+import os
+import json
+import subprocess
+import time
+import unittest
+import tempfile
 
-from processing import cuts
 
+gTestAlertsPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_voevent_alerts")
 
-import unittest
+
+def load_test_alert(name="ivo___nasa_gsfc_gcn_SWIFT_BAT_GRB_Pos_927839-841"):
+    ''' ScientificAlert of the test VOEvent 'name' '''
+    return InjectVoeventSciAlertFactory().generate_scientific_alert(os.path.join(gTestAlertsPath, name))
 
 
 class obs_window_test_case:
@@ -33,10 +67,10 @@ class obs_window_test_case:
 
     def setup_prompt_case(self):
         self.case_name = "GRB190114C-prompt"
-        self.ra = 54.510
-        self.dec = -26.939
+        self.ra = 54.510 * u.deg
+        self.dec = -26.939 * u.deg
         self.time = datetime(2019, 1, 11, 20, 57, 23)
-        self.site = CTA_North()
+        self.site = CTANorth()
 
         self.zenith_min = 70 * u.deg
         self.max_delay = 10 * u.h
@@ -61,10 +95,10 @@ class obs_window_test_case:
 
     def setup_prompt_case_2(self):
         self.case_name = "GRB190114C-prompt 22222"
-        self.ra = 54.510
-        self.dec = -26.939
+        self.ra = 54.510 * u.deg
+        self.dec = -26.939 * u.deg
         self.time = datetime(2019, 1, 14, 20, 57, 3)
-        self.site = CTA_North()
+        self.site = CTANorth()
 
         self.zenith_min = 70 * u.deg
         self.max_delay = 2 * u.h
@@ -97,6 +131,510 @@ class TestObservationWindowCalculation(unittest.TestCase):
                             case.expected_duration))
 
 
+class TestMoonEphemeris(unittest.TestCase):
+    def pyephem_moon(self, times, site):
+        ''' reference: the former per-time pyephem loop (without refraction) '''
+        moon = ephem.Moon()
+        obs = ephem.Observer()
+        obs.lon = str(site.lon / u.deg)
+        obs.lat = str(site.lat / u.deg)
+        obs.elev = site.height / u.m
+        obs.pressure = 0
+
+        alts, azs, phases = [], [], []
+        for tt in times:
+            obs.date = ephem.Date(tt.datetime)
+            moon.compute(obs)
+            alts.append(moon.alt * 180. / np.pi)
+            azs.append(moon.az * 180. / np.pi)
+            phases.append(moon.phase)
+        return np.array(alts), np.array(azs), np.array(phases)
+
+    def test_moon_against_pyephem(self):
+        for site in [CTANorth(), CTASouth()]:
+            times = Time(datetime(2019, 1, 11)) + np.linspace(0, 30, 300) * u.day
+            alts, azs, phases = observation_windows.moon_alt_az_phase(times, site)
+            ref_alts, ref_azs, ref_phases = self.pyephem_moon(times, site)
+
+            delta_az = np.mod(azs - ref_azs + 180., 360.) - 180.
+            self.assertLess(np.max(np.abs(alts - ref_alts)), 0.01)
+            self.assertLess(np.max(np.abs(delta_az * np.cos(np.radians(alts)))), 0.01)
+            self.assertLess(np.max(np.abs(phases - ref_phases)), 0.1)
+
+
+class TestArrayHelpers(unittest.TestCase):
+    def test_against_scalar_helpers(self):
+        site = CTANorth()
+        times = [datetime(2019, 1, 11, 20 + i // 6, 10 * (i % 6)) for i in range(24)]
+        ra, dec = 54.51, -26.939
+
+        alts = observation_windows.source_alt_array(times, ra, dec, site)
+        ref_alts = [observation_windows.source_alt(tt, ra, dec, site) for tt in times]
+        self.assertLess(np.max(np.abs(alts - ref_alts)), 0.01)
+        sun_alts = observation_windows.sun_alt_array(times, site)
+        ref_sun_alts = [observation_windows.sun_alt(tt, site) for tt in times]
+        self.assertLess(np.max(np.abs(sun_alts - ref_sun_alts)), 0.01)
+
+        # moon distances against the astropy separation, for several targets at once
+        ras, decs = np.array([[ra], [120.]]), np.array([[dec], [20.]])
+        dists = observation_windows.moon_dist_array(times, ras, decs, site)
+        self.assertEqual(dists.shape, (2, len(times)))
+        obs_times = Time(times)
+        frame = AltAz(obstime=obs_times, location=site.location)
+        moon = get_body("moon", obs_times, site.location).transform_to(frame)
+        for i in range(2):
+            source = SkyCoord(ras[i, 0] * u.deg, decs[i, 0] * u.deg).transform_to(frame)
+            self.assertLess(np.max(np.abs(dists[i] - moon.separation(source).deg)), 0.01)
+        self.assertAlmostEqual(observation_windows.moon_dist(times[0], ra, dec, site).deg, dists[0, 0])
+
+
+class TestTimeModel(unittest.TestCase):
+    def test_conversions(self):
+        time = datetime(2019, 1, 11, 20, 57, 23, 500)
+        times = [time, np.datetime64(time), Time(time), "2019-01-11T20:57:23.000500"]
+        for tt in times:
+            self.assertEqual(time_model.to_datetime64(tt), np.datetime64(time, 'us'))
+        self.assertAlmostEqual(time_model.to_mjd(time), Time(time).utc.mjd, places=9)
+        self.assertEqual(time_model.from_mjd(time_model.to_mjd(time)), np.datetime64(time, 'us'))
+        self.assertEqual(time_model.full_hour(time), np.datetime64("2019-01-11T20:00"))
+        self.assertEqual(time_model.to_string(time), str(time))
+
+        window = observation_windows.ObservationWindow(54.51 * u.deg, -26.939 * u.deg, time, CTANorth(),
+                                                       window_requirements(70 * u.deg, 10 * u.h, 10 * u.min))
+        self.assertTrue(window.find_observation_window(time))
+        self.assertEqual(window.event_time.dtype, time_model.gTimeDtype)
+        self.assertEqual(window.start.dtype, time_model.gTimeDtype)
+        self.assertAlmostEqual(window.delay.to_value(u.h),
+                               round(time_model.hours_between(time, window.start), 3))
+
+
+class TestEphemerisCache(unittest.TestCase):
+    def test_interpolated_profiles(self):
+        site = CTANorth()
+        cache = ephemeris_cache.SiteEphemerisCache(site)
+        times = Time(datetime(2019, 1, 11, 12)) + np.linspace(0, 36, 200) * u.hour
+
+        sun_alts, moon_alts, moon_azs, _ = cache.profiles(times.mjd)
+        ref_sun_alts = get_sun(times).transform_to(AltAz(obstime=times, location=site.location)).alt.deg
+        ref_moon_alts, ref_moon_azs, _ = observation_windows.moon_alt_az_phase(times, site)
+
+        delta_az = np.mod(moon_azs - ref_moon_azs + 180., 360.) - 180.
+        self.assertLess(np.max(np.abs(sun_alts - ref_sun_alts)), 0.01)
+        self.assertLess(np.max(np.abs(moon_alts - ref_moon_alts)), 0.01)
+        self.assertLess(np.max(np.abs(delta_az * np.cos(np.radians(moon_alts)))), 0.01)
+
+        # a second query of the same nights is served from the cache
+        cache.profiles(times.mjd)
+        self.assertEqual(cache.misses, 2)
+
+    def test_eviction(self):
+        cache = ephemeris_cache.SiteEphemerisCache(CTANorth())
+        start = Time(datetime(2019, 1, 11, 20)).mjd
+        cache.keep_warm(start, nights_ahead=2)
+        self.assertEqual(len(cache.nights), 3)
+        cache.evict_past_nights(start + 3)
+        self.assertEqual(list(cache.nights), [cache.night_index(start) + 2])
+
+
+class TestDarknessAlmanac(unittest.TestCase):
+    def test_almanac_against_cache(self):
+        site = CTANorth()
+        start = Time(datetime(2019, 1, 11)).mjd
+        with tempfile.TemporaryDirectory() as directory:
+            darkness_almanac.build_almanac(site, start, directory, n_days=2, step=2. / 60. / 24.)
+            almanac = darkness_almanac.open_almanac(site, directory)
+            try:
+                mjds = start + 0.3 + np.linspace(0., 1.5, 300)
+                almanac_profiles = ephemeris_cache.get_site_cache(site).profiles(mjds)
+                cache_profiles = ephemeris_cache.SiteEphemerisCache(site).profiles(mjds)
+                for almanac_values, cache_values in zip(almanac_profiles[:2], cache_profiles[:2]):
+                    self.assertLess(np.max(np.abs(almanac_values - cache_values)), 0.05)
+
+                sun_alts, moon_alts = almanac_profiles[:2]
+                dark = (sun_alts < -18.) & (moon_alts < -0.5)
+                # the dark intervals end at the last dark sample of the almanac grid
+                intervals = almanac.dark_intervals(mjds[0], mjds[-1])
+                self.assertGreater(len(intervals), 0)
+                in_intervals = np.any((mjds[:, np.newaxis] >= intervals[:, 0])
+                                      & (mjds[:, np.newaxis] <= intervals[:, 1]), axis=1)
+                self.assertLess(np.sum(in_intervals != dark), 3)
+            finally:
+                del darkness_almanac.gAlmanacs[site.name]
+                del almanac
+
+
+class TestObservabilityIndex(unittest.TestCase):
+    def test_index_against_transform(self):
+        site = CTANorth()
+        sky_index = observability_index.SiteObservabilityIndex(site)
+        rng = np.random.default_rng(1)
+        ras = rng.uniform(0., 360., 200) * u.deg
+        decs = np.degrees(np.arcsin(rng.uniform(-1., 1., 200))) * u.deg
+        mjds = Time(datetime(2019, 1, 11, 20)).mjd + np.linspace(-0.1, 0.7, 100)
+
+        alts = sky_index.source_alts(ras, decs, mjds, 20 * u.deg)
+        exact = SkyCoord(ras[:, np.newaxis], decs[:, np.newaxis]).transform_to(
+            AltAz(obstime=Time(mjds, format='mjd'), location=site.location)).alt.deg
+
+        # same zenith constraint except for samples within arcseconds of the limit
+        differs = (alts > 20.) != (exact > 20.)
+        self.assertTrue(np.all(np.abs(exact[differs] - 20.) < 10. / 3600.))
+        self.assertGreater(sky_index.lookups, sky_index.exact_transforms)
+
+
+class TestAltAzEngine(unittest.TestCase):
+    def test_engine_against_transform(self):
+        site = CTASouth()
+        rng = np.random.default_rng(2)
+        ras = rng.uniform(0., 360., 50) * u.deg
+        decs = np.degrees(np.arcsin(rng.uniform(-1., 1., 50))) * u.deg
+        mjds = Time(datetime(2019, 1, 11, 20)).mjd + np.linspace(0., 0.5, 20)
+
+        alts, azs = altaz_engine.source_alt_az(ras[:, np.newaxis], decs[:, np.newaxis], mjds, site)
+        exact = SkyCoord(ras[:, np.newaxis], decs[:, np.newaxis]).transform_to(
+            AltAz(obstime=Time(mjds, format='mjd'), location=site.location))
+
+        separation = SkyCoord(azs * u.deg, alts * u.deg).separation(
+            SkyCoord(exact.az, exact.alt))
+        self.assertLess(np.max(separation), altaz_engine.gAccuracy)
+
+
+class window_requirements:
+    def __init__(self, zenith_max, max_delay, min_duration, search_mode="grid",
+                 max_nsb=None, illumination=None, engine=None):
+        self.max_zenith_angle = zenith_max
+        self.max_delay_to_event = max_delay
+        self.min_window_duration = min_duration
+        self.min_nsb = None
+        self.max_nsb = max_nsb
+        self.illumination = illumination
+        self.search_mode = search_mode
+        self.engine = engine
+        self.edge_tolerance = None
+
+
+class TestObservationWindowBatch(unittest.TestCase):
+    def test_batch_against_single_windows(self):
+        reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min)
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        ras = np.array([54.51, 120., 200., 300.]) * u.deg
+        decs = np.array([-26.939, 20., 60., -50.]) * u.deg
+
+        batch = observation_windows.ObservationWindowBatch(ras, decs, time, CTANorth(), reqs)
+        batch.find_observation_windows(time)
+
+        for i, batch_window in enumerate(batch.windows()):
+            window = observation_windows.ObservationWindow(ras[i], decs[i], time, CTANorth(), reqs)
+            found = window.find_observation_window(time)
+            self.assertEqual(found, batch.valid[i])
+            self.assertEqual(window.delay, batch_window.delay)
+            if found:
+                self.assertLess(abs(time_model.hours_between(batch_window.start, window.start) * 3600.), 1e-3)
+                self.assertLess(abs(window.duration - batch_window.duration), 1 * u.s)
+
+    def test_search_modes_and_engines(self):
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        ras = np.array([120., 200.]) * u.deg
+        decs = np.array([20., 60.]) * u.deg
+        for mode, engine in [("adaptive", None), ("analytic", None), ("grid", "fast")]:
+            reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, mode, engine=engine)
+            batch = observation_windows.ObservationWindowBatch(ras, decs, time, CTANorth(), reqs)
+            batch.find_observation_windows(time)
+            for i in range(len(ras)):
+                window = observation_windows.ObservationWindow(ras[i], decs[i], time, CTANorth(), reqs)
+                self.assertEqual(window.find_observation_window(time), batch.valid[i])
+                self.assertEqual(window.start, batch.starts[i])
+                self.assertEqual(window.end, batch.window(i).end)
+
+
+class TestAdaptiveWindowSearch(unittest.TestCase):
+    def test_adaptive_against_grid(self):
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        grid_reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min)
+        adaptive_reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, "adaptive")
+        # the grid search is only precise to its step size
+        grid_step = 17 * 60 * 60 / 425 * u.s
+
+        for ra, dec in [(54.51, -26.939), (120., 20.), (200., 60.)]:
+            grid = observation_windows.ObservationWindow(ra * u.deg, dec * u.deg, time,
+                                                         CTANorth(), grid_reqs)
+            adaptive = observation_windows.ObservationWindow(ra * u.deg, dec * u.deg, time,
+                                                             CTANorth(), adaptive_reqs)
+            self.assertTrue(grid.find_observation_window(time))
+            self.assertTrue(adaptive.find_observation_window(time))
+            self.assertLess(abs(time_model.hours_between(adaptive.start, grid.start) * 3600.), grid_step.value)
+            self.assertLess(abs(time_model.hours_between(adaptive.end, grid.end) * 3600.), grid_step.value)
+
+
+class TestAnalyticWindowSearch(unittest.TestCase):
+    def test_analytic_against_grid_and_adaptive(self):
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        grid_step = 17 * 60 * 60 / 425 * u.s
+
+        for ra, dec in [(54.51, -26.939), (120., 20.), (200., 60.)]:
+            windows = {}
+            for mode in ["grid", "adaptive", "analytic"]:
+                reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, mode)
+                windows[mode] = observation_windows.ObservationWindow(ra * u.deg, dec * u.deg, time,
+                                                                      CTANorth(), reqs)
+                self.assertTrue(windows[mode].find_observation_window(time))
+
+            analytic = windows["analytic"]
+            for mode, tolerance in [("grid", grid_step.value), ("adaptive", 10.)]:
+                delta = time_model.hours_between(analytic.start, windows[mode].start) * 3600.
+                self.assertLess(abs(delta), tolerance)
+                delta = time_model.hours_between(analytic.end, windows[mode].end) * 3600.
+                self.assertLess(abs(delta), tolerance)
+
+    def test_solve_crossings(self):
+        roots = observation_windows.solve_crossings(np.cos, [1., 4.], [2., 5.], np.cos([1., 4.]),
+                                                    np.cos([2., 5.]), 1e-9)
+        self.assertTrue(np.allclose(roots, [np.pi / 2, 3 * np.pi / 2]))
+
+
+class TestWindowIteration(unittest.TestCase):
+    def test_nightly_windows(self):
+        reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, "analytic")
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        ra, dec, site = 54.51 * u.deg, -26.939 * u.deg, CTANorth()
+
+        window = observation_windows.ObservationWindow(ra, dec, time, site, reqs)
+        self.assertTrue(window.find_observation_window(time))
+        windows = list(observation_windows.iterate_observation_windows(ra, dec, time, site, reqs, time))
+        self.assertEqual(len(windows), 1)
+        self.assertLess(abs(windows[0]['end'] - window.windows[0]['end']), np.timedelta64(2, 's'))
+
+        # the following nights are only searched when they are reached
+        nightly = observation_windows.iterate_observation_windows(ra, dec, time, site, reqs, time,
+                                                                  n_nights=30)
+        starts = [next(nightly)['start'] for _ in range(3)]
+        self.assertEqual(starts[0], windows[0]['start'])
+        self.assertTrue(np.all(np.diff(starts) > np.timedelta64(20, 'h')))
+
+
+class TestWindowEngines(unittest.TestCase):
+    def test_fast_against_astropy(self):
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        windows = {}
+        for engine in ["fast", "astropy"]:
+            reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, "adaptive", engine=engine)
+            reqs.edge_tolerance = 5 * u.s
+            windows[engine] = observation_windows.ObservationWindow(54.51 * u.deg, -26.939 * u.deg,
+                                                                    time, CTANorth(), reqs)
+            self.assertTrue(windows[engine].find_observation_window(time))
+
+        margin = observation_windows.gFastEngineMargin + reqs.edge_tolerance
+        margin = np.timedelta64(int(margin.to_value(u.us)), 'us')
+        for edge in ['start', 'end']:
+            differences = np.abs(windows["fast"].windows[edge] - windows["astropy"].windows[edge])
+            self.assertTrue(np.all(differences < margin))
+        self.assertEqual(observation_windows.engine_for_urgency("rapid-now"), "fast")
+
+    def test_fast_engine_imports(self):
+        # the fast engine of "rapid-now" runs in a fresh process without astropy.coordinates
+        code = "\n".join([
+            "import sys",
+            "from types import SimpleNamespace",
+            "from datetime import datetime",
+            "import astropy.units as u",
+            "from alert_processor import observation_windows",
+            "from utilities.observatories import CTANorth",
+            "reqs = SimpleNamespace(max_zenith_angle=70 * u.deg, max_delay_to_event=10 * u.h,",
+            "    min_window_duration=10 * u.min, min_nsb=None, max_nsb=None, illumination=None,",
+            "    search_mode='grid', edge_tolerance=None,",
+            "    engine=observation_windows.engine_for_urgency('rapid-now'))",
+            "time = datetime(2019, 1, 11, 20, 57, 23)",
+            "window = observation_windows.ObservationWindow(54.51 * u.deg, -26.939 * u.deg, time,",
+            "                                               CTANorth(), reqs)",
+            "print(window.find_observation_window(time))",
+            "print('astropy.coordinates' in sys.modules, 'ephem' in sys.modules)"])
+        repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=repository, check=True).stdout
+        self.assertEqual(output.split(), ["True", "False", "False"])
+
+
+class TestVisibilityPrefilter(unittest.TestCase):
+    def test_rejects(self):
+        prefilter = visibility_prefilter.VisibilityPrefilter()
+        reqs = window_requirements(60 * u.deg, 2 * u.h, 10 * u.min)
+        night = datetime(2019, 1, 11, 20, 57, 23)
+        day = datetime(2019, 1, 11, 12, 0, 0)
+
+        self.assertEqual(prefilter.reject(80 * u.deg, night, night, CTASouth(), reqs), "declination")
+        self.assertEqual(prefilter.reject(-26.939 * u.deg, day, day, CTANorth(), reqs), "daylight")
+        self.assertIsNone(prefilter.reject(-26.939 * u.deg, night, night, CTANorth(), reqs))
+        self.assertAlmostEqual(prefilter.reject_rate(), 2. / 3.)
+
+        # the full search agrees for the rejected cases
+        for dec, time, site in [(80 * u.deg, night, CTASouth()), (-26.939 * u.deg, day, CTANorth())]:
+            window = observation_windows.ObservationWindow(54.51 * u.deg, dec, time, site, reqs)
+            self.assertFalse(window.find_observation_window(time))
+
+    def test_almanac_rejects(self):
+        # full moon: the moon is up during all of the astronomical night
+        site = CTANorth()
+        time = datetime(2019, 1, 20, 20)
+        start = Time(datetime(2019, 1, 20)).mjd
+        prefilter = visibility_prefilter.VisibilityPrefilter()
+        reqs = window_requirements(70 * u.deg, 2 * u.h, 10 * u.min)
+        nsb_reqs = window_requirements(70 * u.deg, 2 * u.h, 10 * u.min, max_nsb=6 * u.GHz)
+        self.assertIsNone(prefilter.reject(40 * u.deg, time, time, site, reqs))
+        with tempfile.TemporaryDirectory() as directory:
+            darkness_almanac.build_almanac(site, start, directory, n_days=2, step=2. / 60. / 24.)
+            almanac = darkness_almanac.open_almanac(site, directory)
+            try:
+                self.assertEqual(prefilter.reject(40 * u.deg, time, time, site, reqs), "moonlight")
+                self.assertIsNone(prefilter.reject(40 * u.deg, time, time, site, nsb_reqs))
+            finally:
+                del darkness_almanac.gAlmanacs[site.name]
+                del almanac
+
+        window = observation_windows.ObservationWindow(30 * u.deg, 40 * u.deg, time, site, reqs)
+        self.assertFalse(window.find_observation_window(time))
+
+
+class TestSkyQuality(unittest.TestCase):
+    def test_sky_brightness_model(self):
+        self.assertAlmostEqual(sky_brightness.relative_nsb(-30., -10., 100., 90., 90.), 1., places=1)
+        full_moon = sky_brightness.relative_nsb(-30., 45., 100., 60., 60.)
+        half_moon = sky_brightness.relative_nsb(-30., 45., 50., 60., 60.)
+        close_half_moon = sky_brightness.relative_nsb(-30., 45., 50., 20., 60.)
+        self.assertGreater(full_moon, half_moon)
+        self.assertGreater(close_half_moon, half_moon)
+        self.assertGreater(half_moon, 1.)
+
+    def test_moonlight_windows(self):
+        time = datetime(2019, 1, 14, 20)
+        for mode in ["grid", "adaptive", "analytic"]:
+            dark_reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, mode)
+            moon_reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, mode, 1 * u.GHz, 0.7)
+            dark = observation_windows.ObservationWindow(120 * u.deg, 20 * u.deg, time, CTANorth(), dark_reqs)
+            moon = observation_windows.ObservationWindow(120 * u.deg, 20 * u.deg, time, CTANorth(), moon_reqs)
+            self.assertTrue(dark.find_observation_window(time))
+            self.assertTrue(moon.find_observation_window(time))
+            # the moon sets during the night: observing under moonlight starts earlier
+            self.assertGreater(moon.duration, dark.duration + 2 * u.h)
+
+    def test_max_nsb_only(self):
+        # full moon: the moon is up all night and too bright for the illumination limit
+        time = datetime(2019, 1, 19, 18)
+        grid_step = 17 * 60 * 60 / 425
+        durations = []
+        for max_nsb in [4 * u.GHz, 6 * u.GHz]:
+            windows = {}
+            for mode in ["grid", "adaptive", "analytic"]:
+                reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, mode, max_nsb, 0.7)
+                window = observation_windows.ObservationWindow(30 * u.deg, 40 * u.deg, time, CTANorth(), reqs)
+                self.assertFalse(window.find_observation_window(time))
+                # without an illumination limit the max. NSB alone allows the moonlight
+                reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, mode, max_nsb)
+                windows[mode] = observation_windows.ObservationWindow(30 * u.deg, 40 * u.deg, time,
+                                                                      CTANorth(), reqs)
+                self.assertTrue(windows[mode].find_observation_window(time))
+            for mode, tolerance in [("grid", grid_step), ("adaptive", 10.)]:
+                self.assertLess(abs(time_model.hours_between(windows["analytic"].end,
+                                                             windows[mode].end) * 3600.), tolerance)
+            durations.append(windows["analytic"].duration)
+        self.assertGreater(durations[1], durations[0] + 1 * u.h)
+
+    def test_nsb_limited_windows(self):
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        grid_step = 17 * 60 * 60 / 425
+        for ra, dec, max_nsb in [(120, 20, 0.3 * u.GHz), (200, 60, 0.4 * u.GHz)]:
+            dark_reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, "analytic")
+            dark = observation_windows.ObservationWindow(ra * u.deg, dec * u.deg, time, CTANorth(), dark_reqs)
+            self.assertTrue(dark.find_observation_window(time))
+            windows = {}
+            for mode in ["grid", "adaptive", "analytic"]:
+                reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min, mode, max_nsb, 0.7)
+                windows[mode] = observation_windows.ObservationWindow(ra * u.deg, dec * u.deg, time,
+                                                                      CTANorth(), reqs)
+                self.assertTrue(windows[mode].find_observation_window(time))
+            # the night sky brightness limits the window, not the darkness
+            self.assertLess(windows["analytic"].duration, dark.duration - 30 * u.min)
+            for mode, tolerance in [("grid", grid_step), ("adaptive", 10.)]:
+                self.assertLess(abs(time_model.hours_between(windows["analytic"].start,
+                                                             windows[mode].start) * 3600.), tolerance)
+                self.assertLess(abs(time_model.hours_between(windows["analytic"].end,
+                                                             windows[mode].end) * 3600.), tolerance)
+
+
+class TestObservationWindowMemo(unittest.TestCase):
+    def test_shared_windows_and_profiles(self):
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        ra, dec = 54.51 * u.deg, -26.939 * u.deg
+        memo = observation_windows.ObservationWindowMemo()
+
+        reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min)
+        same_reqs = window_requirements(70 * u.deg, 10 * u.h, 10 * u.min)
+        zenith_reqs = window_requirements(50 * u.deg, 10 * u.h, 10 * u.min)
+
+        window, found = memo.get_window(ra, dec, time, CTANorth(), reqs, time)
+        same_window, _ = memo.get_window(ra, dec, time, CTANorth(), same_reqs, time)
+        zenith_window, zenith_found = memo.get_window(ra, dec, time, CTANorth(), zenith_reqs, time)
+        self.assertIs(window, same_window)
+        self.assertEqual((memo.window_hits, memo.window_misses), (1, 2))
+        self.assertEqual((memo.profile_hits, memo.profile_misses), (1, 1))
+
+        # the shared profiles give the same window as a separate calculation
+        expected = observation_windows.ObservationWindow(ra, dec, time, CTANorth(), zenith_reqs)
+        self.assertEqual(expected.find_observation_window(time), zenith_found)
+        self.assertEqual(expected.start, zenith_window.start)
+        self.assertEqual(expected.end, zenith_window.end)
+
+
+class TestAllObservationWindows(unittest.TestCase):
+    def test_multiple_nights(self):
+        time = datetime(2019, 1, 11, 20, 57, 23)
+        reqs = window_requirements(70 * u.deg, 30 * u.h, 10 * u.min)
+        window = observation_windows.ObservationWindow(54.51 * u.deg, -26.939 * u.deg, time,
+                                                       CTANorth(), reqs)
+        self.assertTrue(window.find_observation_window(time))
+
+        windows = window.windows
+        self.assertGreater(len(windows), 1)
+        self.assertEqual(windows[0]['start'], window.start)
+        # as before the windows were split: the end is the last valid time of the search
+        # range, the duration the one of the first window
+        self.assertEqual(windows[-1]['end'], window.end)
+        self.assertGreater(window.end, windows[0]['end'])
+        self.assertAlmostEqual(window.duration.to_value(u.h), windows[0]['duration'])
+        self.assertTrue(np.all(windows['start'][1:] - windows['end'][:-1] > np.timedelta64(1, 'h')))
+        self.assertTrue(np.all(windows['duration'] > 0))
+
+
+class TestWarmUp(unittest.TestCase):
+    def test_offline_warm_up(self):
+        from astropy.utils import iers
+        duration = warm_up.warm_up([CTANorth()], leap_second_path=iers.IERS_LEAP_SECOND_FILE)
+        self.assertFalse(iers.conf.auto_download)
+        self.assertGreater(duration, 0.)
+        cache = ephemeris_cache.get_site_cache(CTANorth())
+        self.assertIn(int(cache.night_index(Time.now().mjd)), cache.nights)
+
+
+class TestSites(unittest.TestCase):
+    def test_get_site(self):
+        self.assertEqual(get_site("CTA_South").name, CTASouth().name)
+        self.assertEqual(get_site("CTA North").name, CTANorth().name)
+        with self.assertRaises(ValueError):
+            get_site("La Palma")
+
+    def test_site_dependent_cuts(self):
+        collection = cuts.CutCollection({"CommonCuts": {"max_delay": ["1 h", "<"],
+                                                        "alert_parameter.Rate_Signif": ["1", ">"]},
+                                         "CustomCuts": {"swift_grb_cuts.Swift_counts": ["1", ">"]}})
+        self.assertEqual([compiled_cut.cut.cut_name for compiled_cut in collection.site_dependent_plan],
+                         ["max_delay"])
+        # custom cuts need the window unless their module declares them window-free
+        self.assertEqual([compiled_cut.cut.cut_name for compiled_cut in collection.site_independent_plan],
+                         ["alert_parameter.Rate_Signif", "Swift_counts"])
+        wobble = cuts.CompiledCustomCut(cuts.Cut("Custom_coords", "true", "==", cuts.CutTypes.custom_cuts,
+                                                 "swift_grb_cuts"))
+        self.assertTrue(wobble.site_dependent)
+
+
 class TestCutEvaluation(unittest.TestCase):
     def prepare_cut_tests(self):
         test_definitions = {cut_conditions(True, "==", True): True,
@@ -122,7 +660,7 @@ class TestCutEvaluation(unittest.TestCase):
         for cut_conds, expected_result in cuts_to_test.items():
             name = cut_conds.name
             print(name, "...")
-            cut = cuts.cut(name, cut_conds.required, cuts.Comparator(cut_conds.comp),
+            cut = cuts.Cut(name, cut_conds.required, cuts.Comparator(cut_conds.comp),
                            cuts.CutTypes.common_cuts, False, cut_conds.actual)
             cut.evaluate()
             result = (cut.performed and cut.passed)
@@ -131,6 +669,239 @@ class TestCutEvaluation(unittest.TestCase):
                 print("cut: %s failed..." % (name))
             self.assertTrue(comp)
 
+    def test_compiled_plan(self):
+        cut_data = {"CommonCuts": {"max_delay": ["10hour", "<"], "min_delay": ["2hour", ">"]},
+                    "CustomCuts": {}}
+        window = observation_windows.ObservationWindow()
+        for delay in [5 * u.h, 1 * u.h, 12 * u.h, 300 * u.min, 10 * u.h, np.inf, 3 * u.K]:
+            collection = cuts.CutCollection(cut_data)
+            collection.evaluate_all = True
+            self.assertEqual(len(collection.site_dependent_plan), 2)
+            window.delay = delay
+            collection.execute_site_dependent_cuts(None, window, None)
+            for cut in collection.common_cuts:
+                reference = cuts.Cut(cut.cut_name, cut.required_value, cut.comparator,
+                                     cuts.CutTypes.common_cuts, actual_value=delay)
+                reference.evaluate()
+                self.assertEqual((cut.performed, cut.passed), (reference.performed, reference.passed))
+
+
+class TestBatchEvaluation(unittest.TestCase):
+    def test_cut_matrix(self):
+        sci_alerts = [load_test_alert(name) for name in sorted(os.listdir(gTestAlertsPath))]
+        cut_data = {"CommonCuts": {"max_delay": ["10hour", "<"], "min_delay": ["2hour", ">"],
+                                   "alert_parameter.Rate_Signif": ["100", ">"]},
+                    "CustomCuts": {"swift_grb_cuts.GRB_selection": [True, "=="],
+                                   "swift_grb_cuts.Swift_counts": ["2000", ">"]}}
+
+        delays = [5 * u.h, 1 * u.h, 12 * u.h, 300 * u.min, 10 * u.h, np.inf, 3 * u.K]
+        rows = [(sci_alerts[row % len(sci_alerts)], delay) for row, delay in enumerate(delays)]
+        windows = []
+        for _, delay in rows:
+            windows.append(observation_windows.ObservationWindow())
+            windows[-1].delay = delay
+
+        collection = cuts.CutCollection(cut_data)
+        matrix = collection.evaluate_batch([sci_alert for sci_alert, _ in rows], windows)
+        self.assertEqual(matrix.passed.shape, (len(rows), 5))
+        self.assertEqual(matrix.cut_names[3], "swift_grb_cuts.GRB_selection")
+        self.assertEqual(matrix.values[0, 0], 5 * 3600.)
+        self.assertEqual(matrix.values[3, 0], 5 * 3600.)
+
+        # same results as the evaluation of the single alerts
+        for row, (sci_alert, _) in enumerate(rows):
+            single = cuts.CutCollection(cut_data)
+            single.evaluate_all = True
+            single.execute(sci_alert, windows[row], None)
+            single_cuts = single.common_cuts + single.custom_cuts
+            self.assertEqual(list(matrix.performed[row]), [cut.performed for cut in single_cuts])
+            self.assertEqual(list(matrix.passed[row]), [cut.passed for cut in single_cuts])
+            self.assertEqual(matrix.result()[row], single.result())
+
+        # without windows only the cuts on the alert are performed
+        matrix = collection.evaluate_batch(sci_alerts)
+        self.assertEqual(list(matrix.performed[0]), [False, False, True, True, True])
+        self.assertEqual(list(matrix.cut_passed("alert_parameter.Rate_Signif")), [True, False])
+
+
+class TestLazyCuts(unittest.TestCase):
+    def test_short_circuit(self):
+        sci_alert = load_test_alert()
+        cut_data = {"CommonCuts": {"max_delay": ["10hour", "<"],
+                                   "alert_parameter.Rate_Signif": ["1000", ">"]},
+                    "CustomCuts": {"swift_grb_cuts.GRB_selection": [True, "=="]}}
+
+        collection = cuts.CutCollection(cut_data)
+        self.assertEqual(len(collection.site_independent_plan), 2)
+        self.assertFalse(collection.execute_site_independent_cuts(sci_alert, None))
+        self.assertFalse(collection.needs_window())
+        self.assertFalse(collection.common_cuts[0].performed)
+        self.assertFalse(collection.result())
+
+        # all cuts without window are evaluated for the report
+        collection.evaluate_all = True
+        self.assertFalse(collection.execute_site_independent_cuts(sci_alert, None))
+        self.assertTrue(collection.needs_window())
+        self.assertEqual([cut.performed for cut in collection.custom_cuts], [True])
+        self.assertTrue(collection.custom_cuts[0].passed)
+
+
+class TestCustomCutRegistry(unittest.TestCase):
+    def test_registry(self):
+        spec = custom_cut_registry.get_custom_cut("swift_grb_cuts", "GRB_selection")
+        self.assertFalse(spec.needs_window)
+        self.assertEqual(spec.function.__name__, "perform_grb_selection")
+
+        # unknown custom cuts are rejected when the config is loaded
+        for origin, name in [("swift_grb_cuts", "GRB_selektion"), ("no_such_module", "GRB_selection")]:
+            with self.assertRaises(ValueError):
+                cuts.CutCollection({"CommonCuts": {}, "CustomCuts": {origin + "." + name: [True, "=="]}})
+
+        with self.assertRaises(TypeError):
+            custom_cut_registry.custom_cut("bad_cut")(lambda sci_alert: True)
+
+
+@custom_cut_registry.custom_cut("quick_cut", needs_window=False)
+def quick_cut(sci_alert, sci_case, obs_window):
+    return True
+
+
+@custom_cut_registry.custom_cut("hanging_cut", needs_window=False)
+def hanging_cut(sci_alert, sci_case, obs_window):
+    time.sleep(30)
+    return True
+
+
+class TestCustomCutPool(unittest.TestCase):
+    def test_deadline(self):
+        sci_alert = load_test_alert()
+        origin = __name__.rsplit(".", 1)[-1]
+        cut_data = {"CommonCuts": {},
+                    "CustomCuts": {origin + ".hanging_cut": [True, "==", "0.5 s"],
+                                   origin + ".quick_cut": [True, "=="]}}
+        collection = cuts.CutCollection(cut_data)
+        self.assertEqual(collection.custom_cuts[0].deadline, 0.5)
+
+        custom_cut_pool.configure(2)
+        pool = custom_cut_pool.get_pool()
+        try:
+            pids = [worker.process.pid for worker in pool.workers]
+            start = time.perf_counter()
+            self.assertFalse(collection.execute_site_independent_cuts(sci_alert, None))
+            self.assertLess(time.perf_counter() - start, 5.)
+
+            hanging, quick = collection.custom_cuts
+            self.assertEqual((hanging.performed, hanging.passed), (True, False))
+            self.assertEqual((quick.performed, quick.passed), (True, True))
+            self.assertEqual(pool.timeouts, 1)
+            self.assertEqual([compiled_cut.n_runs for compiled_cut in collection.site_independent_plan], [1, 1])
+
+            # the worker of the hanging cut was replaced and the pool still works
+            self.assertEqual(len(set(pids) & {worker.process.pid for worker in pool.workers}), 1)
+            self.assertIs(custom_cut_pool.get_pool(), pool)
+            collection.execute_site_independent_cuts(sci_alert, None)
+            self.assertTrue(quick.passed)
+        finally:
+            custom_cut_pool.configure(0)
+            pool.shutdown()
+            custom_cut_pool.gCustomCutPool = None
+
+    def test_site_config_without_pool(self):
+        sci_alert = load_test_alert()
+        origin = __name__.rsplit(".", 1)[-1]
+        with tempfile.TemporaryDirectory() as directory:
+            site_cfg_path = os.path.join(directory, "th_site_config.json")
+            with open(site_cfg_path, "w") as site_cfg_file:
+                json.dump({"SiteConfig": {"site": "CTA_North", "science_config_path": directory,
+                                          "allowed_alerts": {}, "custom_cut_workers": 0}}, site_cfg_file)
+            site_cfg = site_config.SiteConfiguration()
+            site_cfg.read_site_cfg(site_cfg_path)
+
+        self.assertEqual(site_cfg.custom_cut_workers, 0)
+        processing_manager.ProcessingManager([], site_cfg)
+        self.assertIsNone(custom_cut_pool.get_pool())
+
+        collection = cuts.CutCollection({"CommonCuts": {}, "CustomCuts": {origin + ".quick_cut": [True, "=="]}})
+        self.assertTrue(collection.execute_site_independent_cuts(sci_alert, None))
+        self.assertIsNone(custom_cut_pool.gCustomCutPool)
+
+        with self.assertRaises(ValueError):
+            site_config.parse_custom_cut_workers({"SiteConfig": {"custom_cut_workers": -1}})
+
+
+class TestAlertParameterIndex(unittest.TestCase):
+    def test_index(self):
+        sci_alert = load_test_alert()
+        self.assertIsNone(sci_alert.parameters)
+
+        # same Params as the XPath search, with typed values
+        for param in sci_alert.alert.findall(".//Param"):
+            name = param.attrib["name"]
+            first = sci_alert.alert.find(".//Param[@name='%s']" % name).attrib["value"]
+            value = sci_alert.parameter(name)
+            if isinstance(value, bool):
+                self.assertEqual(value, first == "true")
+            elif isinstance(value, float):
+                self.assertEqual(value, float(first))
+            else:
+                self.assertEqual(value, first)
+
+        self.assertEqual(sci_alert.parameter("Rate_Signif"), 18.52)
+        self.assertEqual(sci_alert.parameter_index().get("Rate_Signif").unit, "sigma")
+        self.assertIs(sci_alert.parameter("GRB_Identified", group="Solution_Status"), True)
+        self.assertEqual(sci_alert.parameter("Bkg_Time"), "21:33:28.30")
+        with self.assertRaises(KeyError):
+            sci_alert.parameter("Rate_Signif", group="Solution_Status")
+
+        index = sci_alert.parameter_index()
+        self.assertEqual(index.reads["Rate_Signif"], 3)
+        self.assertEqual(index.reads["Solution_Status.GRB_Identified"], 1)
+
+
+class predicate_graph_case:
+    def __init__(self, name, alert_types, cut_data):
+        self.name = name
+        self.allowed_alert_types = []
+        for alert_type in alert_types:
+            allowed_type = AllowedAlertTypes()
+            allowed_type.alert_type = alert_type
+            self.allowed_alert_types.append(allowed_type)
+        self.cut_collection = cuts.CutCollection(cut_data)
+
+
+class TestPredicateGraph(unittest.TestCase):
+    def test_shared_predicates(self):
+        sci_alert = load_test_alert()
+        configs = []
+        for i, threshold in enumerate(["10", "10.0", "20", "100"]):
+            configs.append(predicate_graph_case("config %i" % i, ["SWIFT#BAT_GRB_Pos", "FERMI"],
+                                                {"CommonCuts": {"alert_parameter.Rate_Signif": [threshold, ">"],
+                                                                "max_delay": ["1 h", "<"]},
+                                                 "CustomCuts": {}}))
+        configs.append(predicate_graph_case("fermi", ["FERMI"], {"CommonCuts": {}, "CustomCuts": {}}))
+
+        graph = predicate_graph.PredicateGraph(configs)
+        self.assertEqual(len(graph.predicates), 4)
+        self.assertEqual(graph.match(sci_alert.ivorn), configs[:4])
+
+        graph.start_alert()
+        results = [config.cut_collection.execute_site_independent_cuts(sci_alert, config)
+                   for config in configs[:4]]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual((len(graph.results), graph.results.hits), (3, 1))
+        self.assertEqual(configs[1].cut_collection.common_cuts[0].actual_value, 18.52)
+
+    def test_bool_and_int_thresholds(self):
+        configs = [predicate_graph_case("config %i" % i, ["SWIFT#BAT_GRB_Pos"],
+                                        {"CommonCuts": {"alert_parameter.GRB_Identified": [threshold, "=="]},
+                                         "CustomCuts": {}})
+                   for i, threshold in enumerate([True, 1])]
+        graph = predicate_graph.PredicateGraph(configs)
+        # True == 1 in python, but the thresholds are different predicates
+        self.assertEqual(len(graph.predicates), 2)
+        self.assertNotEqual(cuts.threshold_key(True), cuts.threshold_key(1))
+        self.assertNotEqual(cuts.threshold_key(1), cuts.threshold_key(1.0))
+
 
 class cut_conditions:
     def __init__(self, required, comp, actual):
@@ -140,12 +911,78 @@ class cut_conditions:
         self.name = "%s %s %s" % (required, comp, actual)
 
 
+# custom cuts recording the order in which they run
+gCutOrder = []
+
+
+@custom_cut_registry.custom_cut("slow_cheap_cut", needs_window=False)
+def slow_cheap_cut(sci_alert, sci_case, obs_window):
+    gCutOrder.append("slow_cheap_cut")
+    time.sleep(0.05)
+    return True
+
+
+@custom_cut_registry.custom_cut("fast_expensive_cut", needs_window=False, cost=1.)
+def fast_expensive_cut(sci_alert, sci_case, obs_window):
+    gCutOrder.append("fast_expensive_cut")
+    return True
+
+
+@custom_cut_registry.custom_cut("slow_rejecting_cut", needs_window=False, cost=10.)
+def slow_rejecting_cut(sci_alert, sci_case, obs_window):
+    gCutOrder.append("slow_rejecting_cut")
+    time.sleep(0.1)
+    return False
+
+
 class TestAlertEntry(unittest.TestCase):
-    def prepare_alert_entry_test(self):
-        pass
+    def prepare_alert_entry_test(self, directory):
+        ''' site config with one science config using the order recording cuts '''
+        package_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.path.join(package_path, "science_configurations",
+                               "science_config_swift_bat_prompt_GRB_example.json")) as cfg_file:
+            science_cfg = json.load(cfg_file)
+        origin = __name__.rsplit(".", 1)[-1]
+        # the alert is rejected before the window search
+        science_cfg["ProcessingCuts"] = {"CommonCuts": {},
+                                         "CustomCuts": {origin + ".slow_cheap_cut": [True, "=="],
+                                                        origin + ".fast_expensive_cut": [True, "=="],
+                                                        origin + ".slow_rejecting_cut": [True, "=="]}}
+        os.mkdir(os.path.join(directory, "science_configurations"))
+        with open(os.path.join(directory, "science_configurations", "science_config.json"), "w") as cfg_file:
+            json.dump(science_cfg, cfg_file)
+
+        site_cfg_path = os.path.join(directory, "th_site_config.json")
+        with open(site_cfg_path, "w") as site_cfg_file:
+            json.dump({"SiteConfig": {"site": "CTA_North",
+                                      "science_config_path": os.path.join(directory, "science_configurations"),
+                                      "allowed_alerts": {"swift_grbs": "SWIFT#BAT_GRB_Pos"},
+                                      "custom_cut_workers": 0}}, site_cfg_file)
+        return site_cfg_path
 
     def test_alert_entry(self):
-        pass
+        alert_path = os.path.join(gTestAlertsPath, "ivo___nasa_gsfc_gcn_SWIFT_BAT_GRB_Pos_883832-433")
+        previous_site_cfg = os.environ.get('TH_site_config')
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ['TH_site_config'] = self.prepare_alert_entry_test(directory)
+            try:
+                entry_points.warm_up()
+                proc_manager = entry_points.gProcessingSetup[2]
+                del gCutOrder[:]
+                for _ in range(2):
+                    entry_points.alert_entry(alert_path, entry_points.alert_origin.injected_voevent,
+                                             TestingConditions(datetime(2019, 1, 11, 20, 57, 23)))
+
+                # the configs are kept and the measured costs reorder the cuts of the second alert
+                self.assertIs(entry_points.gProcessingSetup[2], proc_manager)
+                self.assertEqual(gCutOrder, ["slow_cheap_cut", "fast_expensive_cut", "slow_rejecting_cut",
+                                             "fast_expensive_cut", "slow_cheap_cut", "slow_rejecting_cut"])
+            finally:
+                entry_points.gProcessingSetup = None
+                if previous_site_cfg is None:
+                    del os.environ['TH_site_config']
+                else:
+                    os.environ['TH_site_config'] = previous_site_cfg
 
 
 if __name__ == "__main__":
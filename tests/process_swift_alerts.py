@@ -24,6 +24,7 @@ def main():
     # test_conditions = tc(datetime(2019, 10, 4, 21, 33, 55))
     test_conditions = tc(datetime(2019, 1, 11, 20, 57, 23))
 
+    th.warm_up()
     th.alert_entry(alert_path, th.alert_origin.injected_voevent, test_conditions)
     # th.alert_entry(alert_path, th.alert_origin.injected_voevent)
 
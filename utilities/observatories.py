@@ -1,22 +1,46 @@
 from astropy import units as u
-from astropy.coordinates import EarthLocation
+
+
+class Site:
+    ''' base of the sites. The astropy EarthLocation is only needed by the astropy
+    transforms and is created on first use, so that the fast window engine runs
+    without importing astropy.coordinates. '''
+    def __init__(self, name, lat, lon, height):
+        self.lat = lat
+        self.lon = lon
+        self.height = height
+        self.name = name
+        self._location = None
+
+    @property
+    def location(self):
+        ''' EarthLocation of the site '''
+        if self._location is None:
+            from astropy.coordinates import EarthLocation
+            self._location = EarthLocation(lat=self.lat, lon=self.lon, height=self.height)
+        return self._location
+
 
 # TODO: use correct height
-class CTANorth:
+class CTANorth(Site):
     def __init__(self):
-        self.lat = 17.89 * u.deg
-        self.lon = 28.75 * u.deg
-        self.height = 2000 * u.m
-        self.location = EarthLocation(lat=self.lat, lon=self.lon,
-                                      height=self.height)
-        self.name = "CTA North"
+        super().__init__("CTA North", 17.89 * u.deg, 28.75 * u.deg, 2000 * u.m)
 
 # TODO: use correct height
-class CTASouth:
+class CTASouth(Site):
     def __init__(self):
-        self.lat = -24.68 * u.deg
-        self.lon = 70.32 * u.deg
-        self.height = 1835 * u.m
-        self.location = EarthLocation(lat=self.lat, lon=self.lon,
-                                      height=self.height)
-        self.name = "CTA South"
+        super().__init__("CTA South", -24.68 * u.deg, 70.32 * u.deg, 1835 * u.m)
+
+
+# sites by their name in the site configuration
+gSites = {"CTA_North": CTANorth,
+          "CTA_South": CTASouth}
+
+
+def get_site(name):
+    ''' returns a new site object for 'name' (e.g. "CTA_North" or "CTA North") '''
+    key = name.replace(" ", "_").lower()
+    for site_name, site_class in gSites.items():
+        if site_name.lower() == key:
+            return site_class()
+    raise ValueError("Unknown site: %s" % name)
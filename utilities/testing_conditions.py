@@ -1,7 +1,10 @@
 
+from alert_processor import time_model
+
+
 class TestingConditions:
     def __init__(self, test_received_time):
-        self.test_received_time = test_received_time
+        self.test_received_time = time_model.to_datetime64(test_received_time)
 
     def apply_test_conditions_to_scientific_alert(self, sci_alert):
         sci_alert.alert_received_time = self.test_received_time